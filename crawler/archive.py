@@ -0,0 +1,257 @@
+"""
+历史分钟数据归档模块
+把已经收盘的月份按 市场/月份 导出为Arrow IPC文件：{archive_dir}/{market}/{market}_{YYYYMM}.arrow
+    - 价格为float32，成交量为int64，时间为timestamp[s]（交易所当地时间），代码列按字典编码
+    - 文件内按 (代码, 时间) 排序，每个代码一个record batch，代码 -> batch序号 的索引写在schema元数据中
+读取时通过内存映射打开文件，按代码取出对应的batch，再按时间二分切片，全程不复制数据
+用法：
+    python archive.py --table cn_data_realtime --month 2024-01
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from config import FILE_CONFIG, PARTITION_CONFIG
+
+SCHEMA = pa.schema([
+    ('code', pa.dictionary(pa.int32(), pa.string())),
+    ('datetime', pa.timestamp('s')),
+    ('open', pa.float32()),
+    ('high', pa.float32()),
+    ('low', pa.float32()),
+    ('close', pa.float32()),
+    ('volume', pa.int64())
+])
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+def table_market(table):
+    """分钟数据表对应的市场，如 cn_data_realtime -> cn"""
+    return table.split('_', 1)[0]
+
+
+def archive_path(market, month, archive_dir=None):
+    archive_dir = archive_dir or FILE_CONFIG['archive_dir']
+    return os.path.join(archive_dir, market, f"{market}_{month:%Y%m}.arrow")
+
+
+def hot_window_start():
+    """
+    数据库中在线保留数据的起始月份，更早的分区由每天的维护任务导出归档后删除
+    retention_months为0（不归档）时返回None
+    """
+    if not PARTITION_CONFIG['retention_months']:
+        return None
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - PARTITION_CONFIG['retention_months']
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def write_archive(table, path, market, month):
+    """
+    把按 (code, datetime) 排序的pyarrow Table写为Arrow IPC文件，每个代码一个batch
+    返回：写入的行数，没有数据时不写文件并返回0
+    """
+    if table.num_rows == 0:
+        return 0
+    table = table.combine_chunks()
+    codes = table.column('code').chunk(0)
+    # 全表共用一个字典，各batch切片共享同一份字典
+    if not pa.types.is_dictionary(codes.type):
+        codes = pc.dictionary_encode(codes).cast(SCHEMA.field('code').type)
+    columns = [codes] + [table.column(name).chunk(0).cast(SCHEMA.field(name).type) for name in SCHEMA.names[1:]]
+    batch = pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+    # 排序后同一代码的行连续，按字典索引的变化点切分
+    indices = codes.indices.to_numpy(zero_copy_only=False)
+    boundaries = np.flatnonzero(np.diff(indices)) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [len(indices)]])
+
+    index = {}
+    metadata_codes = codes.dictionary.to_pylist()
+    for i, (start, stop) in enumerate(zip(starts, stops)):
+        index[metadata_codes[indices[start]]] = i
+
+    schema = SCHEMA.with_metadata({
+        'market': market,
+        'month': f"{month:%Y-%m}",
+        'index': json.dumps(index)
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for start, stop in zip(starts, stops):
+                writer.write_batch(batch.slice(start, stop - start))
+    # 写完后再替换，读取方不会看到写了一半的文件
+    os.replace(tmp_path, path)
+    return batch.num_rows
+
+
+def export_month(cursor, source, market, month, archive_dir=None):
+    """
+    把source（分钟数据表或其分区）中某个月的数据导出为归档文件
+    参数：
+        cursor: psycopg2游标
+        month: 月份1日
+    返回：(归档文件路径, 行数)
+    """
+    path = archive_path(market, month, archive_dir)
+    start, end = month, _next_month(month)
+    with tempfile.TemporaryFile() as buffer:
+        cursor.copy_expert(
+            cursor.mogrify(
+                f"""COPY (
+                        SELECT code, datetime, open, high, low, close, COALESCE(volume, 0)
+                        FROM {source}
+                        WHERE datetime >= %s AND datetime < %s
+                        ORDER BY code, datetime
+                    ) TO STDOUT WITH (FORMAT csv)""",
+                (start, end)
+            ).decode(),
+            buffer
+        )
+        buffer.seek(0)
+        table = pa_csv.read_csv(
+            buffer,
+            read_options=pa_csv.ReadOptions(column_names=SCHEMA.names),
+            convert_options=pa_csv.ConvertOptions(column_types={
+                'code': pa.string(),
+                'datetime': pa.timestamp('s'),
+                **{name: pa.float32() for name in PRICE_COLUMNS},
+                'volume': pa.int64()
+            })
+        )
+    rows = write_archive(table, path, market, month)
+    if rows:
+        print(f"✅ 已导出 {source} {month:%Y-%m} 共 {rows} 行 -> {path}")
+    else:
+        print(f"{source} {month:%Y-%m} 没有数据，跳过导出")
+    return path, rows
+
+
+class ArchiveReader:
+    """
+    归档文件读取器
+    文件通过内存映射打开，按代码取batch、按时间二分切片，返回的数据直接引用映射的文件内容
+    """
+
+    def __init__(self, archive_dir=None):
+        self.archive_dir = archive_dir or FILE_CONFIG['archive_dir']
+        self._files = {}    # 路径 -> (修改时间, ipc文件reader, 代码索引)
+        self._lock = threading.Lock()
+
+    def _open(self, path):
+        """打开（或复用已打开的）归档文件，文件不存在时返回None"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1], cached[2]
+            reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+            index = json.loads(reader.schema.metadata[b'index'])
+            self._files[path] = (mtime, reader, index)
+            return reader, index
+
+    def months(self, start, end):
+        """start到end（含）覆盖的月份"""
+        month = date(start.year, start.month, 1)
+        last = date(end.year, end.month, 1)
+        while month <= last:
+            yield month
+            month = _next_month(month)
+
+    def archived_until(self, market, start, end):
+        """
+        start到end之间归档部分的结束时间：最后一个存在归档文件的月份的下月1日，没有归档文件时返回None
+        只看实际存在的文件，月初到维护任务运行之前，已超出保留范围的月份仍在数据库中
+        """
+        until = None
+        for month in self.months(start, end):
+            if os.path.exists(archive_path(market, month, self.archive_dir)):
+                until = _next_month(month)
+        return datetime(until.year, until.month, until.day) if until else None
+
+    def read(self, market, code, start, end, inclusive_end=True):
+        """
+        读取某个代码在 [start, end] 区间内的分钟数据
+        参数：
+            start/end: datetime
+            inclusive_end: False时不包含end
+        返回：pyarrow Table（列同SCHEMA，可能为空）
+        """
+        start_value = np.datetime64(start, 's')
+        end_value = np.datetime64(end, 's')
+        batches = []
+        for month in self.months(start, end):
+            opened = self._open(archive_path(market, month, self.archive_dir))
+            if opened is None:
+                continue
+            reader, index = opened
+            batch_index = index.get(code)
+            if batch_index is None:
+                continue
+            batch = reader.get_batch(batch_index)
+            times = batch.column('datetime').to_numpy()
+            lo = np.searchsorted(times, start_value, side='left')
+            hi = np.searchsorted(times, end_value, side='right' if inclusive_end else 'left')
+            if hi > lo:
+                batches.append(batch.slice(lo, hi - lo))
+        if not batches:
+            return SCHEMA.empty_table()
+        return pa.Table.from_batches(batches)
+
+    def read_columns(self, market, code, start, end, inclusive_end=True, bucket_seconds=None):
+        """
+        读取并转换为numpy列，可选按桶聚合（开盘取第一根、最高取最大、最低取最小、收盘取最后一根、成交量求和）
+        返回：dict，datetime为datetime64[s]数组，价格为float32数组，成交量为int64数组
+        """
+        table = self.read(market, code, start, end, inclusive_end)
+        columns = {name: table.column(name).to_numpy() for name in SCHEMA.names[1:]}
+        if not bucket_seconds or not len(columns['datetime']):
+            return columns
+
+        seconds = columns['datetime'].astype('int64')
+        buckets = seconds // bucket_seconds * bucket_seconds
+        starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+        ends = np.concatenate([starts[1:], [len(buckets)]]) - 1
+        return {
+            'datetime': buckets[starts].astype('datetime64[s]'),
+            'open': columns['open'][starts],
+            'high': np.maximum.reduceat(columns['high'], starts),
+            'low': np.minimum.reduceat(columns['low'], starts),
+            'close': columns['close'][ends],
+            'volume': np.add.reduceat(columns['volume'], starts)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出历史分钟数据归档文件')
+    parser.add_argument('--table', required=True, help='分钟数据表，如 cn_data_realtime')
+    parser.add_argument('--month', required=True, nargs='+', help='月份，如 2024-01')
+    args = parser.parse_args()
+
+    from partition_manager import create_db_engine, run_with_cursor
+    engine = create_db_engine()
+    for value in args.month:
+        month = datetime.strptime(value, '%Y-%m').date()
+        run_with_cursor(engine, export_month, args.table, table_market(args.table), month)
+
+
+if __name__ == "__main__":
+    main()
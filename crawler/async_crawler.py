@@ -0,0 +1,147 @@
+"""
+异步抓取流水线
+akshare的请求是阻塞调用，放在有界线程池中执行；抓取、整理、写库三个阶段通过有界队列串联：
+    抓取（fetch_workers个协程）--fetched队列--> 整理（1个协程）--ready队列--> 写库（write_workers个协程）
+代码N的整理和写库与代码N+1的网络请求同时进行；下游处理不过来时队列写满，抓取协程在put处等待（背压），
+不会把整个市场的原始数据堆在内存中。整体速度由数据源限速（fetch_control）决定
+用法：
+    summary = run_pipeline(codes, fetch, prepare, write, name='A股分钟数据')
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import CRAWL_CONFIG
+from crawl_runner import CrawlSummary
+
+# 通知下游协程退出的哨兵
+_DONE = object()
+
+
+def _is_empty(data):
+    return data is None or getattr(data, 'empty', False)
+
+
+async def _run_pipeline(codes, fetch, prepare, write, summary, fetch_workers, write_workers, queue_size, task_timeout):
+    loop = asyncio.get_running_loop()
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch')
+    prepare_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prepare')
+    write_pool = ThreadPoolExecutor(max_workers=write_workers, thread_name_prefix='write')
+
+    todo = asyncio.Queue()
+    for code in codes:
+        todo.put_nowait(code)
+    fetched = asyncio.Queue(maxsize=queue_size)
+    ready = asyncio.Queue(maxsize=queue_size)
+    # 各阶段在线程池中的累计耗时（秒），用于判断瓶颈
+    busy = {'fetch': 0.0, 'prepare': 0.0, 'write': 0.0}
+
+    async def run_stage(stage, pool, func, *args):
+        start = time.monotonic()
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        finally:
+            busy[stage] += time.monotonic() - start
+
+    async def fetcher():
+        while True:
+            try:
+                code = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                data = await asyncio.wait_for(run_stage('fetch', fetch_pool, fetch, code), task_timeout)
+            except asyncio.TimeoutError:
+                # 线程无法被强制中止，会在后台继续运行到结束，其结果被丢弃
+                summary.timed_out.append(code)
+                print(f"⚠️ {code} 超过 {task_timeout} 秒未完成，标记为超时")
+                continue
+            except Exception as e:
+                summary.failed[code] = str(e)[:200]
+                continue
+            if _is_empty(data):
+                summary.failed[code] = '未获取到数据'
+                continue
+            await fetched.put((code, data))
+
+    async def preparer():
+        while True:
+            item = await fetched.get()
+            if item is _DONE:
+                return
+            code, data = item
+            try:
+                prepared = await run_stage('prepare', prepare_pool, prepare, code, data)
+            except Exception as e:
+                summary.failed[code] = f"整理数据失败: {str(e)[:200]}"
+                continue
+            if _is_empty(prepared):
+                summary.failed[code] = '整理后没有有效数据'
+                continue
+            await ready.put((code, prepared))
+
+    async def writer():
+        while True:
+            item = await ready.get()
+            if item is _DONE:
+                return
+            code, prepared = item
+            try:
+                if await run_stage('write', write_pool, write, code, prepared):
+                    summary.succeeded.append(code)
+                else:
+                    summary.failed[code] = '保存失败'
+            except Exception as e:
+                summary.failed[code] = f"保存失败: {str(e)[:200]}"
+
+    try:
+        prepare_task = asyncio.create_task(preparer())
+        write_tasks = [asyncio.create_task(writer()) for _ in range(write_workers)]
+        await asyncio.gather(*[fetcher() for _ in range(fetch_workers)])
+        await fetched.put(_DONE)
+        await prepare_task
+        for _ in write_tasks:
+            await ready.put(_DONE)
+        await asyncio.gather(*write_tasks)
+    finally:
+        for pool in [fetch_pool, prepare_pool, write_pool]:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return busy
+
+
+def run_pipeline(codes, fetch, prepare, write, name='抓取任务', fetch_workers=None, write_workers=None,
+                 queue_size=None, task_timeout=None):
+    """
+    按 抓取 -> 整理 -> 写库 流水线处理一批代码
+    参数：
+        fetch: fetch(code)，请求数据源，返回原始数据，None或空DataFrame表示没有数据
+        prepare: prepare(code, data)，整理原始数据，返回待写入的数据，None表示没有有效数据
+        write: write(code, prepared)，写入数据库，返回True表示成功
+        fetch_workers: 同时进行的请求数，默认取CRAWL_CONFIG['max_workers']
+        write_workers: 同时写库的连接数，默认取CRAWL_CONFIG['write_workers']
+        queue_size: 阶段之间队列的容量，默认取CRAWL_CONFIG['pipeline_queue_size']
+        task_timeout: 单个代码请求的超时时间（秒），默认取CRAWL_CONFIG['task_timeout']
+    返回：CrawlSummary
+    说明：
+        在已有事件循环的线程中不能调用（asyncio.run的限制），定时任务在线程池线程中调用没有问题
+    """
+    fetch_workers = fetch_workers or CRAWL_CONFIG['max_workers']
+    write_workers = write_workers or CRAWL_CONFIG['write_workers']
+    queue_size = queue_size or CRAWL_CONFIG['pipeline_queue_size']
+    task_timeout = task_timeout or CRAWL_CONFIG['task_timeout']
+    summary = CrawlSummary(name)
+
+    print(f"开始{name}: {len(codes)} 个代码，{fetch_workers} 个请求并发，{write_workers} 个写库连接，队列容量 {queue_size}")
+    try:
+        busy = asyncio.run(_run_pipeline(
+            list(codes), fetch, prepare, write, summary,
+            fetch_workers, write_workers, queue_size, task_timeout
+        ))
+        print(f"各阶段累计耗时: 抓取 {busy['fetch']:.1f} 秒，整理 {busy['prepare']:.1f} 秒，写库 {busy['write']:.1f} 秒")
+    except KeyboardInterrupt:
+        print("收到中断信号，停止流水线")
+        raise
+    finally:
+        summary.elapsed = time.monotonic() - summary.start_time
+
+    summary.print_summary()
+    return summary
@@ -0,0 +1,414 @@
+"""
+日K线历史回补
+大区间回补时数据整理（列名映射、时间解析、时区转换、数值转换）是CPU密集的pandas操作，
+在线程中执行会争用GIL，因此按代码分发到进程池中并行：
+    抓取线程（I/O）-> 原始DataFrame转为Arrow IPC写入共享内存 -> 进程池中normalize_ohlcv
+    -> 结果同样以Arrow IPC写入共享内存返回 -> 主进程中唯一的写库线程攒批后COPY写入
+进程之间只传递共享内存的名称和长度，不pickle DataFrame；同时在途的代码数有上限，写库跟不上时抓取自动等待
+指定--job时通过进度表（见job_ledger.py）分批领取代码，中断后用同一个job_id重新运行即可只处理未完成的代码，
+多台主机用同一个job_id同时运行时各自领取不同的代码
+用法：
+    python backfill.py --market cn --start 2015-01-01 --end 2024-12-31 --processes 32
+    python backfill.py --job cn-2015 --market cn --start 2015-01-01 --end 2024-12-31   # 登记并执行（或续跑）
+    python backfill.py --job cn-2015                                                   # 其他主机加入或续跑
+    python backfill.py --job cn-2015 --status
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import shared_memory
+import pandas as pd
+import pyarrow as pa
+from config import BACKFILL_CONFIG
+from normalize import normalize_ohlcv
+
+# 各市场日K线的目标表和整理参数，与各市场save_to_db中的参数一致
+MARKETS = {
+    'cn': {'table': 'cn_data_day', 'source': 'akshare_cn_day', 'tz': None, 'fill_na': True},
+    'hk': {'table': 'hk_data_day', 'source': 'yfinance_hk_day', 'tz': 'Asia/Shanghai', 'fill_na': True},
+    'us': {'table': 'us_data_day', 'source': 'yfinance_us_day', 'tz': 'America/New_York', 'fill_na': False}
+}
+
+
+def frame_to_arrow(df):
+    """
+    原始DataFrame转为pyarrow Table，DatetimeIndex（yfinance）作为列保留
+    混合类型的object列无法直接转换时转为字符串，由normalize_ohlcv按脏数据处理
+    """
+    preserve_index = isinstance(df.index, pd.DatetimeIndex)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=preserve_index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        objects = {col: 'str' for col in df.columns if df[col].dtype == object}
+        return pa.Table.from_pandas(df.astype(objects), preserve_index=preserve_index)
+
+
+def write_shared(table):
+    """把pyarrow Table以IPC stream格式写入新建的共享内存，返回 (共享内存名称, 字节数)"""
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    def write():
+        sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        sink.close()
+
+    try:
+        # 在内部函数中写入，返回时释放对共享内存的全部引用，之后才能close
+        write()
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return shm.name, size
+
+
+def read_shared(name, size, unlink=True):
+    """
+    从共享内存读取Arrow IPC stream并转为DataFrame
+    先把共享内存中的数据整体复制一次（一次memcpy），Arrow基于这份副本零拷贝读取，
+    pandas的Arrow字符串列也不会引用共享内存，共享内存可以立即释放
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buffer = pa.py_buffer(bytes(shm.buf[:size]))
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def normalize_shared(name, size, code, market):
+    """
+    进程池中执行：读取共享内存中的原始数据，整理后写入新的共享内存
+    返回：(共享内存名称, 字节数, 行数)，没有有效数据时返回 (None, 0, 0)
+    输入的共享内存由主进程释放，输出的共享内存由主进程读取后释放
+    """
+    options = MARKETS[market]
+    df = read_shared(name, size, unlink=False)
+    df_save = normalize_ohlcv(df, code, options['source'], date_only=True, tz=options['tz'],
+                              fill_na=options['fill_na'])
+    if df_save is None or df_save.empty:
+        return None, 0, 0
+    out_name, out_size = write_shared(pa.Table.from_pandas(df_save, preserve_index=False))
+    return out_name, out_size, len(df_save)
+
+
+def iter_fetch(market, codes, start, end, fetch_workers):
+    """
+    按市场抓取原始日K线，生成器逐个产出 (传入的代码, 保存用的代码, 原始DataFrame)
+    A股逐个代码请求，多个线程并发；港股和美股按批次请求（yfinance批量下载）
+    """
+    if market == 'cn':
+        from stock_cn_trade_day import get_cn_daily_data, clean_cn_code
+        with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch') as executor:
+            futures = {executor.submit(get_cn_daily_data, code, start, end): code for code in codes}
+            for future in as_completed(futures):
+                data = future.result()
+                if data is not None and not data.empty:
+                    code = futures[future]
+                    yield code, clean_cn_code(code), data
+    elif market == 'hk':
+        from stock_hk_trade_day import get_hk_daily_data_batch
+        for code, data in get_hk_daily_data_batch(codes, start, end):
+            yield code, code, data
+    else:
+        from stock_us_trade_day import get_us_daily_data_batch
+        for code, data in get_us_daily_data_batch(codes, start, end):
+            yield code, code, data
+
+
+class BackfillWriter(threading.Thread):
+    """
+    唯一的写库线程：从队列中取出整理好的数据，攒够batch_rows行后合并为一次COPY写入
+    队列中的元素为 (代码, 共享内存名称, 字节数)，None表示结束；每取走一个元素释放一个在途名额
+    元素为threading.Event时立即写入已攒的数据后set，用于等待一批代码全部落库
+    """
+
+    def __init__(self, engine, table, batch_rows, inflight):
+        super().__init__(name='backfill-writer', daemon=True)
+        self.engine = engine
+        self.table = table
+        self.batch_rows = batch_rows
+        self.inflight = inflight
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.written = {}    # 代码 -> 写入行数
+        self.failed = {}     # 代码 -> 失败原因
+        self.error = None
+
+    def flush(self, frames, codes):
+        from bulk_writer import bulk_upsert
+        if not frames:
+            return
+        try:
+            self.rows_written += bulk_upsert(self.engine, pd.concat(frames, ignore_index=True), self.table)
+        except Exception as e:
+            # 写库失败后不再继续写入，本批和之后的代码都记为失败
+            self.error = e
+            print(f"❌ 写入 {self.table} 失败: {str(e)[:200]}")
+            for code in codes:
+                self.failed[code] = f"写库失败: {str(e)[:200]}"
+            return
+        for code, df in zip(codes, frames):
+            self.written[code] = len(df)
+        print(f"已写入 {len(self.written)} 个代码，累计 {self.rows_written} 行")
+
+    def run(self):
+        frames, codes, pending_rows = [], [], 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self.flush(frames, codes)
+                frames, codes, pending_rows = [], [], 0
+                item.set()
+                continue
+            code, name, size = item
+            try:
+                df = read_shared(name, size)
+            except Exception as e:
+                self.failed[code] = f"读取整理结果失败: {e}"
+                continue
+            finally:
+                self.inflight.release()
+            if self.error is not None:
+                self.failed[code] = '写库失败，未写入'
+                continue
+            frames.append(df)
+            codes.append(code)
+            pending_rows += len(df)
+            if pending_rows >= self.batch_rows:
+                self.flush(frames, codes)
+                frames, codes, pending_rows = [], [], 0
+        self.flush(frames, codes)
+
+
+class BackfillSession:
+    """
+    回补会话：spawn进程池、写库线程和在途名额只创建一次，多批代码依次通过run()回补
+    run_job领取的每一批代码（以及批内不同的区间）复用同一个会话，不再为每批重新启动进程池
+    用法：
+        with BackfillSession(engine, 'cn') as session:
+            written, failed = session.run(codes, start, end)
+    """
+
+    def __init__(self, engine, market, processes=None, fetch_workers=None, batch_rows=None):
+        """
+        参数：
+            processes: 整理数据的进程数，默认取BACKFILL_CONFIG，为空时等于CPU核数
+            fetch_workers: A股同时请求的代码数
+            batch_rows: 每次COPY写入的行数
+        """
+        self.engine = engine
+        self.market = market
+        self.processes = processes or BACKFILL_CONFIG['processes'] or os.cpu_count()
+        self.fetch_workers = fetch_workers or BACKFILL_CONFIG['fetch_workers']
+        self.batch_rows = batch_rows or BACKFILL_CONFIG['write_batch_rows']
+        self.table = MARKETS[market]['table']
+        # 同时在途（已写入共享内存、尚未被写库线程取走）的代码数上限
+        self.inflight = threading.BoundedSemaphore(self.processes * BACKFILL_CONFIG['inflight_per_process'])
+        self.writer = None
+        self.pool = None
+        # 已提交、尚未交给写库线程的代码数
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def __enter__(self):
+        self.writer = BackfillWriter(self.engine, self.table, self.batch_rows, self.inflight)
+        self.writer.start()
+        # 用spawn启动子进程，避免在已有抓取线程和数据库连接的进程中fork
+        context = multiprocessing.get_context('spawn')
+        self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        print(f"回补进程池已启动: {self.processes} 个整理进程")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+        finally:
+            self.writer.queue.put(None)
+            self.writer.join()
+
+    def _on_done(self, code, name, future, failed):
+        # 输入的共享内存在整理完成后释放
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            out_name, out_size, _ = future.result()
+        except BaseException as e:
+            out_name, failed[code] = None, f"整理数据失败: {str(e)[:200] or type(e).__name__}"
+        else:
+            if out_name is None:
+                failed[code] = '整理后没有有效数据'
+        if out_name is None:
+            self.inflight.release()
+        else:
+            self.writer.queue.put((code, out_name, out_size))
+        with self._idle:
+            self._pending -= 1
+            self._idle.notify_all()
+
+    def _drain(self):
+        """等待已提交的代码全部整理完成并写入数据库"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._pending == 0)
+        flushed = threading.Event()
+        self.writer.queue.put(flushed)
+        flushed.wait()
+
+    def run(self, codes, start, end):
+        """
+        回补一批代码在 [start, end] 区间内的日K线，返回前等待这批代码全部落库
+        返回：(写入成功的 {代码: 行数}, 失败的 {代码: 原因})，代码为传入的代码
+        """
+        writer = self.writer
+        failed = {}
+        start_time = time.monotonic()
+        rows_before = writer.rows_written
+        print(f"开始回补 {self.table}: {len(codes)} 个代码，{start} ~ {end}")
+
+        try:
+            for code, save_code, data in iter_fetch(self.market, codes, start, end, self.fetch_workers):
+                if writer.error is not None:
+                    break
+                self.inflight.acquire()
+                try:
+                    name, size = write_shared(frame_to_arrow(data))
+                except Exception as e:
+                    self.inflight.release()
+                    failed[code] = f"转换为Arrow失败: {str(e)[:200]}"
+                    continue
+                with self._idle:
+                    self._pending += 1
+                try:
+                    future = self.pool.submit(normalize_shared, name, size, save_code, self.market)
+                except BaseException:
+                    with self._idle:
+                        self._pending -= 1
+                    self.inflight.release()
+                    raise
+                future.add_done_callback(lambda f, code=code, name=name: self._on_done(code, name, f, failed))
+        finally:
+            self._drain()
+
+        written = {code: writer.written[code] for code in codes if code in writer.written}
+        for code in codes:
+            if code in writer.failed:
+                failed[code] = writer.failed[code]
+            elif code not in written and code not in failed:
+                failed[code] = '写库失败，未处理' if writer.error is not None else '未获取到数据'
+
+        rows = writer.rows_written - rows_before
+        elapsed = time.monotonic() - start_time
+        print(f"✅ 回补完成: 成功 {len(written)} 个代码，失败 {len(failed)} 个，写入 {rows} 行，"
+              f"耗时 {elapsed:.1f} 秒，{rows / max(elapsed, 1e-9):,.0f} 行/秒")
+        for code, reason in list(failed.items())[:20]:
+            print(f"  {code}: {reason}")
+        return written, failed
+
+
+def run_backfill(engine, market, codes, start, end, processes=None, fetch_workers=None, batch_rows=None):
+    """
+    回补一批代码在 [start, end] 区间内的日K线（单独的会话，参数见BackfillSession）
+    返回：(写入成功的 {代码: 行数}, 失败的 {代码: 原因})，代码为传入的代码
+    """
+    with BackfillSession(engine, market, processes, fetch_workers, batch_rows) as session:
+        return session.run(codes, start, end)
+
+
+def run_job(engine, job_id, processes=None, fetch_workers=None):
+    """
+    按进度表执行回补任务：循环领取一批代码、回补、记录结果，直到没有可领取的代码
+    进程被中断时，已领取但未完成的代码标记为失败，下次运行时重新领取
+    """
+    from job_ledger import (complete_units, fail_units, get_job, job_status, lease_units,
+                            print_status, worker_id)
+    from partition_manager import run_with_cursor
+
+    job = run_with_cursor(engine, get_job, job_id)
+    if job is None:
+        print(f"❌ 任务 {job_id} 不存在，请先指定 --market 和 --start 登记任务")
+        return
+    market = job[0]
+    owner = worker_id()
+    print(f"执行回补任务 {job_id}（{market}），本机标识 {owner}")
+
+    # 进程池和写库线程在整个任务中只启动一次，领取到的各批代码依次交给同一个会话
+    with BackfillSession(engine, market, processes, fetch_workers) as session:
+        while True:
+            units = run_with_cursor(engine, lease_units, job_id, owner)
+            if not units:
+                break
+            # 同一批中区间相同的代码一起回补
+            ranges = {}
+            for code, start, end in units:
+                ranges.setdefault((start, end), []).append(code)
+            for (start, end), codes in ranges.items():
+                written, failed = {}, {}
+                try:
+                    written, failed = session.run(codes, start, end)
+                except BaseException as e:
+                    failed = {code: f"回补中断: {str(e)[:200] or type(e).__name__}" for code in codes}
+                    raise
+                finally:
+                    run_with_cursor(engine, complete_units, job_id, owner, written)
+                    run_with_cursor(engine, fail_units, job_id, owner, failed)
+
+    print_status(run_with_cursor(engine, job_status, job_id), job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日K线历史回补')
+    parser.add_argument('--market', choices=list(MARKETS), help='市场')
+    parser.add_argument('--start', help='起始日期，如 2015-01-01')
+    parser.add_argument('--end', help='结束日期（包含），默认今天')
+    parser.add_argument('--codes', nargs='*', help='股票代码，默认抓取该市场的全部代码')
+    parser.add_argument('--processes', type=int, help='整理数据的进程数，默认等于CPU核数')
+    parser.add_argument('--fetch-workers', type=int, help='A股同时请求的代码数')
+    parser.add_argument('--job', help='回补任务ID，指定时通过进度表领取代码，可续跑和多机并行')
+    parser.add_argument('--status', action='store_true', help='只打印--job指定任务的进度')
+    args = parser.parse_args()
+
+    from crawl_runner import load_universe
+    from partition_manager import create_db_engine, run_with_cursor
+    engine = create_db_engine()
+
+    if args.job and args.status:
+        from job_ledger import job_status, print_status
+        print_status(run_with_cursor(engine, job_status, args.job), args.job)
+        return
+    if not args.job and not (args.market and args.start):
+        parser.error('需要指定 --market 和 --start，或者指定 --job 续跑已登记的任务')
+
+    if args.market and args.start:
+        start = datetime.strptime(args.start, '%Y-%m-%d').date()
+        end = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else datetime.now().date()
+        codes = args.codes or load_universe(args.market, engine)
+        if not args.job:
+            run_backfill(engine, args.market, codes, start, end, args.processes, args.fetch_workers)
+            return
+        from job_ledger import create_job
+        added = run_with_cursor(engine, create_job, args.job, args.market, codes, start, end)
+        print(f"任务 {args.job} 新登记 {added} 个代码")
+    run_job(engine, args.job, args.processes, args.fetch_workers)
+
+
+if __name__ == "__main__":
+    main()
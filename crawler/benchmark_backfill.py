@@ -0,0 +1,64 @@
+"""
+回补整理阶段基准测试：同一批akshare格式的合成数据，分别用线程池和进程池（Arrow + 共享内存传递）执行normalize_ohlcv，
+输出不同并发数下的吞吐（行/秒），观察进程池是否随核数线性扩展
+用法：
+    python benchmark_backfill.py --codes 256 --rows 20000 --workers 1 2 4 8 16 32
+不需要连接数据库
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from backfill import frame_to_arrow, normalize_shared, read_shared, write_shared
+from benchmark_normalize import make_akshare_frame
+from normalize import normalize_ohlcv
+
+
+def run_threads(frames, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda item: normalize_ohlcv(item[1], item[0], 'akshare_cn_day', date_only=True), frames)
+        return sum(len(df) for df in results)
+
+
+def run_processes(frames, workers):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # 先启动全部子进程，不把进程启动时间计入结果
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        inputs = [(code, *write_shared(frame_to_arrow(df))) for code, df in frames]
+        futures = [pool.submit(normalize_shared, name, size, code, 'cn') for code, name, size in inputs]
+        rows = 0
+        for (code, name, _), future in zip(inputs, futures):
+            out_name, out_size, _ = future.result()
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+            if out_name is not None:
+                rows += len(read_shared(out_name, out_size))
+        return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回补整理阶段基准测试')
+    parser.add_argument('--codes', type=int, default=256, help='代码数量')
+    parser.add_argument('--rows', type=int, default=20000, help='每个代码的行数')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='并发数')
+    args = parser.parse_args()
+
+    frames = [(str(600000 + i), make_akshare_frame(args.rows)) for i in range(args.codes)]
+    total = args.codes * args.rows
+    print(f"{args.codes} 个代码 × {args.rows} 行 = {total:,} 行，CPU核数 {os.cpu_count()}")
+    print(f"{'并发数':<8}{'线程池 行/秒':>16}{'进程池 行/秒':>16}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        run_threads(frames, workers)
+        thread_rate = total / (time.perf_counter() - start)
+        _, elapsed = run_processes(frames, workers)
+        print(f"{workers:<8}{thread_rate:>16,.0f}{total / elapsed:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
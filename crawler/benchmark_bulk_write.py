@@ -0,0 +1,103 @@
+"""
+批量写入基准测试：对比逐行 execute 与 COPY + ON CONFLICT 合并的写入速度（行/秒）
+用法：
+    python benchmark_bulk_write.py --rows 20000
+会在数据库中创建临时的 benchmark_bulk_write 表，测试结束后删除
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from config import DB_CONFIG
+from bulk_writer import bulk_upsert
+
+# 创建数据库连接引擎
+db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+engine = create_engine(db_url)
+
+BENCH_TABLE = 'benchmark_bulk_write'
+
+
+def make_frame(rows, codes=50):
+    """生成rows行的合成分钟数据，codes只股票均分"""
+    per_code = max(rows // codes, 1)
+    times = pd.date_range('2024-01-02 09:30', periods=per_code, freq='min')
+    close = np.random.uniform(10, 200, per_code * codes).round(4)
+    return pd.DataFrame({
+        'code': np.repeat([f"{600000 + i}" for i in range(codes)], per_code),
+        'datetime': np.tile(times.values, codes),
+        'open': close,
+        'high': (close * 1.01).round(4),
+        'low': (close * 0.99).round(4),
+        'close': close,
+        'volume': np.random.randint(100, 100000, per_code * codes)
+    })
+
+
+def legacy_write(df):
+    """原有写入方式：to_dict后逐行执行INSERT ... ON CONFLICT"""
+    insert_sql = text(
+        f"""INSERT INTO {BENCH_TABLE} (code, datetime, open, high, low, close, volume, update_time)
+           VALUES (:code, :datetime, :open, :high, :low, :close, :volume, NOW())
+           ON CONFLICT (code, datetime) DO UPDATE
+           SET open = EXCLUDED.open,
+               high = EXCLUDED.high,
+               low = EXCLUDED.low,
+               close = EXCLUDED.close,
+               volume = EXCLUDED.volume,
+               update_time = NOW()
+        """)
+    with engine.connect() as conn:
+        for row in df.to_dict(orient='records'):
+            conn.execute(insert_sql, row)
+        conn.commit()
+
+
+def copy_write(df):
+    """新写入方式：COPY到临时表后一次性合并"""
+    bulk_upsert(engine, df, BENCH_TABLE, notify=False)
+
+
+def reset_table():
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (LIKE cn_data_realtime INCLUDING ALL)"))
+        conn.commit()
+
+
+def run_case(name, write_fn, df):
+    """分别测量首次插入和重复写入（全部冲突更新）两种场景"""
+    reset_table()
+    results = []
+    for phase in ['insert', 'upsert']:
+        start = time.perf_counter()
+        write_fn(df)
+        elapsed = time.perf_counter() - start
+        results.append((phase, elapsed))
+        print(f"{name:<8} {phase:<7} {len(df):>10} 行  {elapsed:>8.2f} 秒  {len(df) / elapsed:>12,.0f} 行/秒")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量写入基准测试')
+    parser.add_argument('--rows', type=int, default=20000, help='测试行数')
+    parser.add_argument('--skip-legacy', action='store_true', help='跳过逐行写入测试（行数很大时耗时过长）')
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    print(f"合成数据 {len(df)} 行，目标表 {BENCH_TABLE}")
+    try:
+        copy_results = run_case('copy', copy_write, df)
+        if not args.skip_legacy:
+            legacy_results = run_case('legacy', legacy_write, df)
+            for (phase, copy_time), (_, legacy_time) in zip(copy_results, legacy_results):
+                print(f"{phase}: COPY 路径提速 {legacy_time / copy_time:.1f}x")
+    finally:
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
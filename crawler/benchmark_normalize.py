@@ -0,0 +1,124 @@
+"""
+标准化基准测试：对比原save_to_db中的逐列转换+逐行填充空值与normalize_ohlcv的向量化处理
+用法：
+    python benchmark_normalize.py --rows 1000000
+不需要连接数据库
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from normalize import normalize_ohlcv
+
+
+def make_akshare_frame(rows):
+    """生成akshare分钟数据格式的合成数据：day列为字符串时间，价格为字符串"""
+    times = pd.date_range('2020-01-02 09:30', periods=rows, freq='min')
+    close = np.random.uniform(10, 200, rows).round(2)
+    return pd.DataFrame({
+        'day': times.strftime('%Y-%m-%d %H:%M:%S'),
+        'open': close.astype(str),
+        'high': (close * 1.01).round(2).astype(str),
+        'low': (close * 0.99).round(2).astype(str),
+        'close': close.astype(str),
+        'volume': np.random.randint(100, 100000, rows).astype(str)
+    })
+
+
+def make_yfinance_frame(rows):
+    """生成yfinance格式的合成数据：带时区的DatetimeIndex，首字母大写的列名"""
+    index = pd.date_range('2020-01-02 09:30', periods=rows, freq='min', tz='America/New_York', name='Datetime')
+    close = np.random.uniform(10, 200, rows)
+    close[::1000] = np.nan
+    return pd.DataFrame({
+        'Open': close,
+        'High': close * 1.01,
+        'Low': close * 0.99,
+        'Close': close,
+        'Volume': np.random.randint(100, 100000, rows).astype(float)
+    }, index=index)
+
+
+def legacy_normalize(df, code):
+    """原stock_cn_trade_minute.save_to_db中的处理流程（不含数据库写入）"""
+    if isinstance(df.index, pd.DatetimeIndex):
+        df = df.reset_index()
+    rename_dict = {}
+    for col in ['day', 'datetime', 'date', 'time', 'Datetime', '时间', '日期时间']:
+        if col in df.columns:
+            rename_dict[col] = 'datetime'
+            break
+    for yf_col, target_col in {'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Volume': 'volume'}.items():
+        if yf_col in df.columns:
+            rename_dict[yf_col] = target_col
+    df = df.rename(columns=rename_dict)
+    df["code"] = code
+
+    if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        parsed = False
+        for fmt in ['%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y%m%d%H%M%S']:
+            try:
+                df['datetime'] = pd.to_datetime(df['datetime'], format=fmt)
+                parsed = True
+                break
+            except ValueError:
+                continue
+        if not parsed:
+            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        if col == 'volume':
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df = df.dropna(subset=['datetime'])
+    df_save = df[["code", "datetime", "open", "high", "low", "close", "volume"]].copy()
+
+    # 原写入前逐行替换空值
+    rows = []
+    for row in df_save.to_dict(orient='records'):
+        row_with_defaults = {}
+        for key, value in row.items():
+            if value is None or (isinstance(value, float) and pd.isna(value)):
+                if key == 'volume':
+                    row_with_defaults[key] = 0
+                elif key in ['open', 'high', 'low', 'close']:
+                    row_with_defaults[key] = 0.0
+                else:
+                    row_with_defaults[key] = ''
+            else:
+                row_with_defaults[key] = value
+        rows.append(row_with_defaults)
+    return rows
+
+
+def timeit(fn, repeat):
+    """多次运行取最短耗时"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OHLCV标准化基准测试')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='合成数据行数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例重复次数（取最短耗时）')
+    args = parser.parse_args()
+
+    cases = [
+        ('akshare分钟(字符串)', make_akshare_frame(args.rows), 'akshare_cn_minute', {'tz': 'Asia/Shanghai'}),
+        ('yfinance分钟(带时区)', make_yfinance_frame(args.rows), 'yfinance_us_minute', {'tz': 'America/New_York'}),
+    ]
+    print(f"合成数据 {args.rows:,} 行，每个用例运行 {args.repeat} 次取最短耗时")
+    for name, frame, source, kwargs in cases:
+        legacy_time = timeit(lambda: legacy_normalize(frame, '600519'), args.repeat)
+        new_time = timeit(lambda: normalize_ohlcv(frame, '600519', source, **kwargs), args.repeat)
+        print(f"{name:<20} 原流程 {legacy_time:>7.2f} 秒  normalize_ohlcv {new_time:>7.3f} 秒  提速 {legacy_time / new_time:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+分区表基准测试：对比原普通表（主键 + code、datetime两个单列索引）与按月分区表（只有主键）的
+写入吞吐（行/秒）和按代码+时间范围查询的延迟
+用法：
+    python benchmark_partitions.py --rows 100000000 --codes 5000
+数据按交易日逐天写入（每天 codes × 240 根分钟K线），会创建 benchmark_heap、benchmark_part 两个表，测试结束后删除
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+from config import DB_CONFIG
+from partition_manager import add_months, create_partition, run_with_cursor
+
+db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+engine = create_engine(db_url)
+
+HEAP_TABLE = 'benchmark_heap'
+PART_TABLE = 'benchmark_part'
+START_DAY = date(2020, 1, 2)
+BARS_PER_DAY = 240
+
+COLUMNS_DDL = """
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+"""
+
+
+def trading_days(count):
+    """从START_DAY开始的count个工作日"""
+    days = []
+    day = START_DAY
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def create_tables(cursor, days):
+    for table in [HEAP_TABLE, PART_TABLE]:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    # 原表结构：主键加两个单列索引
+    cursor.execute(f"CREATE TABLE {HEAP_TABLE} ({COLUMNS_DDL})")
+    cursor.execute(f"CREATE INDEX {HEAP_TABLE}_code ON {HEAP_TABLE} (code)")
+    cursor.execute(f"CREATE INDEX {HEAP_TABLE}_datetime ON {HEAP_TABLE} (datetime)")
+    # 分区表：只有主键，按月分区
+    cursor.execute(f"CREATE TABLE {PART_TABLE} ({COLUMNS_DDL}) PARTITION BY RANGE (datetime)")
+    cursor.execute(f"CREATE TABLE {PART_TABLE}_default PARTITION OF {PART_TABLE} DEFAULT")
+    month = days[0].replace(day=1)
+    while month <= days[-1]:
+        create_partition(cursor, PART_TABLE, month)
+        month = add_months(month, 1)
+
+
+def insert_day(cursor, table, day, codes):
+    """服务端生成一个交易日的全部分钟K线并写入（INSERT ... ON CONFLICT，与爬虫的合并语句一致）"""
+    cursor.execute(f"""
+        INSERT INTO {table} (code, datetime, open, high, low, close, volume, update_time)
+        SELECT (600000 + c)::text,
+               %(day)s::timestamp + INTERVAL '9 hours 30 minutes' + m * INTERVAL '1 minute',
+               p, p * 1.01, p * 0.99, p, (random() * 100000)::bigint, NOW()
+        FROM generate_series(0, %(codes)s - 1) AS c,
+             generate_series(0, {BARS_PER_DAY - 1}) AS m,
+             LATERAL (SELECT (10 + random() * 100)::numeric(10,4) AS p) AS price
+        ON CONFLICT (code, datetime) DO UPDATE
+        SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+            close = EXCLUDED.close, volume = EXCLUDED.volume, update_time = NOW()
+    """, {'day': day, 'codes': codes})
+
+
+def load_table(table, days, codes):
+    """逐天写入，每天一个事务，返回总耗时"""
+    elapsed = 0.0
+    for i, day in enumerate(days):
+        start = time.perf_counter()
+        run_with_cursor(engine, insert_day, table, day, codes)
+        elapsed += time.perf_counter() - start
+        if (i + 1) % 10 == 0 or i + 1 == len(days):
+            rows = (i + 1) * codes * BARS_PER_DAY
+            print(f"  {table}: 已写入 {rows:,} 行，{rows / elapsed:,.0f} 行/秒")
+    return elapsed
+
+
+def table_size(cursor, table):
+    """表和索引的总大小（MB），分区表统计全部分区"""
+    cursor.execute(
+        """SELECT GREATEST(
+               pg_total_relation_size(%(table)s::regclass),
+               (SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree(%(table)s))
+           )""",
+        {'table': table}
+    )
+    return cursor.fetchone()[0] / 1024 / 1024
+
+
+def measure_queries(table, days, codes, count):
+    """随机代码的三类查询：1天区间、1个月区间、最新200根，返回各自的中位数和p95延迟（毫秒）"""
+    queries = {
+        '1天区间': f"""SELECT datetime, open, high, low, close, volume FROM {table}
+                     WHERE code = %(code)s AND datetime BETWEEN %(start)s AND %(end)s ORDER BY datetime""",
+        '1个月区间': f"""SELECT datetime, open, high, low, close, volume FROM {table}
+                      WHERE code = %(code)s AND datetime BETWEEN %(start)s AND %(month_end)s ORDER BY datetime""",
+        '最新200根': f"""SELECT datetime, open, high, low, close, volume FROM {table}
+                       WHERE code = %(code)s ORDER BY datetime DESC LIMIT 200"""
+    }
+    raw_conn = engine.raw_connection()
+    results = {}
+    try:
+        cursor = raw_conn.cursor()
+        rng = random.Random(42)
+        for name, sql in queries.items():
+            latencies = []
+            for _ in range(count):
+                day = rng.choice(days)
+                params = {
+                    'code': str(600000 + rng.randrange(codes)),
+                    'start': day,
+                    'end': day + timedelta(days=1),
+                    'month_end': day + timedelta(days=30)
+                }
+                start = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            results[name] = (statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1])
+        cursor.close()
+    finally:
+        raw_conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分区表基准测试')
+    parser.add_argument('--rows', type=int, default=100_000_000, help='总行数（按天向上取整）')
+    parser.add_argument('--codes', type=int, default=5000, help='股票代码数量')
+    parser.add_argument('--queries', type=int, default=200, help='每类查询的次数')
+    args = parser.parse_args()
+
+    day_count = max(-(-args.rows // (args.codes * BARS_PER_DAY)), 1)
+    days = trading_days(day_count)
+    print(f"{args.codes} 个代码 × {BARS_PER_DAY} 根/天 × {day_count} 个交易日 = {args.codes * BARS_PER_DAY * day_count:,} 行")
+
+    try:
+        run_with_cursor(engine, create_tables, days)
+        load_times = {}
+        for table in [HEAP_TABLE, PART_TABLE]:
+            load_times[table] = load_table(table, days, args.codes)
+            run_with_cursor(engine, lambda cursor: cursor.execute(f"ANALYZE {table}"))
+
+        total_rows = args.codes * BARS_PER_DAY * day_count
+        print("===== 写入 =====")
+        for table, elapsed in load_times.items():
+            size = run_with_cursor(engine, table_size, table)
+            print(f"{table:<16} {elapsed:>8.1f} 秒  {total_rows / elapsed:>12,.0f} 行/秒  表+索引 {size:>10,.0f} MB")
+
+        print(f"===== 查询（各 {args.queries} 次，毫秒）=====")
+        for table in [HEAP_TABLE, PART_TABLE]:
+            for name, (median, p95) in measure_queries(table, days, args.codes, args.queries).items():
+                print(f"{table:<16} {name:<10} 中位数 {median:>8.2f}  p95 {p95:>8.2f}")
+    finally:
+        run_with_cursor(engine, lambda cursor: cursor.execute(f"DROP TABLE IF EXISTS {HEAP_TABLE}, {PART_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
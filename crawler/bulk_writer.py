@@ -0,0 +1,152 @@
+"""
+批量写入模块
+使用PostgreSQL的COPY FROM STDIN将DataFrame流式写入临时暂存表，
+再用一条 INSERT ... ON CONFLICT 语句合并到目标表，替代逐行execute
+写入后在同一事务中发送NOTIFY，事务提交后web服务收到通知并失效对应代码的缓存
+分钟数据表写入后在同一事务中增量更新聚合表（见rollup.py）
+分钟爬虫写入时可开启去重，只写入与上次相比新增或变化的K线（见tail_cache.py）
+"""
+import io
+import json
+from config import NOTIFY_CONFIG
+from rollup import refresh_rollups
+
+# 行情表的更新字段（主键以外的列）
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def frame_to_csv_buffer(df):
+    """将DataFrame序列化为COPY可读取的CSV缓冲区，NaN写为空值（即NULL）"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+    return buffer
+
+
+# NOTIFY的payload上限为8000字节，留出余量
+MAX_NOTIFY_PAYLOAD = 7000
+
+
+def notify_update(cursor, df, table):
+    """
+    发送数据更新通知，payload为JSON：{"table": 表名, "codes": [代码...]}
+    代码较多时拆分为多条通知；NOTIFY在事务提交时才会投递，回滚时不会发出
+    """
+    if not NOTIFY_CONFIG['enabled']:
+        return
+    channel = NOTIFY_CONFIG['channel']
+    codes = [str(code) for code in df['code'].unique()] if 'code' in df.columns else []
+
+    def send(batch):
+        payload = json.dumps({'table': table, 'codes': batch})
+        cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+    if not codes:
+        send([])
+        return
+
+    batch, size = [], 0
+    for code in codes:
+        # 每个代码在JSON中占 len(code) + 4 字节左右（引号、逗号、空格）
+        if batch and size + len(code) + 4 > MAX_NOTIFY_PAYLOAD:
+            send(batch)
+            batch, size = [], 0
+        batch.append(code)
+        size += len(code) + 4
+    send(batch)
+
+
+def copy_upsert(cursor, df, table, conflict_columns=('code', 'datetime'), update=True, notify=True):
+    """
+    在已有游标（事务）中执行COPY + 合并
+    参数：
+        cursor: psycopg2游标
+        df: 待写入的DataFrame，列名需与目标表一致
+        table: 目标表名
+        conflict_columns: 冲突判断列（主键）
+        update: True时冲突行执行DO UPDATE，False时DO NOTHING
+        notify: 是否发送数据更新通知
+    返回：写入（插入或更新）的行数
+    """
+    if df is None or df.empty:
+        return 0
+
+    conflict_columns = list(conflict_columns)
+    # 同一批次内的重复主键会导致 ON CONFLICT DO UPDATE 报错，保留最后一条
+    df = df.drop_duplicates(subset=conflict_columns, keep='last')
+
+    columns = list(df.columns)
+    columns_str = ', '.join(columns)
+    staging = f"{table}_staging"
+
+    # 临时表随事务提交自动删除，不影响其他连接
+    cursor.execute(
+        f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    cursor.copy_expert(
+        f"COPY {staging} ({columns_str}) FROM STDIN WITH (FORMAT csv)",
+        frame_to_csv_buffer(df)
+    )
+
+    update_columns = [col for col in columns if col not in conflict_columns]
+    if update and update_columns:
+        set_clause = ',\n                '.join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+        conflict_action = f"""DO UPDATE
+            SET {set_clause},
+                update_time = NOW()"""
+    else:
+        conflict_action = "DO NOTHING"
+
+    cursor.execute(
+        f"""INSERT INTO {table} ({columns_str}, update_time)
+            SELECT {columns_str}, NOW() FROM {staging}
+            ON CONFLICT ({', '.join(conflict_columns)}) {conflict_action}
+        """
+    )
+    rows = cursor.rowcount
+    if rows:
+        refresh_rollups(cursor, table, staging)
+    if notify and rows:
+        notify_update(cursor, df, table)
+    return rows
+
+
+def bulk_upsert(engine, df, table, conflict_columns=('code', 'datetime'), update=True, notify=True, dedup=False):
+    """
+    将DataFrame批量写入目标表（单独事务）
+    参数：
+        engine: SQLAlchemy引擎
+        df: 待写入的DataFrame
+        table: 目标表名，如 cn_data_day、hk_data_realtime
+        conflict_columns: 冲突判断列（主键）
+        update: 冲突时是否更新
+        notify: 是否发送数据更新通知
+        dedup: 是否跳过与尾部缓存相同的K线，只写入新增或变化的行（用于反复抓取同一时间窗口的分钟数据）
+    返回：写入的行数，失败时抛出异常并回滚
+    """
+    if df is None or df.empty:
+        return 0
+
+    cache = None
+    if dedup:
+        from tail_cache import get_tail_cache
+        cache = get_tail_cache(table)
+
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        try:
+            if cache is not None:
+                df = cache.filter(cursor, df)
+            rows = copy_upsert(cursor, df, table, conflict_columns, update, notify)
+        finally:
+            cursor.close()
+        raw_conn.commit()
+        if cache is not None:
+            cache.remember(df)
+        return rows
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
@@ -11,17 +11,196 @@ DB_CONFIG = {
 FILE_CONFIG = {
     # 股票代码CSV文件路径
     'stock_codes_dir': '/Users/aaronkliu/Documents/project/stock/data',
+    # 历史数据归档文件目录
+    'archive_dir': '/Users/aaronkliu/Documents/project/stock/archive',
+    # akshare/yfinance请求结果的本地缓存目录
+    'fetch_cache_dir': '/Users/aaronkliu/Documents/project/stock/fetch_cache',
 }
 
 # 定时任务配置
 SCHEDULE_CONFIG = {
     'enable_schedule': True,         # 是否启用定时任务
     'codes_update_interval': 24,     # 股票代码更新间隔（小时）
-    'price_update_interval': 1       # 价格数据更新间隔（分钟）
+    'price_update_interval': 1,      # 价格数据更新间隔（分钟）
+    'daily_update_delay': 30,        # 收盘后多少分钟开始抓取当日日K线
+    'session_grace_minutes': 5,      # 收盘后继续抓取分钟数据的时间（分钟），保证拿到最后一根K线
+    'maintenance_time': '03:00',     # 每天执行分区维护的时间（本机时间）
+    'max_workers': None              # 定时任务共享线程池大小，默认等于任务数，保证每个任务都有线程可用
 }
 
-# API配置
-API_CONFIG = {
-    'max_retries': 3,                # API请求最大重试次数
-    'retry_interval': 2              # 重试间隔（秒）
-}
\ No newline at end of file
+# 各市场交易时段（交易所当地时间）
+MARKET_SESSIONS = {
+    'cn': {'timezone': 'Asia/Shanghai', 'sessions': [('09:30', '11:30'), ('13:00', '15:00')]},
+    'hk': {'timezone': 'Asia/Hong_Kong', 'sessions': [('09:30', '12:00'), ('13:00', '16:00')]},
+    'us': {'timezone': 'America/New_York', 'sessions': [('09:30', '16:00')]}
+}
+
+# 交易所休市日（周末之外）
+# A股优先使用akshare的交易日历，美股按NYSE规则计算，此处的日期作为补充；港股（含农历节假日）无法按规则计算，需每年更新，
+# 港股缺少当年日期、或A股交易日历获取失败且缺少当年日期时，trading_calendar会打印警告
+MARKET_HOLIDAYS = {
+    'cn': [],
+    'hk': [
+        '2026-01-01', '2026-02-17', '2026-02-18', '2026-02-19', '2026-04-03',
+        '2026-04-06', '2026-04-07', '2026-05-01', '2026-05-25', '2026-06-19',
+        '2026-07-01', '2026-10-01', '2026-10-19', '2026-12-25'
+    ],
+    'us': []
+}
+
+# 数据源请求控制配置（见fetch_control.py）：按上游数据源限速、退避重试和熔断
+FETCH_CONTROL_CONFIG = {
+    'sources': {                     # 上游数据源 -> 每秒请求数和允许的突发请求数
+        'akshare-sina': {'rate': 5, 'burst': 5},
+        'akshare-eastmoney': {'rate': 5, 'burst': 5},
+        'yfinance': {'rate': 2, 'burst': 4}
+    },
+    'max_retries': 3,                # 请求失败后的最大重试次数
+    'backoff_base': 1.0,             # 第一次重试前的等待时间（秒），之后每次翻倍
+    'backoff_max': 60,               # 单次重试等待时间上限（秒）
+    'failure_threshold': 5,          # 连续多少次返回HTML错误页或被限流后熔断
+    'cooldown': 120                  # 熔断持续时间（秒）
+}
+
+# 并发抓取配置
+CRAWL_CONFIG = {
+    'max_workers': 8,                # 并发抓取线程数
+    'task_timeout': 120,             # 单个股票代码的超时时间（秒），限速见FETCH_CONTROL_CONFIG
+    'write_workers': 2,              # A股抓取流水线中同时写库的连接数
+    'pipeline_queue_size': 32        # A股抓取流水线各阶段之间队列的容量（代码数）
+}
+
+# 增量抓取配置
+INCREMENTAL_CONFIG = {
+    'enabled': True,                 # 是否按已有数据的最新日期增量抓取日K线
+    'overlap_days': 3,               # 从最新日期往前重叠抓取的天数，用于覆盖被修正的K线
+    'full_history_days': 365         # 没有历史数据时回溯的天数
+}
+
+# yfinance批量下载配置
+YF_BATCH_CONFIG = {
+    'batch_size': 200,               # 每次yf.download请求的代码数量
+    'threads': True                  # yfinance内部是否多线程下载
+}
+
+# 数据源请求缓存配置：akshare/yfinance的返回结果按 数据源+代码+周期+日期区间 缓存到本地磁盘
+# 结束日期早于今天的历史区间视为不可变，一直有效；包含今天或不指定区间的请求（实时行情、代码列表）按ttl过期
+FETCH_CACHE_CONFIG = {
+    'enabled': True,                 # 是否启用请求缓存
+    'ttl': 300,                      # 未收盘区间的缓存有效期（秒）
+    'adjusted_ttl': 86400,           # 前复权数据的缓存有效期（秒），除权除息后历史价格会被改写，已收盘区间也会过期
+    'max_bytes': 2 * 1024 * 1024 * 1024,  # 缓存目录大小上限（字节），超出时按最近访问时间淘汰
+    # 运行模式：normal 先读缓存，未命中时请求数据源并写入缓存；
+    #          replay 只读缓存，未命中时报错，用于离线调试爬虫；
+    #          refresh 忽略已有缓存，总是请求数据源并覆盖缓存
+    # 可通过环境变量 STOCK_FETCH_CACHE_MODE 覆盖
+    'mode': 'normal'
+}
+
+# 日K线历史回补配置（见backfill.py）
+BACKFILL_CONFIG = {
+    'processes': None,               # 整理数据的进程数，None表示等于CPU核数
+    'fetch_workers': 8,              # A股同时请求的代码数
+    'inflight_per_process': 4,       # 每个整理进程最多排队的代码数，控制共享内存占用
+    'write_batch_rows': 200000       # 写库线程每次COPY写入的行数
+}
+
+# 回补任务进度表配置（见job_ledger.py）
+JOB_LEDGER_CONFIG = {
+    'chunk_size': 100,               # 每次领取的代码数
+    'lease_seconds': 3600,           # 领取的租约时长（秒），主机中断后超过租约的代码可被其他主机重新领取
+    'max_attempts': 3                # 每个代码最多尝试的次数，用尽后保持失败状态
+}
+
+# 股票代码表增量同步配置（见symbol_sync.py）
+SYMBOL_SYNC_CONFIG = {
+    'max_delist_ratio': 0.1          # 快照缺少的已有代码超过该比例时视为快照不完整，本次不执行退市
+}
+
+# A股全市场快照实时行情配置（见stock_cn_realtime.py）
+SPOT_BAR_CONFIG = {
+    'enabled': False,                # 定时任务中是否用全市场快照生成A股分钟K线，替代按代码逐个请求分钟数据
+    'poll_interval': 20              # 快照轮询间隔（秒），一次全市场快照需要分页请求，不宜小于请求耗时
+}
+
+# 分钟数据尾部缓存配置（见tail_cache.py）：写库前跳过内容没有变化的K线
+TAIL_CACHE_CONFIG = {
+    'enabled': True,                 # 是否启用，关闭后每次轮询都写入抓取到的全部K线
+    'max_bars': 600                  # 每个代码缓存的最近K线数，A股约两个半交易日的1分钟K线
+}
+
+# 数据更新通知配置：爬虫写入后通过PostgreSQL NOTIFY通知web服务失效缓存
+NOTIFY_CONFIG = {
+    'enabled': True,                 # 写入行情数据后是否发送通知
+    'channel': 'stock_data_updated'  # LISTEN/NOTIFY使用的频道名
+}
+
+# web服务ASGI部署配置（见web/asgi_app.py）
+WEB_SERVER_CONFIG = {
+    'host': '0.0.0.0',
+    'port': 5001,
+    'workers': 4,                    # uvicorn工作进程数，每个进程有独立的连接池
+    'pool_min_size': 5,              # 每个进程的asyncpg连接池最小连接数
+    'pool_max_size': 20,             # 每个进程的最大连接数，workers * pool_max_size 不能超过数据库的max_connections
+    'request_timeout': 10,           # 单个请求的超时时间（秒），超时返回504
+    'wsgi_threads': 64               # 挂载的Flask路由（含SSE长连接）可用的线程数
+}
+
+# 批量查询接口配置（/api/stock/batch）
+BATCH_QUERY_CONFIG = {
+    'max_codes': 500                 # 一次请求最多的代码数
+}
+
+# web服务技术指标配置（见web/indicators.py、web/indicator_cache.py）：/api/stock/indicators
+INDICATOR_CONFIG = {
+    'enabled': True,                 # 是否提供 /api/stock/indicators
+    'max_bars': 5000,                # 每只股票每个粒度缓存并参与计算的K线数
+    'max_series': 500,               # 最多缓存的 (股票, 粒度) 数
+    'ttl': 60,                       # 收不到数据更新通知时，超过该秒数再查询新K线
+    'max_indicators': 10             # 一次请求最多的指标数
+}
+
+# web服务股票代码搜索配置（见web/symbol_search.py）：内存索引，代码爬虫刷新代码表后通过NOTIFY重建
+SYMBOL_SEARCH_CONFIG = {
+    'enabled': True,                 # 是否使用内存索引，关闭时 /api/stock/list 直接查询数据库
+    'pinyin': True,                  # 是否为中文名称建立拼音首字母索引（需要安装pypinyin）
+    'max_age': 3600,                 # 索引最长使用时间（秒），收不到代码表更新通知时的兜底
+    'page_size': 20,                 # /api/stock/search 默认每页条数
+    'max_page_size': 200             # 每页条数上限
+}
+
+# web服务实时K线推送配置（见web/live_bus.py）：SSE订阅，由数据更新通知驱动
+LIVE_STREAM_CONFIG = {
+    'enabled': True,                 # 是否提供 /api/stock/stream，需要同时启用NOTIFY_CONFIG
+    'queue_size': 100,               # 每个客户端最多积压的消息数，超过时通知客户端重新加载
+    'keepalive': 15,                 # 没有更新时发送心跳的间隔（秒），防止代理断开空闲连接
+    'max_subscribers': 1000          # 同时订阅的客户端上限，每个客户端占用一个服务线程
+}
+
+# web服务查询结果缓存配置
+QUERY_CACHE_CONFIG = {
+    'enabled': True,                 # 是否启用查询结果缓存
+    'ttl': 300,                      # 缓存有效期（秒），收不到数据更新通知时的兜底
+    'max_entries': 2000,             # 最多缓存的查询结果数
+    'max_bytes': 200 * 1024 * 1024   # 缓存结果的估算内存上限（字节）
+}
+
+# 分钟数据聚合表配置：分钟数据写入时增量更新各级聚合表
+ROLLUP_CONFIG = {
+    'enabled': True,                 # 是否在写入分钟数据时同步更新聚合表
+    'sources': {                     # 分钟数据表 -> 市场
+        'cn_data_realtime': 'cn',
+        'hk_data_realtime': 'hk',
+        'us_data_realtime': 'us'
+    },
+    # 聚合级别（表名后缀, 桶大小秒数），按从细到粗排列，每一级由上一级聚合而来
+    'levels': [('5m', 300), ('15m', 900), ('60m', 3600), ('1d', 86400)]
+}
+
+# 分钟数据表分区配置
+PARTITION_CONFIG = {
+    'tables': ['cn_data_realtime', 'hk_data_realtime', 'us_data_realtime'],
+    'premake_months': 3,             # 提前创建未来几个月的分区
+    'retention_months': 24,          # 在线保留的月数，更早的分区分离后导出归档，0表示不归档
+    'drop_after_archive': True       # 导出归档文件后是否删除分离的分区表
+}
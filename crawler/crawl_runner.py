@@ -0,0 +1,80 @@
+"""
+抓取任务的公共部分：读取各市场的股票代码列表，汇总一次批量抓取的结果
+逐代码的并发调度见async_crawler.py，数据源限速见fetch_control.py
+"""
+import os
+import time
+import pandas as pd
+from sqlalchemy import text
+from config import FILE_CONFIG
+
+# 各市场股票列表的来源：数据库表、本地备份CSV文件、CSV中的代码列
+UNIVERSE_SOURCES = {
+    'cn': ('cn_stocks', 'A_shares_stock_codes.csv', '代码'),
+    'hk': ('hk_stocks', 'HK_shares_stock_codes.csv', '代码'),
+    'us': ('us_stocks', 'US_shares_stock_codes.csv', 'symbol')
+}
+
+
+def load_universe(market, engine=None):
+    """
+    获取某个市场的全部股票代码
+    优先读取数据库中的 {market}_stocks 表，失败时读取本地备份CSV文件
+    返回：去重后的代码列表
+    """
+    table, csv_name, csv_column = UNIVERSE_SOURCES[market]
+
+    if engine is not None:
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(text(f"SELECT DISTINCT code FROM {table} ORDER BY code")).fetchall()
+            codes = [str(row[0]) for row in rows if row[0]]
+            if codes:
+                print(f"从数据库表 {table} 读取到 {len(codes)} 个股票代码")
+                return codes
+        except Exception as e:
+            print(f"读取数据库表 {table} 失败: {str(e)[:100]}，尝试读取本地备份CSV文件")
+
+    csv_file = os.path.join(FILE_CONFIG['stock_codes_dir'], csv_name)
+    try:
+        # 代码列按字符串读取，避免港股代码前导0丢失
+        stock_list = pd.read_csv(csv_file, dtype={csv_column: str})
+        codes = stock_list[csv_column].dropna().drop_duplicates().tolist()
+        print(f"从本地备份文件 {csv_file} 读取到 {len(codes)} 个股票代码")
+        return codes
+    except Exception as e:
+        print(f"读取本地备份文件失败: {e}")
+        return []
+
+
+class CrawlSummary:
+    """记录一次批量抓取的成功、失败和超时情况"""
+
+    def __init__(self, name):
+        self.name = name
+        self.succeeded = []
+        self.failed = {}
+        self.timed_out = []
+        self.start_time = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def total(self):
+        return len(self.succeeded) + len(self.failed) + len(self.timed_out)
+
+    def print_summary(self, max_items=20):
+        """打印汇总信息，失败和超时的代码最多列出max_items个"""
+        print(f"===== {self.name} 抓取汇总 =====")
+        print(f"共 {self.total} 个代码，成功 {len(self.succeeded)}，失败 {len(self.failed)}，超时 {len(self.timed_out)}")
+        if self.elapsed > 0:
+            print(f"耗时 {self.elapsed:.1f} 秒，平均 {self.total / self.elapsed:.2f} 个代码/秒")
+        if self.failed:
+            print("失败代码:")
+            for code, reason in list(self.failed.items())[:max_items]:
+                print(f"  {code}: {reason}")
+            if len(self.failed) > max_items:
+                print(f"  ... 其余 {len(self.failed) - max_items} 个省略")
+        if self.timed_out:
+            shown = ', '.join(self.timed_out[:max_items])
+            more = f" 等 {len(self.timed_out)} 个" if len(self.timed_out) > max_items else ''
+            print(f"超时代码: {shown}{more}")
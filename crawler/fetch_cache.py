@@ -0,0 +1,249 @@
+"""
+数据源请求的本地磁盘缓存
+akshare/yfinance的返回结果（DataFrame）按 数据源+代码+周期+日期区间+其他参数 的sha256作为键，
+pickle后保存为 {fetch_cache_dir}/{键前2位}/{键}.pkl：
+    - 结束日期早于今天的区间视为已收盘的历史数据，缓存一直有效
+    - 包含今天或没有日期区间的请求（分钟数据、实时行情、代码列表）按ttl过期
+    - 空结果也只按ttl缓存，避免数据源偶发返回空数据后被永久缓存
+    - 前复权数据（adjust='qfq'、yfinance auto_adjust=True）每次除权除息后整段历史都会改写，
+      即使区间已收盘也只按adjusted_ttl缓存
+    - 盘中轮询的分钟数据传ttl=0，不读缓存（回放模式除外），结果仍写入缓存供回放使用
+    - 缓存目录超过max_bytes时按最近访问时间（文件修改时间，命中时更新）淘汰到上限的90%
+用法：
+    data = cached_fetch('akshare', 'sh600000', '1d', lambda: ak.stock_zh_a_daily(...),
+                        start='20240101', end='20240131', adjust='qfq')
+    STOCK_FETCH_CACHE_MODE=replay python stock_cn_trade_day.py   # 只读缓存，离线运行
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from datetime import date, datetime
+from config import FETCH_CACHE_CONFIG, FILE_CONFIG
+
+MODES = ('normal', 'replay', 'refresh')
+
+
+class FetchCacheMiss(Exception):
+    """回放模式下缓存中没有对应的请求结果"""
+
+
+def _to_date(value):
+    """把 date/datetime/'2024-01-02'/'20240102' 转换为date，无法识别时返回None"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        for fmt in ['%Y-%m-%d', '%Y%m%d', '%Y-%m-%d %H:%M:%S']:
+            try:
+                return datetime.strptime(value, fmt).date()
+            except ValueError:
+                continue
+    return None
+
+
+def cache_key(source, symbol, interval, start=None, end=None, **params):
+    """请求参数的sha256，参数顺序不影响结果"""
+    payload = json.dumps(
+        {'source': source, 'symbol': symbol, 'interval': interval, 'start': start, 'end': end, 'params': params},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_forward_adjusted(params):
+    """请求参数是否为前复权，前复权价格以最新一次除权为基准，历史区间的结果也会变化"""
+    return params.get('adjust') == 'qfq' or bool(params.get('auto_adjust'))
+
+
+def is_closed_range(end):
+    """结束日期早于今天的区间视为已收盘，没有结束日期或无法解析时视为未收盘"""
+    end_day = _to_date(end)
+    return end_day is not None and end_day < date.today()
+
+
+class FetchCache:
+    """
+    磁盘缓存，多个线程共享同一个实例
+    目录总大小在第一次写入时统计一次，之后按写入和淘汰增量维护
+    """
+
+    def __init__(self, cache_dir, max_bytes, ttl, mode='normal', adjusted_ttl=None):
+        if mode not in MODES:
+            raise ValueError(f"未知的缓存模式: {mode}，可选 {', '.join(MODES)}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.adjusted_ttl = ttl if adjusted_ttl is None else adjusted_ttl
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def get(self, key, ttl=None, immutable=True):
+        """
+        读取缓存，不存在、已过期或文件损坏时返回 (False, None)
+        参数：
+            ttl: 未收盘区间的有效期（秒），默认取self.ttl，0表示不使用未收盘的缓存
+            immutable: False表示结果可能被数据源改写（前复权），已收盘的缓存也按ttl过期
+        """
+        if ttl is None:
+            ttl = self.ttl
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            print(f"⚠️ 读取缓存文件 {path} 失败: {e}")
+            return False, None
+
+        # 回放模式下过期的缓存也可以使用
+        expires = not (entry['closed'] and immutable)
+        if expires and self.mode != 'replay' and (ttl <= 0 or time.time() - entry['created'] > ttl):
+            return False, None
+        try:
+            # 更新修改时间，作为LRU淘汰的访问时间
+            os.utime(path)
+        except OSError:
+            pass
+        return True, entry['data']
+
+    def set(self, key, data, closed):
+        """写入缓存，先写临时文件再替换，并发写同一个键时不会读到写了一半的文件"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        entry = {'created': time.time(), 'closed': closed, 'data': data}
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        """缓存目录中的全部缓存文件：[(修改时间, 大小, 路径), ...]"""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.pkl'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        """按最近访问时间从旧到新删除缓存文件，直到总大小不超过上限的90%"""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._size = total
+        print(f"请求缓存超过上限，已淘汰 {removed} 个文件，当前 {total / 1024 / 1024:.0f} MB")
+
+    def fetch(self, source, symbol, interval, fetch_fn, start=None, end=None, closed=None, ttl=None, **params):
+        """
+        先读缓存，未命中时调用fetch_fn()请求数据源并写入缓存
+        参数：
+            fetch_fn: 无参数的函数，返回请求结果
+            start/end: 请求的日期区间，参与缓存键的计算，end决定是否为已收盘区间
+            closed: 显式指定是否为已收盘区间，默认按end判断
+            ttl: 未收盘区间的缓存有效期（秒），默认取配置，盘中轮询传0（每次都请求数据源）
+            params: 其他影响返回结果的请求参数（复权方式等），参与缓存键的计算
+        返回：fetch_fn()的返回值或缓存的结果
+        """
+        key = cache_key(source, symbol, interval, start, end, **params)
+        adjusted = is_forward_adjusted(params)
+        if ttl is None:
+            ttl = self.adjusted_ttl if adjusted else self.ttl
+        if self.mode != 'refresh':
+            found, data = self.get(key, ttl, immutable=not adjusted)
+            if found:
+                self.hits += 1
+                return data
+        self.misses += 1
+        if self.mode == 'replay':
+            raise FetchCacheMiss(f"缓存中没有 {source} {symbol} {interval} {start}~{end} 的请求结果")
+
+        data = fetch_fn()
+        if data is None:
+            return data
+        if closed is None:
+            closed = is_closed_range(end)
+        if adjusted or getattr(data, 'empty', False):
+            closed = False
+        try:
+            self.set(key, data, closed)
+        except Exception as e:
+            print(f"⚠️ 写入请求缓存失败: {e}")
+        return data
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fetch_cache():
+    """按FETCH_CACHE_CONFIG创建的进程内共享缓存，未启用时返回None"""
+    global _cache
+    if not FETCH_CACHE_CONFIG['enabled']:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            mode = os.environ.get('STOCK_FETCH_CACHE_MODE') or FETCH_CACHE_CONFIG['mode']
+            _cache = FetchCache(
+                FILE_CONFIG['fetch_cache_dir'],
+                FETCH_CACHE_CONFIG['max_bytes'],
+                FETCH_CACHE_CONFIG['ttl'],
+                mode,
+                FETCH_CACHE_CONFIG.get('adjusted_ttl')
+            )
+            if mode != 'normal':
+                print(f"请求缓存模式: {mode}")
+        return _cache
+
+
+def cached_fetch(source, symbol, interval, fetch_fn, start=None, end=None, closed=None, ttl=None, **params):
+    """
+    通过共享缓存请求数据源，参数同FetchCache.fetch
+    未启用缓存时直接调用fetch_fn()
+    """
+    cache = get_fetch_cache()
+    if cache is None:
+        return fetch_fn()
+    return cache.fetch(source, symbol, interval, fetch_fn, start, end, closed, ttl, **params)
@@ -0,0 +1,236 @@
+"""
+数据源请求控制模块
+所有akshare/yfinance请求都通过call(source, func, ...)发起，按上游数据源共享：
+    - 令牌桶限速：允许短时突发，长期速率不超过配置；收到限流（HTTP 429）时速率减半并暂停整个数据源，
+      之后每次成功请求逐步恢复到配置的速率
+    - 指数退避重试：第n次重试前等待 backoff_base * 2^n 秒（不超过backoff_max），乘以0.5~1的随机抖动，
+      多个线程同时失败时不会在同一时刻一起重试；响应带Retry-After时至少等待该时间
+    - 熔断：连续failure_threshold次返回HTML错误页或被限流后熔断，cooldown秒内该数据源的请求直接失败，
+      冷却结束后放行一个试探请求，成功则恢复，失败则重新熔断
+用法：
+    data = call('akshare-sina', ak.stock_zh_a_daily, symbol='sh600000', adjust='qfq')
+"""
+import random
+import re
+import threading
+import time
+from config import FETCH_CONTROL_CONFIG
+
+
+class CircuitOpenError(Exception):
+    """数据源处于熔断状态，请求未发出"""
+
+
+def retry_after(error):
+    """
+    判断异常是否为限流（HTTP 429），返回建议的等待秒数
+    返回：限流时返回等待秒数（响应没有Retry-After时为0），不是限流时返回None
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status == 429:
+        try:
+            return float(response.headers.get('Retry-After', 0))
+        except (TypeError, ValueError):
+            return 0.0
+    # yfinance的YFRateLimitError，以及只在错误信息中带状态码的异常
+    message = str(error)
+    if 'RateLimit' in type(error).__name__ or re.search(r'\b429\b|Too Many Requests', message):
+        return 0.0
+    return None
+
+
+def is_html_error(error):
+    """上游返回HTML页面（验证码、封禁或错误页）而非数据时，解析异常的信息中会带有HTML标签"""
+    message = str(error)[:500]
+    return '<' in message and '>' in message
+
+
+class TokenBucket:
+    """
+    令牌桶，多个线程共享同一个实例
+    rate为当前速率（每秒令牌数），限流时下调，成功请求后按recover_step逐步恢复到max_rate
+    """
+
+    def __init__(self, rate, burst, min_rate, recover_step):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.recover_step = recover_step
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait_time = (1 - self._tokens) / self.rate
+                else:
+                    wait_time = self._paused_until - now
+            time.sleep(wait_time)
+
+    def throttle(self, pause=0.0):
+        """被限流：速率减半，清空令牌，并在pause秒内暂停发放令牌"""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            self._updated = max(now, self._paused_until)
+            if pause > 0:
+                self._paused_until = max(self._paused_until, now + pause)
+                self._updated = self._paused_until
+
+    def recover(self):
+        """请求成功：速率加回recover_step，不超过配置的速率"""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recover_step)
+
+
+class CircuitBreaker:
+    """
+    熔断器：closed（正常）-> open（熔断，请求直接失败）-> half-open（放行一个试探请求）
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = 'closed'
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self, source):
+        """请求前检查，熔断中时抛出CircuitOpenError"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                # 冷却结束，只放行当前这一个试探请求
+                self.state = 'half-open'
+                return
+            if self.state == 'open':
+                raise CircuitOpenError(f"数据源 {source} 熔断中，{remaining:.0f} 秒后恢复")
+            raise CircuitOpenError(f"数据源 {source} 正在试探恢复")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = 'closed'
+
+    def record_failure(self, source):
+        """记录一次HTML错误页或限流，达到阈值（或试探请求失败）时熔断"""
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"⚠️ 数据源 {source} 连续 {self.failures} 次返回错误页或被限流，熔断 {self.cooldown} 秒")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """试探请求因其他原因失败（如代码不存在）时，不改变熔断状态，允许下一个试探请求"""
+        with self._lock:
+            if self.state == 'half-open':
+                self.state = 'open'
+                self._opened_at = time.monotonic() - self.cooldown
+
+
+class FetchController:
+    """单个上游数据源的限速、退避重试和熔断"""
+
+    def __init__(self, name, rate, burst, max_retries, backoff_base, backoff_max, failure_threshold, cooldown):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst, min_rate=rate / 16, recover_step=rate / 20)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff_delay(self, attempt, minimum=0.0):
+        """第attempt次重试前的等待时间（秒），带随机抖动"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return max(minimum, delay * random.uniform(0.5, 1.0))
+
+    def call(self, func, *args, max_retries=None, **kwargs):
+        """
+        限速后调用func(*args, **kwargs)，失败时按指数退避重试
+        参数：
+            max_retries: 最大重试次数，默认取配置；为0时只请求一次（调用方自己决定如何重试）
+        返回：func的返回值，重试用尽时抛出最后一次的异常，熔断中抛出CircuitOpenError
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self.breaker.before_call(self.name)
+            self.bucket.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                wait = retry_after(e)
+                if wait is not None:
+                    self.bucket.throttle(wait)
+                    self.breaker.record_failure(self.name)
+                elif is_html_error(e):
+                    self.breaker.record_failure(self.name)
+                else:
+                    self.breaker.release_probe()
+                if attempt >= max_retries or self.breaker.state == 'open':
+                    raise
+                delay = self.backoff_delay(attempt, wait or 0.0)
+                attempt += 1
+                print(f"⚠️ {self.name} 请求失败: {str(e)[:150]}，{delay:.1f} 秒后重试 ({attempt}/{max_retries})")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.bucket.recover()
+            return result
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(source):
+    """按FETCH_CONTROL_CONFIG创建的进程内共享控制器，同一数据源的所有线程共用"""
+    with _controllers_lock:
+        controller = _controllers.get(source)
+        if controller is None:
+            limits = FETCH_CONTROL_CONFIG['sources'][source]
+            controller = FetchController(
+                source,
+                rate=limits['rate'],
+                burst=limits['burst'],
+                max_retries=FETCH_CONTROL_CONFIG['max_retries'],
+                backoff_base=FETCH_CONTROL_CONFIG['backoff_base'],
+                backoff_max=FETCH_CONTROL_CONFIG['backoff_max'],
+                failure_threshold=FETCH_CONTROL_CONFIG['failure_threshold'],
+                cooldown=FETCH_CONTROL_CONFIG['cooldown']
+            )
+            _controllers[source] = controller
+        return controller
+
+
+def call(source, func, *args, max_retries=None, **kwargs):
+    """通过数据源source的共享控制器调用func，参数同FetchController.call"""
+    return get_controller(source).call(func, *args, max_retries=max_retries, **kwargs)
+
+
+def backoff(source, attempt):
+    """按数据源的退避策略等待，供自己循环重试的调用方（如轮换代码格式的单代码抓取）使用"""
+    time.sleep(get_controller(source).backoff_delay(attempt))
@@ -0,0 +1,73 @@
+"""
+增量抓取模块
+按股票代码查询日线表中已有数据的最新日期（高水位），只抓取缺失的日期区间
+增量模式下日K线按不复权价格抓取和保存（见adjust_prices）
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config import INCREMENTAL_CONFIG
+
+
+def get_high_water_mark(engine, table, code):
+    """查询单个代码在表中的最新日期，没有数据时返回None"""
+    with engine.connect() as conn:
+        return conn.execute(
+            text(f"SELECT MAX(datetime) FROM {table} WHERE code = :code"),
+            {'code': code}
+        ).scalar()
+
+
+def load_high_water_marks(engine, table):
+    """一次查询表中所有代码的最新日期，返回 {code: date}"""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT code, MAX(datetime) FROM {table} GROUP BY code")).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def adjust_prices():
+    """
+    日K线是否抓取前复权价格
+    前复权以最近一次除权为基准，每次分红、拆股后上游会改写整段历史价格；增量模式只重抓最近overlap_days天，
+    若保存前复权价格，除权后新K线与更早的K线基准不同，表中会出现虚假跳空。
+    因此增量模式下抓取不复权价格（历史不会被改写），关闭增量模式时每次抓取整个区间，仍使用前复权
+    """
+    return not INCREMENTAL_CONFIG['enabled']
+
+
+def resolve_start_date(last_date, overlap_days=None, full_history_days=None):
+    """
+    根据高水位计算抓取起始日期
+    没有历史数据时回溯full_history_days天，否则从最新日期往前overlap_days天开始，
+    以便重新抓取可能被修正的最近几根K线
+    """
+    overlap_days = INCREMENTAL_CONFIG['overlap_days'] if overlap_days is None else overlap_days
+    full_history_days = full_history_days or INCREMENTAL_CONFIG['full_history_days']
+    today = datetime.now().date()
+    if last_date is None:
+        return today - timedelta(days=full_history_days)
+    if isinstance(last_date, datetime):
+        last_date = last_date.date()
+    return min(last_date - timedelta(days=overlap_days), today)
+
+
+def get_incremental_start(engine, table, code, high_water_marks=None):
+    """
+    返回增量抓取的起始日期
+    参数：
+        engine: 数据库引擎
+        table: 日线表名，如 cn_data_day
+        code: 表中保存的股票代码
+        high_water_marks: 预先加载的 {code: date}，提供时不再逐个查询数据库
+    返回：起始日期（date），未启用增量模式或查询失败时返回None，由调用方抓取默认区间
+    """
+    if not INCREMENTAL_CONFIG['enabled']:
+        return None
+    try:
+        if high_water_marks is not None:
+            last_date = high_water_marks.get(code)
+        else:
+            last_date = get_high_water_mark(engine, table, code)
+    except Exception as e:
+        print(f"查询 {code} 的最新日期失败: {str(e)[:100]}，按全量区间抓取")
+        return None
+    return resolve_start_date(last_date)
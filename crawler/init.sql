@@ -3,6 +3,7 @@ CREATE TABLE IF NOT EXISTS us_stocks (
     id SERIAL PRIMARY KEY,
     code VARCHAR(20) NOT NULL UNIQUE,
     name VARCHAR(100),
+    cname VARCHAR(100),
     industry VARCHAR(100),
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -22,6 +23,7 @@ CREATE TABLE IF NOT EXISTS hk_stocks (
     id SERIAL PRIMARY KEY,
     code VARCHAR(20) NOT NULL UNIQUE,
     name VARCHAR(100),
+    cname VARCHAR(100),
     industry VARCHAR(100),
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -39,7 +41,7 @@ CREATE TABLE IF NOT EXISTS stock_minute_data (
     PRIMARY KEY (code, datetime)
 );
 
--- 创建A股实时数据表
+-- 创建A股实时数据表（按月分区，月分区和默认分区由partition_manager.py创建）
 CREATE TABLE IF NOT EXISTS cn_data_realtime (
     code VARCHAR(50) NOT NULL,
     datetime TIMESTAMP NOT NULL,
@@ -50,9 +52,9 @@ CREATE TABLE IF NOT EXISTS cn_data_realtime (
     volume BIGINT,
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (code, datetime)
-);
+) PARTITION BY RANGE (datetime);
 
--- 创建港股实时数据表
+-- 创建港股实时数据表（按月分区，月分区和默认分区由partition_manager.py创建）
 CREATE TABLE IF NOT EXISTS hk_data_realtime (
     code VARCHAR(50) NOT NULL,
     datetime TIMESTAMP NOT NULL,
@@ -63,9 +65,9 @@ CREATE TABLE IF NOT EXISTS hk_data_realtime (
     volume BIGINT,
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (code, datetime)
-);
+) PARTITION BY RANGE (datetime);
 
--- 创建美股实时数据表
+-- 创建美股实时数据表（按月分区，月分区和默认分区由partition_manager.py创建）
 CREATE TABLE IF NOT EXISTS us_data_realtime (
     code VARCHAR(50) NOT NULL,
     datetime TIMESTAMP NOT NULL,
@@ -76,17 +78,17 @@ CREATE TABLE IF NOT EXISTS us_data_realtime (
     volume BIGINT,
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (code, datetime)
-);
+) PARTITION BY RANGE (datetime);
 
--- 增加索引以提高查询性能
-CREATE INDEX IF NOT EXISTS idx_cn_data_realtime_code ON cn_data_realtime (code);
-CREATE INDEX IF NOT EXISTS idx_cn_data_realtime_datetime ON cn_data_realtime (datetime);
+-- 主键 (code, datetime) 已覆盖按代码和按代码+时间范围的查询，删除多余的单列索引
+DROP INDEX IF EXISTS idx_cn_data_realtime_code;
+DROP INDEX IF EXISTS idx_cn_data_realtime_datetime;
 
-CREATE INDEX IF NOT EXISTS idx_hk_data_realtime_code ON hk_data_realtime (code);
-CREATE INDEX IF NOT EXISTS idx_hk_data_realtime_datetime ON hk_data_realtime (datetime);
+DROP INDEX IF EXISTS idx_hk_data_realtime_code;
+DROP INDEX IF EXISTS idx_hk_data_realtime_datetime;
 
-CREATE INDEX IF NOT EXISTS idx_us_data_realtime_code ON us_data_realtime (code);
-CREATE INDEX IF NOT EXISTS idx_us_data_realtime_datetime ON us_data_realtime (datetime);
+DROP INDEX IF EXISTS idx_us_data_realtime_code;
+DROP INDEX IF EXISTS idx_us_data_realtime_datetime;
 
 -- 创建schema_updates表用于记录数据库更新历史
 CREATE TABLE IF NOT EXISTS schema_updates (
@@ -144,6 +146,202 @@ CREATE INDEX IF NOT EXISTS idx_hk_data_day_datetime ON hk_data_day (datetime);
 CREATE INDEX IF NOT EXISTS idx_us_data_day_code ON us_data_day (code);
 CREATE INDEX IF NOT EXISTS idx_us_data_day_datetime ON us_data_day (datetime);
 
+-- 分钟数据聚合表：由rollup.py在分钟数据写入时按受影响的时间桶增量更新
+-- 创建A股5分钟K线表
+CREATE TABLE IF NOT EXISTS cn_data_5m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建A股15分钟K线表
+CREATE TABLE IF NOT EXISTS cn_data_15m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建A股60分钟K线表
+CREATE TABLE IF NOT EXISTS cn_data_60m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建A股日线（由分钟数据聚合）K线表
+CREATE TABLE IF NOT EXISTS cn_data_1d (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建港股5分钟K线表
+CREATE TABLE IF NOT EXISTS hk_data_5m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建港股15分钟K线表
+CREATE TABLE IF NOT EXISTS hk_data_15m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建港股60分钟K线表
+CREATE TABLE IF NOT EXISTS hk_data_60m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建港股日线（由分钟数据聚合）K线表
+CREATE TABLE IF NOT EXISTS hk_data_1d (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建美股5分钟K线表
+CREATE TABLE IF NOT EXISTS us_data_5m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建美股15分钟K线表
+CREATE TABLE IF NOT EXISTS us_data_15m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建美股60分钟K线表
+CREATE TABLE IF NOT EXISTS us_data_60m (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建美股日线（由分钟数据聚合）K线表
+CREATE TABLE IF NOT EXISTS us_data_1d (
+    code VARCHAR(50) NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open NUMERIC(10,4),
+    high NUMERIC(10,4),
+    low NUMERIC(10,4),
+    close NUMERIC(10,4),
+    volume BIGINT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code, datetime)
+);
+
+-- 创建回补任务进度表（见job_ledger.py），每个任务按股票代码拆分为工作单元
+-- 多台爬虫主机通过 FOR UPDATE SKIP LOCKED 领取单元，进程中断后按状态只重跑未完成或失败的单元
+CREATE TABLE IF NOT EXISTS crawl_job_ledger (
+    job_id VARCHAR(100) NOT NULL,
+    market VARCHAR(10) NOT NULL,
+    code VARCHAR(50) NOT NULL,
+    range_start DATE NOT NULL,
+    range_end DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rows_written BIGINT NOT NULL DEFAULT 0,
+    duration_seconds DOUBLE PRECISION,
+    lease_owner VARCHAR(200),
+    leased_at TIMESTAMP,
+    lease_expires TIMESTAMP,
+    error TEXT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, code)
+);
+
+CREATE INDEX IF NOT EXISTS idx_crawl_job_ledger_status ON crawl_job_ledger (job_id, status);
+
+-- 已有数据库的代码表补充中文名称字段
+ALTER TABLE us_stocks ADD COLUMN IF NOT EXISTS cname VARCHAR(100);
+ALTER TABLE hk_stocks ADD COLUMN IF NOT EXISTS cname VARCHAR(100);
+
+-- 创建股票代码变更记录表（见symbol_sync.py），记录每次代码表同步中的新上市、退市、更名和其他变更
+CREATE TABLE IF NOT EXISTS stock_symbol_changes (
+    id BIGSERIAL PRIMARY KEY,
+    market VARCHAR(10) NOT NULL,
+    code VARCHAR(20) NOT NULL,
+    change_type VARCHAR(20) NOT NULL,
+    old_values JSONB,
+    new_values JSONB,
+    change_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_symbol_changes_market ON stock_symbol_changes (market, change_time);
+
 -- 记录创建时间
 INSERT INTO schema_updates (description, update_time) 
 VALUES ('Created all database tables including stock codes, minute data, realtime data and daily trading data tables', CURRENT_TIMESTAMP);
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+回补任务进度表（crawl_job_ledger）
+一个回补任务（job_id）按股票代码拆分为工作单元，每个单元记录区间、状态、尝试次数、写入行数和耗时：
+    pending -> running（被某台主机领取，带租约到期时间）-> done / failed
+领取时用 SELECT ... FOR UPDATE SKIP LOCKED，多台主机同时运行同一个job_id时各自领到不同的单元；
+主机中断后其running单元在租约到期后可被重新领取，failed单元在尝试次数用尽前会被重新领取
+所有函数都接收psycopg2游标，由调用方通过partition_manager.run_with_cursor控制事务
+"""
+import os
+import socket
+from config import JOB_LEDGER_CONFIG
+
+
+def worker_id():
+    """当前进程的标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_job(cursor, job_id, market, codes, start, end):
+    """
+    为任务登记工作单元，已登记的代码保持原状态不变（重复执行即为续跑）
+    返回：新登记的单元数
+    """
+    cursor.execute(
+        """INSERT INTO crawl_job_ledger (job_id, market, code, range_start, range_end)
+           SELECT %s, %s, code, %s, %s FROM unnest(%s::text[]) AS code
+           ON CONFLICT (job_id, code) DO NOTHING""",
+        (job_id, market, start, end, list(codes))
+    )
+    return cursor.rowcount
+
+
+def get_job(cursor, job_id):
+    """任务的市场和区间，任务不存在时返回None"""
+    cursor.execute(
+        "SELECT market, MIN(range_start), MAX(range_end) FROM crawl_job_ledger WHERE job_id = %s GROUP BY market",
+        (job_id,)
+    )
+    return cursor.fetchone()
+
+
+def lease_units(cursor, job_id, owner, limit=None, lease_seconds=None, max_attempts=None):
+    """
+    领取最多limit个待处理单元：pending、未用尽尝试次数的failed、以及租约已过期的running
+    租约已过期、尝试次数已用尽的running单元（主机在最后一次尝试中中断）先标记为failed，不再停留在running
+    返回：[(代码, 起始日期, 结束日期), ...]，没有可领取的单元时返回空列表
+    """
+    limit = limit or JOB_LEDGER_CONFIG['chunk_size']
+    lease_seconds = lease_seconds or JOB_LEDGER_CONFIG['lease_seconds']
+    max_attempts = max_attempts or JOB_LEDGER_CONFIG['max_attempts']
+    cursor.execute(
+        """UPDATE crawl_job_ledger
+           SET status = 'failed', error = COALESCE(error || '; ', '') || %(error)s,
+               lease_expires = NULL, update_time = NOW()
+           WHERE job_id = %(job_id)s AND status = 'running'
+           AND lease_expires < NOW() AND attempts >= %(max_attempts)s""",
+        {'job_id': job_id, 'max_attempts': max_attempts,
+         'error': f"租约过期时已用尽 {max_attempts} 次尝试（领取的主机中断）"}
+    )
+    cursor.execute(
+        """UPDATE crawl_job_ledger AS l
+           SET status = 'running', lease_owner = %(owner)s, attempts = l.attempts + 1,
+               leased_at = NOW(), lease_expires = NOW() + %(lease)s * INTERVAL '1 second',
+               update_time = NOW()
+           FROM (
+               SELECT job_id, code FROM crawl_job_ledger
+               WHERE job_id = %(job_id)s
+               AND attempts < %(max_attempts)s
+               AND (status IN ('pending', 'failed') OR (status = 'running' AND lease_expires < NOW()))
+               ORDER BY code
+               LIMIT %(limit)s
+               FOR UPDATE SKIP LOCKED
+           ) AS picked
+           WHERE l.job_id = picked.job_id AND l.code = picked.code
+           RETURNING l.code, l.range_start, l.range_end""",
+        {'owner': owner, 'lease': lease_seconds, 'job_id': job_id, 'max_attempts': max_attempts, 'limit': limit}
+    )
+    return sorted(cursor.fetchall())
+
+
+def complete_units(cursor, job_id, owner, rows_by_code):
+    """把本主机领取的单元标记为完成，记录写入行数和从领取到完成的耗时"""
+    if not rows_by_code:
+        return 0
+    codes = list(rows_by_code)
+    cursor.execute(
+        """UPDATE crawl_job_ledger AS l
+           SET status = 'done', rows_written = r.rows_written, error = NULL,
+               duration_seconds = EXTRACT(EPOCH FROM NOW() - l.leased_at),
+               lease_expires = NULL, update_time = NOW()
+           FROM unnest(%s::text[], %s::bigint[]) AS r(code, rows_written)
+           WHERE l.job_id = %s AND l.code = r.code AND l.lease_owner = %s""",
+        (codes, [int(rows_by_code[code]) for code in codes], job_id, owner)
+    )
+    return cursor.rowcount
+
+
+def fail_units(cursor, job_id, owner, errors_by_code):
+    """把本主机领取的单元标记为失败并记录原因，尝试次数未用尽时会被重新领取"""
+    if not errors_by_code:
+        return 0
+    codes = list(errors_by_code)
+    cursor.execute(
+        """UPDATE crawl_job_ledger AS l
+           SET status = 'failed', error = r.error,
+               duration_seconds = EXTRACT(EPOCH FROM NOW() - l.leased_at),
+               lease_expires = NULL, update_time = NOW()
+           FROM unnest(%s::text[], %s::text[]) AS r(code, error)
+           WHERE l.job_id = %s AND l.code = r.code AND l.lease_owner = %s""",
+        (codes, [str(errors_by_code[code])[:1000] for code in codes], job_id, owner)
+    )
+    return cursor.rowcount
+
+
+def job_status(cursor, job_id):
+    """按状态汇总任务进度，返回 {状态: (单元数, 写入行数)}"""
+    cursor.execute(
+        """SELECT status, COUNT(*), COALESCE(SUM(rows_written), 0)
+           FROM crawl_job_ledger WHERE job_id = %s GROUP BY status""",
+        (job_id,)
+    )
+    return {status: (count, rows) for status, count, rows in cursor.fetchall()}
+
+
+def print_status(status, job_id):
+    if not status:
+        print(f"任务 {job_id} 不存在")
+        return
+    total = sum(count for count, _ in status.values())
+    print(f"===== 回补任务 {job_id}：共 {total} 个单元 =====")
+    for name in ['done', 'running', 'pending', 'failed']:
+        count, rows = status.get(name, (0, 0))
+        print(f"{name:<8} {count:>8} 个单元  {rows:>14,} 行")
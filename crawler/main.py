@@ -0,0 +1,206 @@
+"""
+股票数据抓取主入口
+单次运行：按市场和操作类型执行一次抓取
+定时运行（--schedule）：常驻进程，按SCHEDULE_CONFIG和各交易所的交易日历定时抓取，
+    所有任务共享一个线程池，同一个任务上一轮未结束时跳过本轮，不会重叠执行
+用法：
+    python main.py --market cn --action codes
+    python main.py --market us --action prices
+    python main.py --schedule
+"""
+import argparse
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import SCHEDULE_CONFIG, SPOT_BAR_CONFIG
+from trading_calendar import is_market_open, daily_update_due
+
+MARKETS = ['cn', 'hk', 'us']
+
+MARKET_NAMES = {'cn': 'A股', 'hk': '港股', 'us': '美股', 'all': '全部市场'}
+
+# 各市场各类任务对应的模块和入口函数
+MARKET_JOBS = {
+    'cn': {
+        'codes': ('stock_cn_code', 'main'),
+        'minute': ('stock_cn_trade_minute', 'crawl_cn_minute'),
+        'daily': ('stock_cn_trade_day', 'crawl_cn_daily'),
+        'spot': ('stock_cn_realtime', 'poll_cn_spot')
+    },
+    'hk': {
+        'codes': ('stock_hk_code', 'main'),
+        'minute': ('stock_hk_trade_minute', 'crawl_hk_minute'),
+        'daily': ('stock_hk_trade_day', 'crawl_hk_daily')
+    },
+    'us': {
+        'codes': ('stock_us_code', 'main'),
+        'minute': ('stock_us_trade_minute', 'crawl_us_minute'),
+        'daily': ('stock_us_trade_day', 'crawl_us_daily')
+    }
+}
+
+# 各操作类型包含的任务
+ACTION_JOBS = {
+    'codes': ['codes'],
+    'prices': ['minute', 'daily'],
+    'both': ['codes', 'minute', 'daily']
+}
+
+
+def get_job_function(market, job):
+    """导入任务所在模块并返回入口函数，模块在进程内只导入一次"""
+    module_name, function_name = MARKET_JOBS[market][job]
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+
+def run_job(market, job):
+    """执行一次抓取任务"""
+    name = f"{MARKET_NAMES[market]}-{job}"
+    print(f"开始执行任务 {name}: {datetime.now()}")
+    start = time.monotonic()
+    try:
+        get_job_function(market, job)()
+        print(f"✅ 任务 {name} 执行完成，耗时 {time.monotonic() - start:.1f} 秒")
+        return True
+    except Exception as e:
+        print(f"❌ 任务 {name} 执行失败: {e}")
+        return False
+
+
+class JobRunner:
+    """
+    共享线程池的任务执行器
+    每个任务有一把锁，上一轮还在运行时本轮直接跳过；
+    线程池大小不小于任务数，慢任务最多占用一个线程，不会挤占其他市场的任务
+    """
+
+    def __init__(self, job_count, max_workers=None):
+        max_workers = max(max_workers or 0, job_count)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        print(f"定时任务线程池大小: {max_workers}")
+
+    def _get_lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def submit(self, market, job, func=None):
+        """
+        提交任务到线程池
+        参数：
+            func: 实际执行的函数，默认执行run_job(market, job)
+        返回：是否已提交（上一轮未结束时返回False）
+        """
+        lock = self._get_lock((market, job))
+        if not lock.acquire(blocking=False):
+            print(f"⚠️ 任务 {MARKET_NAMES[market]}-{job} 上一轮尚未结束，跳过本轮")
+            return False
+
+        def wrapper():
+            try:
+                if func is None:
+                    run_job(market, job)
+                else:
+                    func()
+            finally:
+                lock.release()
+
+        self.executor.submit(wrapper)
+        return True
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_once(markets, action):
+    """单次执行：按市场依次执行指定的任务"""
+    for market in markets:
+        for job in ACTION_JOBS[action]:
+            run_job(market, job)
+
+
+def start_scheduler(markets, action):
+    """启动常驻定时任务"""
+    import schedule
+    from partition_manager import run_maintenance
+
+    jobs = ACTION_JOBS[action]
+    # 各市场的任务加上每天一次的分区维护任务
+    runner = JobRunner(len(markets) * len(jobs) + 1, SCHEDULE_CONFIG['max_workers'])
+    # 各市场已抓取日K线的交易日，避免同一交易日重复抓取
+    daily_done = {}
+
+    # 启用全市场快照时，A股分钟数据由快照生成，不再按代码逐个请求
+    def minute_job(market):
+        return 'spot' if market == 'cn' and SPOT_BAR_CONFIG['enabled'] else 'minute'
+
+    # 启动时导入全部任务模块，常驻进程只承担一次akshare/yfinance的导入开销
+    for market in markets:
+        for job in jobs:
+            get_job_function(market, minute_job(market) if job == 'minute' else job)
+
+    def minute_tick(market):
+        if is_market_open(market):
+            runner.submit(market, minute_job(market))
+
+    def daily_tick(market):
+        day = daily_update_due(market)
+        if day is None or daily_done.get(market) == day:
+            return
+
+        def run_daily():
+            if run_job(market, 'daily'):
+                daily_done[market] = day
+
+        runner.submit(market, 'daily', run_daily)
+
+    for market in markets:
+        if 'codes' in jobs:
+            schedule.every(SCHEDULE_CONFIG['codes_update_interval']).hours.do(runner.submit, market, 'codes')
+            # 启动时先更新一次股票代码
+            runner.submit(market, 'codes')
+        if 'minute' in jobs and minute_job(market) == 'spot':
+            schedule.every(SPOT_BAR_CONFIG['poll_interval']).seconds.do(minute_tick, market)
+        elif 'minute' in jobs:
+            schedule.every(SCHEDULE_CONFIG['price_update_interval']).minutes.do(minute_tick, market)
+        if 'daily' in jobs:
+            schedule.every(5).minutes.do(daily_tick, market)
+            daily_tick(market)
+
+    # 每天创建未来月份的分区并归档过期分区
+    schedule.every().day.at(SCHEDULE_CONFIG['maintenance_time']).do(runner.submit, 'all', 'partitions', run_maintenance)
+    runner.submit('all', 'partitions', run_maintenance)
+
+    print(f"定时任务已启动: 市场 {', '.join(markets)}，任务 {', '.join(jobs)}")
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("收到中断信号，停止定时任务")
+    finally:
+        runner.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='股票数据抓取主入口')
+    parser.add_argument('--market', choices=MARKETS + ['all'], default='all', help='指定要获取数据的市场')
+    parser.add_argument('--action', choices=list(ACTION_JOBS), default='both', help='指定要执行的操作')
+    parser.add_argument('--schedule', action='store_true', help='是否启动定时任务')
+    args = parser.parse_args()
+
+    markets = MARKETS if args.market == 'all' else [args.market]
+    if args.schedule and SCHEDULE_CONFIG['enable_schedule']:
+        start_scheduler(markets, args.action)
+    else:
+        if args.schedule:
+            print("⚠️ config.py中未启用定时任务，只执行一次")
+        run_once(markets, args.action)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+行情数据标准化模块
+将akshare/yfinance返回的各种列名、时间格式统一为固定类型的OHLCV DataFrame：
+    code(str), datetime(datetime64[ns]), open/high/low/close(float64), volume(int64)
+全部操作按列向量化完成，不再逐行处理空值
+"""
+from datetime import datetime
+import pandas as pd
+
+OUTPUT_COLUMNS = ['code', 'datetime', 'open', 'high', 'low', 'close', 'volume']
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+# 统一的列名映射表：标准字段 -> 候选列名（按优先级排列，取第一个存在的列）
+COLUMN_MAP = {
+    'datetime': ['day', 'date', 'datetime', 'Datetime', 'Date', 'time', 'timestamp', '时间', '日期时间', '日期'],
+    'open': ['open', 'Open', '开盘', '今开'],
+    'high': ['high', 'High', '最高'],
+    'low': ['low', 'Low', '最低'],
+    'close': ['close', 'Close', '收盘', '最新价', '最新'],
+    'volume': ['volume', 'Volume', '成交量']
+}
+
+# 字符串时间的候选格式，按数据源检测一次后缓存
+DATETIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y%m%d%H%M%S',
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+    '%Y%m%d'
+]
+
+# 数据源 -> 检测到的时间格式
+_format_cache = {}
+
+
+def _detect_format(sample):
+    """根据一个样本值检测时间格式，无法识别时返回None"""
+    for fmt in DATETIME_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
+
+def parse_datetime(values, source):
+    """
+    将时间列解析为datetime64
+    字符串时间按数据源缓存格式，只在第一次（或格式变化导致解析失败时）检测格式，
+    之后每次调用都是一次按固定格式的向量化解析
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.to_datetime(values)
+
+    non_null = values.dropna()
+    if non_null.empty:
+        return pd.to_datetime(values, errors='coerce')
+
+    sample = non_null.iloc[0]
+    if not isinstance(sample, str):
+        # date/datetime对象或时间戳数字，直接转换
+        return pd.to_datetime(values, errors='coerce')
+
+    # 个别无法解析的脏数据会被置为NaT后删除，大部分能解析即认为格式正确
+    min_parsed = len(non_null) * 0.9
+
+    fmt = _format_cache.get(source)
+    if fmt is not None:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        if parsed.notna().sum() >= min_parsed:
+            return parsed
+
+    fmt = _detect_format(sample.strip())
+    if fmt is not None:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        if parsed.notna().sum() >= min_parsed:
+            _format_cache[source] = fmt
+            return parsed
+
+    # 格式不统一时退回自动解析
+    _format_cache.pop(source, None)
+    return pd.to_datetime(values, errors='coerce', format='mixed')
+
+
+def _flatten_columns(df):
+    """处理yfinance返回的多层列：单个代码时去掉代码层"""
+    if isinstance(df.columns, pd.MultiIndex):
+        levels = [set(df.columns.get_level_values(i)) for i in range(df.columns.nlevels)]
+        price_level = next((i for i, level in enumerate(levels) if level & {'Close', 'Open'}), 0)
+        df = df.droplevel([i for i in range(df.columns.nlevels) if i != price_level], axis=1)
+    return df
+
+
+def _pick_column(df, field):
+    """按COLUMN_MAP的优先级取出标准字段对应的列，不存在时返回None"""
+    for col in COLUMN_MAP[field]:
+        if col in df.columns:
+            column = df[col]
+            # 重名列（二维）取第一列
+            if isinstance(column, pd.DataFrame):
+                column = column.iloc[:, 0]
+            return column
+    return None
+
+
+def _to_float(column):
+    """将一列转换为float64，整列可直接转换时走快速路径，含脏数据时逐个转换并置为NaN"""
+    values = pd.Series(column.array)
+    try:
+        return values.astype('float64')
+    except (ValueError, TypeError):
+        return pd.to_numeric(values, errors='coerce').astype('float64')
+
+
+def normalize_ohlcv(df, code, source, date_only=False, tz=None, fill_na=True):
+    """
+    将原始行情数据标准化为固定列和固定类型的DataFrame
+    参数：
+        df: akshare或yfinance返回的原始DataFrame
+        code: 保存到数据库的股票代码
+        source: 数据源标识（如 akshare_cn_minute），用于缓存时间格式
+        date_only: True时只保留日期部分（日K线）
+        tz: 交易所时区，带时区的时间先转换到该时区，再去掉时区信息保存当地时间
+        fill_na: True时价格空值填0，False时保留为空（写入数据库为NULL）
+    返回：标准化后的DataFrame，缺少时间列或收盘价时返回None
+    """
+    if df is None or df.empty:
+        return None
+
+    df = _flatten_columns(df)
+
+    # yfinance的时间在索引中，akshare的时间在列中
+    if isinstance(df.index, pd.DatetimeIndex):
+        times = pd.Series(df.index.array)
+    else:
+        times = _pick_column(df, 'datetime')
+        if times is None:
+            return None
+        times = pd.Series(times.array)
+    close = _pick_column(df, 'close')
+    if close is None:
+        return None
+
+    parsed = parse_datetime(times, source)
+    if parsed.dt.tz is not None:
+        if tz is not None:
+            parsed = parsed.dt.tz_convert(tz)
+        parsed = parsed.dt.tz_localize(None)
+    if date_only:
+        parsed = parsed.dt.normalize()
+
+    result = pd.DataFrame({'code': code, 'datetime': parsed.astype('datetime64[ns]')})
+    for field in PRICE_COLUMNS:
+        column = close if field == 'close' else _pick_column(df, field)
+        if column is None:
+            values = pd.Series(float('nan'), index=result.index)
+        else:
+            values = _to_float(column)
+        result[field] = values.fillna(0.0) if fill_na else values
+
+    volume = _pick_column(df, 'volume')
+    if volume is None:
+        result['volume'] = 0
+    else:
+        result['volume'] = _to_float(volume).fillna(0).astype('int64')
+
+    # 删除无效的时间记录
+    invalid = result['datetime'].isna()
+    if invalid.any():
+        result = result[~invalid].reset_index(drop=True)
+    return result
@@ -0,0 +1,240 @@
+"""
+分钟数据表分区管理模块
+*_data_realtime 表按datetime做月分区（分区名 {表名}_pYYYYMM），另有一个默认分区接收没有对应月分区的数据：
+    migrate: 把原来的普通表迁移为分区表（一次性操作）
+    ensure:  创建当前月到未来premake_months个月的分区，默认分区中已有的对应月份数据会移入新分区
+    archive: 分离超过retention_months个月的分区，导出为归档文件（见archive.py）后删除
+用法：
+    python partition_manager.py --action migrate
+    python partition_manager.py              # ensure + archive，定时任务每天执行一次
+"""
+import argparse
+import gzip
+import os
+import re
+from datetime import date
+from sqlalchemy import create_engine
+from config import DB_CONFIG, FILE_CONFIG, PARTITION_CONFIG
+
+
+def add_months(month, n):
+    """返回month（某月1日）之后第n个月的1日，n可以为负数"""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(cursor, table):
+    """判断表是否为分区表，表不存在时返回None"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (table,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0] == 'p'
+
+
+def list_partitions(cursor, table):
+    """返回表的全部月分区：[(分区名, 月份1日), ...]，按月份排序，不含默认分区"""
+    cursor.execute(
+        """SELECT c.relname FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = %s::regclass""",
+        (table,)
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def create_partition(cursor, table, month):
+    """
+    创建一个月分区，已存在时跳过
+    默认分区中有该月数据时，先分离默认分区，创建新分区后把数据移入，再重新挂载默认分区
+    返回：是否新建了分区
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", (name,))
+    if cursor.fetchone():
+        return False
+
+    start, end = month, add_months(month, 1)
+    default = f"{table}_default"
+    cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", (default,))
+    has_default = cursor.fetchone() is not None
+    moved = False
+    if has_default:
+        cursor.execute(f"SELECT 1 FROM {default} WHERE datetime >= %s AND datetime < %s LIMIT 1", (start, end))
+        moved = cursor.fetchone() is not None
+
+    if moved:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    if moved:
+        cursor.execute(
+            f"""WITH moved AS (
+                    DELETE FROM {default} WHERE datetime >= %s AND datetime < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved""",
+            (start, end)
+        )
+        print(f"已将默认分区中的 {cursor.rowcount} 行移入 {name}")
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+    print(f"✅ 已创建分区 {name}")
+    return True
+
+
+def ensure_partitions(cursor, table, start_month=None, months_ahead=None):
+    """
+    创建默认分区，以及从start_month（默认当前月）到未来months_ahead个月的分区
+    返回：新建的月分区数，表不是分区表时返回0
+    """
+    if not is_partitioned(cursor, table):
+        print(f"⚠️ {table} 不是分区表，请先执行 python partition_manager.py --action migrate")
+        return 0
+    if months_ahead is None:
+        months_ahead = PARTITION_CONFIG['premake_months']
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    current = date.today().replace(day=1)
+    month = start_month or current
+    last = add_months(current, months_ahead)
+    created = 0
+    while month <= last:
+        if create_partition(cursor, table, month):
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(cursor, table, name, month, archive_dir=None, drop=None):
+    """
+    分离一个分区并导出归档文件
+    安装了pyarrow时导出为Arrow IPC文件（见archive.py），否则导出为 {archive_dir}/{table}/{分区名}.csv.gz
+    参数：
+        month: 分区对应的月份1日
+        drop: 导出后是否删除分区表，默认取PARTITION_CONFIG
+    返回：归档文件路径
+    """
+    archive_dir = archive_dir or FILE_CONFIG['archive_dir']
+    drop = PARTITION_CONFIG['drop_after_archive'] if drop is None else drop
+
+    cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+    try:
+        from archive import export_month, table_market
+        path, _ = export_month(cursor, name, table_market(table), month, archive_dir)
+    except ImportError:
+        target_dir = os.path.join(archive_dir, table)
+        os.makedirs(target_dir, exist_ok=True)
+        path = os.path.join(target_dir, f"{name}.csv.gz")
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    if drop:
+        cursor.execute(f"DROP TABLE {name}")
+    print(f"✅ 已归档分区 {name} -> {path}")
+    return path
+
+
+def archive_old_partitions(cursor, table, retention_months=None, archive_dir=None):
+    """归档超过保留月数的分区，返回归档文件路径列表"""
+    if retention_months is None:
+        retention_months = PARTITION_CONFIG['retention_months']
+    if not retention_months:
+        return []
+    cutoff = add_months(date.today().replace(day=1), -retention_months)
+    return [
+        archive_partition(cursor, table, name, month, archive_dir)
+        for name, month in list_partitions(cursor, table)
+        if month < cutoff
+    ]
+
+
+def migrate_table(cursor, table):
+    """
+    把普通表迁移为按月分区的表（在调用方的事务中执行）
+    原表改名为 {table}_legacy，数据按月写入新分区后删除原表
+    返回：是否执行了迁移
+    """
+    partitioned = is_partitioned(cursor, table)
+    if partitioned is None or partitioned:
+        print(f"{table} 不存在或已是分区表，跳过迁移")
+        return False
+
+    legacy = f"{table}_legacy"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cursor.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey")
+    cursor.execute(
+        f"""CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS, PRIMARY KEY (code, datetime))
+            PARTITION BY RANGE (datetime)"""
+    )
+
+    cursor.execute(f"SELECT MIN(datetime) FROM {legacy}")
+    first = cursor.fetchone()[0]
+    start_month = first.date().replace(day=1) if first else None
+    ensure_partitions(cursor, table, start_month)
+
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+    print(f"已迁移 {cursor.rowcount} 行到分区表 {table}")
+    cursor.execute(f"DROP TABLE {legacy}")
+    return True
+
+
+def run_with_cursor(engine, func, *args):
+    """在单独事务中执行func(cursor, *args)"""
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        try:
+            result = func(cursor, *args)
+        finally:
+            cursor.close()
+        raw_conn.commit()
+        return result
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+
+def create_db_engine():
+    db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+    return create_engine(db_url)
+
+
+def run_maintenance(engine=None, tables=None):
+    """定期维护：为每个表创建未来的分区并归档过期分区"""
+    engine = engine or create_db_engine()
+    for table in tables or PARTITION_CONFIG['tables']:
+        try:
+            run_with_cursor(engine, ensure_partitions, table)
+            run_with_cursor(engine, archive_old_partitions, table)
+        except Exception as e:
+            print(f"❌ 维护分区表 {table} 失败: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分钟数据表分区管理')
+    parser.add_argument('--action', choices=['migrate', 'ensure', 'archive', 'all'], default='all',
+                        help='migrate: 迁移为分区表；ensure: 创建未来分区；archive: 归档过期分区；all: ensure + archive')
+    parser.add_argument('--tables', nargs='*', help='要处理的表，默认取PARTITION_CONFIG')
+    args = parser.parse_args()
+
+    engine = create_db_engine()
+    tables = args.tables or PARTITION_CONFIG['tables']
+
+    if args.action == 'all':
+        run_maintenance(engine, tables)
+        return
+    func = {'migrate': migrate_table, 'ensure': ensure_partitions, 'archive': archive_old_partitions}[args.action]
+    for table in tables:
+        run_with_cursor(engine, func, table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+分钟数据聚合模块
+维护 {market}_data_5m / _15m / _60m / _1d 聚合表：
+    分钟数据通过bulk_writer写入时，在同一事务中根据暂存表找出受影响的 (代码, 时间桶)，
+    只重新计算这些桶；每一级由上一级聚合而来（1m -> 5m -> 15m -> 60m -> 1d）
+聚合语义：开盘取桶内第一根、最高取最大、最低取最小、收盘取最后一根、成交量求和
+用法（全量重建已有数据的聚合表）：
+    python rollup.py --market cn
+"""
+import argparse
+from sqlalchemy import create_engine
+from config import DB_CONFIG, ROLLUP_CONFIG
+
+
+def rollup_table(market, level):
+    """返回聚合表名，如 cn_data_5m"""
+    return f"{market}_data_{level}"
+
+
+def bucket_expr(column, seconds):
+    """按桶大小向下取整时间的SQL表达式（时间为交易所当地时间，日线桶即自然日）"""
+    return f"TIMESTAMP 'epoch' + floor(extract(epoch FROM {column}) / {seconds}) * {seconds} * INTERVAL '1 second'"
+
+
+def _aggregate_sql(source, target, seconds, touched=None):
+    """
+    生成从source聚合到target的 INSERT ... ON CONFLICT 语句
+    参数：
+        touched: 受影响桶的子查询（列为code、bucket），为空时全量聚合
+    """
+    if touched:
+        from_clause = f"""{source} AS s
+            JOIN ({touched}) AS t
+              ON s.code = t.code
+             AND s.datetime >= t.bucket
+             AND s.datetime < t.bucket + INTERVAL '{seconds} seconds'"""
+        bucket = "t.bucket"
+    else:
+        from_clause = f"{source} AS s"
+        bucket = bucket_expr('s.datetime', seconds)
+
+    return f"""
+        INSERT INTO {target} (code, datetime, open, high, low, close, volume, update_time)
+        SELECT s.code, {bucket},
+               (array_agg(s.open ORDER BY s.datetime ASC))[1],
+               MAX(s.high),
+               MIN(s.low),
+               (array_agg(s.close ORDER BY s.datetime DESC))[1],
+               SUM(s.volume),
+               NOW()
+        FROM {from_clause}
+        GROUP BY s.code, {bucket}
+        ON CONFLICT (code, datetime) DO UPDATE
+        SET open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            volume = EXCLUDED.volume,
+            update_time = NOW()
+    """
+
+
+def refresh_rollups(cursor, table, staging):
+    """
+    根据暂存表中新写入的分钟数据，增量更新该市场的各级聚合表
+    参数：
+        cursor: 与分钟数据写入相同事务的psycopg2游标
+        table: 分钟数据表名，不在ROLLUP_CONFIG['sources']中时不做处理
+        staging: 本批次数据的暂存表名（列包含code、datetime）
+    返回：更新的聚合行数
+    """
+    market = ROLLUP_CONFIG['sources'].get(table)
+    if not ROLLUP_CONFIG['enabled'] or market is None:
+        return 0
+
+    rows = 0
+    source = table
+    for level, seconds in ROLLUP_CONFIG['levels']:
+        target = rollup_table(market, level)
+        touched = f"SELECT DISTINCT code, {bucket_expr('datetime', seconds)} AS bucket FROM {staging}"
+        cursor.execute(_aggregate_sql(source, target, seconds, touched))
+        rows += cursor.rowcount
+        source = target
+    return rows
+
+
+def rebuild_rollups(engine, market):
+    """全量重建某个市场的各级聚合表（用于已有历史数据的首次初始化）"""
+    source = next(table for table, m in ROLLUP_CONFIG['sources'].items() if m == market)
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        for level, seconds in ROLLUP_CONFIG['levels']:
+            target = rollup_table(market, level)
+            cursor.execute(_aggregate_sql(source, target, seconds))
+            print(f"✅ {target} 聚合完成，共 {cursor.rowcount} 行")
+            raw_conn.commit()
+            source = target
+        cursor.close()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全量重建分钟数据聚合表')
+    parser.add_argument('--market', choices=['cn', 'hk', 'us', 'all'], default='all', help='指定市场')
+    args = parser.parse_args()
+
+    db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+    engine = create_engine(db_url)
+    markets = ['cn', 'hk', 'us'] if args.market == 'all' else [args.market]
+    for market in markets:
+        rebuild_rollups(engine, market)
+
+
+if __name__ == "__main__":
+    main()
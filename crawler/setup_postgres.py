@@ -118,6 +118,16 @@ def init_postgres():
         except Exception as e:
             print(f"读取或执行init.sql文件失败: {e}")
 
+        # 为分钟数据分区表创建默认分区和当前及未来几个月的月分区
+        try:
+            from partition_manager import ensure_partitions
+            from config import PARTITION_CONFIG
+            for table in PARTITION_CONFIG['tables']:
+                ensure_partitions(cur, table)
+            print("成功创建分钟数据表的分区")
+        except Exception as e:
+            print(f"创建分钟数据表分区失败: {e}")
+
         cur.close()
         conn.close()
         
@@ -1,9 +1,11 @@
 import akshare as ak
 from sqlalchemy import create_engine
 from config import DB_CONFIG, FILE_CONFIG
+from fetch_cache import cached_fetch, FetchCacheMiss
+from symbol_sync import sync_symbols
+from fetch_control import call, CircuitOpenError, is_html_error
 import pandas as pd
 from datetime import datetime
-import time
 import os
 import sys
 
@@ -23,16 +25,13 @@ def create_db_engine():
         return None
 
 
-def get_cn_stocks(max_retries=3, retry_interval=2):
+def get_cn_stocks(max_retries=None):
     """
     获取A股所有股票的基本信息，包含重试机制和上市公司过滤
     参数：
-        max_retries: 最大重试次数
-        retry_interval: 重试间隔（秒）
+        max_retries: 最大重试次数，默认取FETCH_CONTROL_CONFIG，重试间隔按指数退避计算
     返回：股票信息DataFrame或None
     """
-    retry_count = 0
-    
     # 确保股票代码CSV文件夹存在
     data_dir = FILE_CONFIG['stock_codes_dir']
     if not os.path.exists(data_dir):
@@ -40,48 +39,48 @@ def get_cn_stocks(max_retries=3, retry_interval=2):
     
     csv_file = os.path.join(data_dir, 'A_shares_stock_codes.csv')
     
-    while retry_count < max_retries:
-        try:
-            print(f"正在使用stock_zh_a_spot获取A股股票数据... (尝试 {retry_count+1}/{max_retries})")
-            stock_list = ak.stock_zh_a_spot()
-            
-            if stock_list is not None and not stock_list.empty:
-                print(f"成功获取A股股票数据，共{len(stock_list)}条记录")
-                
-                # 添加市场标识，取code的前两位
-                stock_list['market'] = stock_list['代码'].str[:2]
-                
-                # 添加更新时间
-                stock_list['update_time'] = datetime.now()
-                
-                # 过滤只保留上市公司数据（排除退市和即将上市的股票）
-                # 支持多种代码格式：
-                # 1. API返回的原始格式：纯数字代码（如600000, 000001）
-                # 2. 带市场前缀的格式：sh（上海）、sz（深圳）、bj（北京）开头+数字
-                # 使用更全面的正则表达式匹配
-                listed_stocks = stock_list[stock_list['代码'].str.match(r'^(sh|sz|bj)?[0-9]{6}$')]
-                
-                # 检查过滤后的结果
-                if not listed_stocks.empty:
-                    print(f"成功过滤出上市公司数据，共{len(listed_stocks)}条记录")
-                    return listed_stocks
-                else:
-                    print("过滤后没有符合条件的上市公司数据")
-            else:
-                print("stock_zh_a_spot返回空数据")
-        except Exception as e:
-            error_msg = str(e)[:100]
-            if '<' in error_msg:  # 检测HTML标签特征
-                print(f"stock_zh_a_spot调用失败: 返回了HTML内容而非JSON数据，可能是网络问题或API限流...")
-            else:
-                print(f"stock_zh_a_spot调用失败: {error_msg}...")
-        
-        # 调用失败，等待一段时间后重试
-        retry_count += 1
-        if retry_count < max_retries:
-            print(f"API调用失败，{retry_interval}秒后重试...")
-            time.sleep(retry_interval)
-        
+    try:
+        print(f"正在使用stock_zh_a_spot获取A股股票数据...")
+        stock_list = cached_fetch('akshare', 'stock_zh_a_spot', 'spot', lambda: call('akshare-sina', ak.stock_zh_a_spot, max_retries=max_retries))
+    except FetchCacheMiss as e:
+        print(f"{e}，跳过API调用")
+        stock_list = None
+    except CircuitOpenError as e:
+        print(f"stock_zh_a_spot调用失败: {e}")
+        stock_list = None
+    except Exception as e:
+        error_msg = str(e)[:100]
+        if is_html_error(e):
+            print(f"stock_zh_a_spot调用失败: 返回了HTML内容而非JSON数据，可能是网络问题或API限流...")
+        else:
+            print(f"stock_zh_a_spot调用失败: {error_msg}...")
+        stock_list = None
+
+    if stock_list is not None and not stock_list.empty:
+        print(f"成功获取A股股票数据，共{len(stock_list)}条记录")
+
+        # 添加市场标识，取code的前两位
+        stock_list['market'] = stock_list['代码'].str[:2]
+
+        # 添加更新时间
+        stock_list['update_time'] = datetime.now()
+
+        # 过滤只保留上市公司数据（排除退市和即将上市的股票）
+        # 支持多种代码格式：
+        # 1. API返回的原始格式：纯数字代码（如600000, 000001）
+        # 2. 带市场前缀的格式：sh（上海）、sz（深圳）、bj（北京）开头+数字
+        # 使用更全面的正则表达式匹配
+        listed_stocks = stock_list[stock_list['代码'].str.match(r'^(sh|sz|bj)?[0-9]{6}$')]
+
+        # 检查过滤后的结果
+        if not listed_stocks.empty:
+            print(f"成功过滤出上市公司数据，共{len(listed_stocks)}条记录")
+            return listed_stocks
+        else:
+            print("过滤后没有符合条件的上市公司数据")
+    elif stock_list is not None:
+        print("stock_zh_a_spot返回空数据")
+
     # 所有重试都失败，尝试读取本地CSV文件作为备份
     print("API调用失败，尝试读取本地备份CSV文件...")
     try:
@@ -152,9 +151,8 @@ def save_to_database(stock_list, engine):
         # 只保留存在的列
         existing_columns = [col for col in columns_to_save if col in stock_data.columns]
         
-        # 保存到数据库，使用replace模式覆盖数据，确保根据code的唯一性更新
-        stock_data[existing_columns].to_sql('cn_stocks', engine, if_exists='replace', index=False)
-        print(f"成功保存{len(stock_data)}条股票数据到数据库表: cn_stocks")
+        # 与当前代码表比较，只写入新上市、退市和名称变化的代码，并记录变更
+        sync_symbols(engine, 'cn', stock_data[existing_columns])
     except Exception as e:
         print(f"保存数据到数据库失败: {e}")
 
@@ -0,0 +1,199 @@
+"""
+A股全市场快照实时行情
+ak.stock_zh_a_spot() 一次请求返回全市场的最新价、日内最高最低价和累计成交量，
+按固定间隔轮询快照，由相邻两次快照推算每个代码的1分钟K线，每轮一次性批量写入cn_data_realtime，
+替代按代码逐个请求stock_zh_a_minute：
+    - 成交量：本次累计成交量 - 上次累计成交量，累计成交量增加时才生成或更新K线
+    - 开盘/收盘价：该分钟内第一次/最后一次快照的最新价
+    - 最高/最低价：该分钟内快照最新价的最大/最小值；两次快照之间日内最高（最低）价被刷新时，计入新的最高（最低）价
+    - K线时间：按快照时间戳向上取整到分钟（与新浪分钟数据一致，09:31表示09:30~09:31），
+      收盘后1分钟内的快照（收盘集合竞价）计入最后一根K线，其他非交易时段的快照只更新累计成交量
+说明：
+    启动后第一次快照只作为基准，第一根K线的成交量不完整；轮询间隔越短，开高低收越接近逐笔数据
+用法：
+    python stock_cn_realtime.py              # 交易时段内按SPOT_BAR_CONFIG['poll_interval']轮询
+    python stock_cn_realtime.py --once       # 只抓取一次快照
+"""
+import argparse
+import threading
+import time
+import akshare as ak
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from config import DB_CONFIG, MARKET_SESSIONS, SPOT_BAR_CONFIG
+from bulk_writer import bulk_upsert
+from fetch_control import call
+from trading_calendar import is_market_open, market_now
+
+# 创建数据库连接引擎
+db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+engine = create_engine(db_url)
+
+# 每个代码保存的状态：上次快照的累计成交量和日内最高最低价，以及当前K线
+BAR_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+STATE_COLUMNS = ['cum_volume', 'day_high', 'day_low'] + BAR_COLUMNS
+
+
+def _parse_clock(value):
+    hour, minute = value.split(':')
+    return pd.Timedelta(hours=int(hour), minutes=int(minute))
+
+
+def parse_snapshot(spot, now):
+    """
+    整理stock_zh_a_spot的返回结果
+    返回：以代码（去掉市场前缀）为索引的DataFrame，列为price、cum_volume、day_high、day_low、quote_time（距当天零点的时间）
+    """
+    snapshot = pd.DataFrame({
+        'code': spot['代码'].astype(str).str.replace(r'^(sh|sz|bj)', '', regex=True),
+        'price': pd.to_numeric(spot['最新价'], errors='coerce'),
+        'cum_volume': pd.to_numeric(spot['成交量'], errors='coerce'),
+        'day_high': pd.to_numeric(spot['最高'], errors='coerce'),
+        'day_low': pd.to_numeric(spot['最低'], errors='coerce'),
+    })
+    now_clock = now - now.normalize()
+    if '时间戳' in spot.columns:
+        snapshot['quote_time'] = pd.to_timedelta(spot['时间戳'].astype(str), errors='coerce').fillna(now_clock)
+    else:
+        snapshot['quote_time'] = now_clock
+    # 停牌（最新价为0）和数据不完整的代码跳过
+    valid = (snapshot['price'] > 0) & snapshot['cum_volume'].notna()
+    snapshot = snapshot[valid].drop_duplicates('code', keep='last')
+    return snapshot.set_index('code')
+
+
+class SpotBarBuilder:
+    """由连续的全市场快照生成1分钟K线，状态保存在内存中，换日时清空"""
+
+    def __init__(self, sessions):
+        self.sessions = [(_parse_clock(start), _parse_clock(end)) for start, end in sessions]
+        self.day = None
+        self.state = pd.DataFrame(columns=STATE_COLUMNS)
+
+    def bar_times(self, day, quote_time):
+        """快照时间对应的K线时间，非交易时段为NaT"""
+        label = quote_time.dt.ceil('min')
+        result = pd.Series(pd.NaT, index=quote_time.index, dtype='datetime64[ns]')
+        for start, end in self.sessions:
+            inside = (label > start) & (label <= end + pd.Timedelta(minutes=1))
+            result[inside] = day + label[inside].clip(upper=end)
+        return result
+
+    def update(self, spot, now):
+        """
+        处理一次快照
+        参数：
+            spot: stock_zh_a_spot的返回结果
+            now: 交易所当地的当前时间（带时区），用于确定日期；快照没有时间戳时作为快照时间
+        返回：本次有成交的代码的当前K线（code, datetime, open, high, low, close, volume）
+        """
+        now = now.tz_localize(None) if now.tzinfo is not None else now
+        day = now.normalize()
+        if self.day != day:
+            self.day = day
+            self.state = pd.DataFrame(columns=STATE_COLUMNS)
+
+        snapshot = parse_snapshot(spot, now)
+        snapshot['datetime'] = self.bar_times(day, snapshot['quote_time'])
+        prev = self.state.reindex(snapshot.index)
+        for column in STATE_COLUMNS:
+            prev[column] = pd.to_numeric(prev[column]) if column != 'datetime' else pd.to_datetime(prev[column])
+
+        delta = snapshot['cum_volume'] - prev['cum_volume']
+        traded = (delta > 0) & snapshot['datetime'].notna()
+        same_bar = traded & (prev['datetime'] == snapshot['datetime'])
+        price = snapshot['price'].to_numpy()
+        # 两次快照之间被刷新的日内最高/最低价
+        high_hit = snapshot['day_high'].where(snapshot['day_high'] > prev['day_high']).to_numpy()
+        low_hit = snapshot['day_low'].where(snapshot['day_low'] < prev['day_low']).to_numpy()
+
+        same = same_bar.to_numpy()
+        bars = pd.DataFrame({
+            'datetime': snapshot['datetime'],
+            'open': np.where(same, prev['open'], price),
+            'high': np.fmax(np.fmax(np.where(same, prev['high'], price), price), high_hit),
+            'low': np.fmin(np.fmin(np.where(same, prev['low'], price), price), low_hit),
+            'close': price,
+            'volume': np.where(same, prev['volume'] + delta, delta),
+        }, index=snapshot.index)
+
+        # 有成交的代码换成新的K线，其他代码保留当前K线，累计成交量和日内最高最低价都更新为本次快照
+        current = prev[BAR_COLUMNS].copy()
+        current[traded] = bars[traded]
+        current['cum_volume'] = snapshot['cum_volume']
+        current['day_high'] = snapshot['day_high']
+        current['day_low'] = snapshot['day_low']
+        # 本次快照中缺失的代码（如分页请求失败）保留原状态
+        missing = self.state.drop(index=snapshot.index, errors='ignore')
+        self.state = pd.concat([missing, current[STATE_COLUMNS]]) if not missing.empty else current[STATE_COLUMNS]
+
+        result = bars[traded].rename_axis('code').reset_index()
+        result['volume'] = result['volume'].astype('int64')
+        return result[['code'] + BAR_COLUMNS]
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def get_builder():
+    """进程内共享的K线生成器"""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = SpotBarBuilder(MARKET_SESSIONS['cn']['sessions'])
+        return _builder
+
+
+def poll_cn_spot():
+    """
+    抓取一次全市场快照，把有成交的代码的当前分钟K线一次性写入cn_data_realtime
+    返回：写入的行数
+    说明：
+        快照必须是最新数据，不经过请求缓存（fetch_cache）
+    """
+    start = time.monotonic()
+    spot = call('akshare-sina', ak.stock_zh_a_spot)
+    if spot is None or spot.empty:
+        print("⚠️ A股快照为空")
+        return 0
+    builder = get_builder()
+    with _builder_lock:
+        bars = builder.update(spot, market_now('cn'))
+    rows = bulk_upsert(engine, bars, 'cn_data_realtime') if not bars.empty else 0
+    print(f"✅ A股快照 {len(spot)} 个代码，{len(bars)} 个代码有成交，写入 {rows} 行，耗时 {time.monotonic() - start:.1f} 秒")
+    return rows
+
+
+def run_forever(interval=None):
+    """交易时段内按固定间隔轮询快照，每轮开始时间对齐到间隔"""
+    interval = interval or SPOT_BAR_CONFIG['poll_interval']
+    print(f"开始轮询A股快照，间隔 {interval} 秒")
+    while True:
+        start = time.monotonic()
+        if is_market_open('cn'):
+            try:
+                poll_cn_spot()
+            except Exception as e:
+                print(f"❌ A股快照处理失败: {str(e)[:200]}")
+        time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='轮询A股全市场快照生成分钟K线')
+    parser.add_argument('--once', action='store_true', help='只抓取一次快照')
+    parser.add_argument('--interval', type=int, help='轮询间隔（秒），默认取SPOT_BAR_CONFIG')
+    args = parser.parse_args()
+
+    if args.once:
+        poll_cn_spot()
+        return
+    try:
+        run_forever(args.interval)
+    except KeyboardInterrupt:
+        print("收到中断信号，停止轮询")
+
+
+if __name__ == "__main__":
+    main()
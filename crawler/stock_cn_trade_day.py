@@ -1,224 +1,141 @@
 import akshare as ak
 import pandas as pd
 import pytz
-from sqlalchemy import create_engine, text
-from config import DB_CONFIG
-import time
+from sqlalchemy import create_engine
+from config import DB_CONFIG, CRAWL_CONFIG, INCREMENTAL_CONFIG
+from bulk_writer import bulk_upsert
+from normalize import normalize_ohlcv
+from crawl_runner import load_universe
+from async_crawler import run_pipeline
+from fetch_cache import cached_fetch, FetchCacheMiss
+from fetch_control import call, CircuitOpenError
+from incremental import adjust_prices, get_incremental_start, load_high_water_marks
+import argparse
 from datetime import datetime, timedelta
 
-# 创建数据库连接引擎
+# 创建数据库连接引擎，连接池大小与并发线程数匹配
 db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-engine = create_engine(db_url)
-
-def get_cn_daily_data(stock_code, max_retries=3, retry_interval=2):
-    """通过akshare的stock_zh_a_daily方法获取A股日K线数据，增加重试机制"""
-    retry_count = 0
-    while retry_count <= max_retries:
-        try:
-            # 直接使用传入的代码，不再添加市场前缀
-            if retry_count == 0:
-                print(f"正在获取 {stock_code} 的日K线数据...")
-            elif retry_count > 0:
-                print(f"重试获取 {stock_code} 数据 ({retry_count}/{max_retries})")
-            
-            # 计算过去1年的日期范围
-            end_date = datetime.now().strftime('%Y%m%d')
-            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
-            
-            # 调用akshare获取日K线数据
-            data = ak.stock_zh_a_daily(symbol=stock_code, start_date=start_date, end_date=end_date, adjust="qfq")
-
-            if data.empty:
-                print(f"数据为空，请检查代码是否正确或市场是否交易")
-                return None
-
-            return data
-        except Exception as e:
-            retry_count += 1
-            if retry_count <= max_retries:
-                print(f"❌ 获取 {stock_code} 日K线数据失败: {str(e)[:200]}，将在 {retry_interval} 秒后重试 ({retry_count}/{max_retries})")
-                time.sleep(retry_interval)
-            else:
-                print(f"❌ 获取 {stock_code} 日K线数据失败: {str(e)[:200]}，已达到最大重试次数")
-                import traceback
-                traceback.print_exc()
-                return None
+engine = create_engine(db_url, pool_size=CRAWL_CONFIG['max_workers'], max_overflow=CRAWL_CONFIG['max_workers'])
+
+def get_cn_daily_data(stock_code, start_date=None, end_date=None):
+    """
+    通过akshare的stock_zh_a_daily方法获取A股日K线数据
+    start_date为空时获取过去1年的数据，否则只获取start_date至今的数据（增量模式）
+    end_date（date，包含）为空时取到今天，指定时用于回补历史区间（见backfill.py）
+    限速、失败重试和熔断由fetch_control统一处理
+    """
+    print(f"正在获取 {stock_code} 的日K线数据...")
+
+    # 计算日期范围，默认为过去1年
+    end_date = (end_date or datetime.now()).strftime('%Y%m%d')
+    if start_date is None:
+        fetch_start = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
+    else:
+        fetch_start = start_date.strftime('%Y%m%d')
+
+    # 增量模式下取不复权价格，否则取前复权价格（见incremental.adjust_prices）
+    adjust = 'qfq' if adjust_prices() else ''
+
+    try:
+        # 调用akshare获取日K线数据，结果按代码和日期区间缓存
+        data = cached_fetch(
+            'akshare', stock_code, '1d',
+            lambda: call('akshare-sina', ak.stock_zh_a_daily, symbol=stock_code,
+                         start_date=fetch_start, end_date=end_date, adjust=adjust),
+            start=fetch_start, end=end_date, adjust=adjust
+        )
+    except (FetchCacheMiss, CircuitOpenError) as e:
+        print(f"❌ 获取 {stock_code} 日K线数据失败: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ 获取 {stock_code} 日K线数据失败: {str(e)[:200]}，已达到最大重试次数")
+        import traceback
+        traceback.print_exc()
+        return None
+
+    if data.empty:
+        print(f"数据为空，请检查代码是否正确或市场是否交易")
+        return None
+    return data
+
+def prepare_data(code, df):
+    """统一列名、时间格式和数值类型，代码去掉市场前缀，返回待写入的DataFrame或None"""
+    if df is None or df.empty:
+        return None
+    return normalize_ohlcv(df, clean_cn_code(code), 'akshare_cn_day', date_only=True)
+
+def write_data(code, df_save):
+    """写入数据库：COPY到临时表后一次性合并到目标表，返回是否成功"""
+    try:
+        rows = bulk_upsert(engine, df_save, 'cn_data_day')
+        print(f"{clean_cn_code(code)} 日K线数据已写入数据库, 共 {rows} 行")
+        return True
+    except Exception:
+        return False
 
 def save_to_db(df: pd.DataFrame, code: str):
     """保存A股日K线数据到PostgreSQL，使用code+datetime作为主键"""
     if df.empty:
         print("数据为空，跳过保存")
         return False
-
-    # 确保时间索引正确处理
-    if isinstance(df.index, pd.DatetimeIndex):
-        # 先创建一个datetime列
-        df = df.reset_index()
-        # 重命名index列为datetime
-        if 'index' in df.columns:
-            df = df.rename(columns={'index': 'datetime'})
-
-    # 统一字段名
-    rename_dict = {}
-    
-    # 检查是否有day列并优先使用
-    if 'day' in df.columns:
-        rename_dict['day'] = 'datetime'
-    elif 'date' in df.columns:
-        rename_dict['date'] = 'datetime'
-    else:
-        # 查找其他可能的时间列
-        time_columns = ['datetime', 'time', 'Datetime', '时间', '日期时间']
-        for col in time_columns:
-            if col in df.columns:
-                rename_dict[col] = 'datetime'
-                break
-
-    # 如果还是没有时间列，添加一个
-    if not rename_dict:
-        df['datetime'] = pd.Timestamp.now()
-    else:
-        # 应用重命名
-        df = df.rename(columns=rename_dict)
-
-    # 映射价格相关列名
-    chinese_to_english = {
-        '开盘': 'open',
-        '今开': 'open',
-        '最高': 'high',
-        '最低': 'low',
-        '收盘': 'close',
-        '最新价': 'close',
-        '成交量': 'volume',
-        '成交额': 'amount'
-    }
-    for chinese_col, english_col in chinese_to_english.items():
-        if chinese_col in df.columns:
-            rename_dict[chinese_col] = english_col
-
-    # 应用重命名
-    df = df.rename(columns=rename_dict)
-    
-    # 去掉股票代码前缀
-    clean_code = code.lstrip('sh').lstrip('sz').lstrip('bj')
-    df["code"] = clean_code
-
-    # 检查关键字段
-    required_columns = ["code", "datetime", "open", "high", "low", "close", "volume"]
-    if "datetime" not in df.columns or "close" not in df.columns:
+    df_save = prepare_data(code, df)
+    if df_save is None:
         return False
+    return write_data(code, df_save)
 
-    # 确保datetime字段类型正确且只保留日期部分
-    if 'datetime' in df.columns:
-        try:
-            if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-                # 尝试多种格式解析时间
-                formats = ['%Y/%m/%d', '%Y-%m-%d', '%Y%m%d']
-                parsed = False
-                for fmt in formats:
-                    try:
-                        df['datetime'] = pd.to_datetime(df['datetime'], format=fmt)
-                        parsed = True
-                        break
-                    except ValueError:
-                        continue
-                
-                if not parsed:
-                    # 最后尝试自动解析
-                    df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                    
-            # 只保留日期部分，去掉时间部分
-            df['datetime'] = df['datetime'].dt.date
-                
-        except Exception:
-            return False
-
-    # 确保数值字段类型正确
-    numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-    for col in numeric_columns:
-        if col in df.columns:
-            try:
-                if col == 'volume':
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-                else:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            except Exception:
-                # 发生转换错误时，设置默认值
-                if col == 'volume':
-                    df[col] = 0
-                else:
-                    df[col] = 0.0
-
-    # 数据清洗：删除无效的时间记录
-    if 'datetime' in df.columns:
-        df = df.dropna(subset=['datetime'])
-
-    # 选择需要保存的字段
-    save_columns = [col for col in required_columns if col in df.columns]
-    df_save = df[save_columns].copy()
-
-    # 写入数据库
-    try:
-        with engine.connect() as conn:
-            # 构建插入SQL
-            columns_str = ', '.join(df_save.columns)
-            placeholders = ', '.join([f':{col}' for col in df_save.columns])
-            insert_sql = text(
-                f"""INSERT INTO cn_data_day ({columns_str}, update_time)
-                   VALUES ({placeholders}, NOW())
-                   ON CONFLICT (code, datetime) DO UPDATE
-                   SET open = EXCLUDED.open,
-                       high = EXCLUDED.high,
-                       low = EXCLUDED.low,
-                       close = EXCLUDED.close,
-                       volume = EXCLUDED.volume,
-                       update_time = NOW()
-                """)
-            
-            data_to_insert = df_save.to_dict(orient='records')
-            batch_size = 1000  # 批量插入大小
-            total_rows = len(data_to_insert)
-            
-            # 分批插入数据
-            for i in range(0, total_rows, batch_size):
-                batch = data_to_insert[i:i+batch_size]
-                for row in batch:
-                    # 处理可能的空值
-                    row_with_defaults = {}
-                    for key, value in row.items():
-                        if value is None or (isinstance(value, float) and pd.isna(value)):
-                            if key == 'volume':
-                                row_with_defaults[key] = 0
-                            elif key in ['open', 'high', 'low', 'close']:
-                                row_with_defaults[key] = 0.0
-                            else:
-                                row_with_defaults[key] = ''
-                        else:
-                            row_with_defaults[key] = value
-                    conn.execute(insert_sql, row_with_defaults)
-            
-            conn.commit()
-            print(f"{clean_code} 日K线数据已写入数据库, 共 {len(df)} 行")
-            return True
-    except Exception:
+def clean_cn_code(code):
+    """去掉股票代码的市场前缀，与数据库中保存的代码一致"""
+    return code.lstrip('sh').lstrip('sz').lstrip('bj')
+
+def fetch_code(stock_code, high_water_marks=None):
+    """按已有数据的最新日期增量获取单个代码的日K线数据"""
+    start_date = get_incremental_start(engine, 'cn_data_day', clean_cn_code(stock_code), high_water_marks)
+    return get_cn_daily_data(stock_code, start_date=start_date)
+
+def crawl_code(stock_code, high_water_marks=None):
+    """抓取并保存单个代码的日K线数据（按最新日期增量抓取），返回是否成功"""
+    daily_data = fetch_code(stock_code, high_water_marks)
+    if daily_data is None or daily_data.empty:
         return False
+    return save_to_db(daily_data, stock_code)
+
+def crawl_cn_daily(codes=None, max_workers=None, task_timeout=None):
+    """
+    抓取A股日K线数据，请求、整理和写库按流水线并行（见async_crawler.py）
+    参数：
+        codes: 股票代码列表（带市场前缀），为空时抓取cn_stocks中的全部代码
+        max_workers: 同时进行的请求数
+        task_timeout: 单个代码的超时时间（秒）
+    返回：CrawlSummary
+    """
+    if not codes:
+        codes = load_universe('cn', engine)
+
+    # 一次查询所有代码的最新日期，避免每个代码单独查询
+    high_water_marks = None
+    try:
+        high_water_marks = load_high_water_marks(engine, 'cn_data_day')
+    except Exception as e:
+        print(f"读取已有数据的最新日期失败: {str(e)[:100]}，改为逐个代码查询")
+
+    return run_pipeline(codes, lambda code: fetch_code(code, high_water_marks), prepare_data, write_data,
+                        name='A股日K线', fetch_workers=max_workers, task_timeout=task_timeout)
 
 def main():
-    """主函数：获取A股日K线数据并保存"""
-    
-    # 测试示例：贵州茅台，直接使用带市场前缀的代码
-    stock_code = "sh600519"
-    
-    # 获取日K线数据
-    daily_data = get_cn_daily_data(stock_code)
-    
-    if daily_data is not None and not daily_data.empty:
-        # 保存到数据库
-        save_result = save_to_db(daily_data, stock_code)
-        if not save_result:
-            print("数据保存失败")
-    else:
-        print("未能获取到有效日K线数据")
+    """主函数：并发获取A股日K线数据并保存"""
+    parser = argparse.ArgumentParser(description='获取A股日K线数据')
+    parser.add_argument('--codes', nargs='*', help='股票代码（带市场前缀，如sh600519），默认抓取全部A股')
+    parser.add_argument('--workers', type=int, default=CRAWL_CONFIG['max_workers'], help='同时进行的请求数')
+    parser.add_argument('--timeout', type=int, default=CRAWL_CONFIG['task_timeout'], help='单个代码的超时时间（秒）')
+    parser.add_argument('--full', action='store_true', help='忽略已有数据，重新抓取过去1年的全部数据')
+    args = parser.parse_args()
+
+    if args.full:
+        INCREMENTAL_CONFIG['enabled'] = False
+
+    summary = crawl_cn_daily(args.codes, args.workers, args.timeout)
+    if summary.failed or summary.timed_out:
+        print("⚠️ 部分A股日K线数据获取失败，请检查日志")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
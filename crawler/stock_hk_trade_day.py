@@ -2,16 +2,27 @@ import pandas as pd
 import yfinance as yf
 import time
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from config import DB_CONFIG
+from bulk_writer import bulk_upsert
+from normalize import normalize_ohlcv
+from incremental import adjust_prices, get_incremental_start, load_high_water_marks
+from crawl_runner import load_universe, CrawlSummary
+from yf_batch import download_batches
+from fetch_control import call, backoff
+from trading_calendar import market_now
+import argparse
 from datetime import datetime, timedelta
 
 # 创建数据库连接引擎
 db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 engine = create_engine(db_url)
 
-def get_hk_daily_data(stock_code, max_retries=5, retry_interval=3):
-    """获取港股日K线数据，支持增强的重试机制和错误处理"""
+def get_hk_daily_data(stock_code, max_retries=5, start_date=None):
+    """
+    获取港股日K线数据，支持增强的重试机制和错误处理
+    start_date为空时获取过去1年的数据，否则只获取start_date至今的数据（增量模式）
+    """
     retry_count = 0
     # 尝试不同的股票代码格式
     code_formats = [
@@ -20,6 +31,13 @@ def get_hk_daily_data(stock_code, max_retries=5, retry_interval=3):
         f"{stock_code[1:]}"      # 去掉前导0和后缀: 0700
     ]
     
+    # 计算日期范围，默认为过去1年
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    else:
+        start_date = start_date.strftime('%Y-%m-%d')
+    
     while retry_count <= max_retries:
         try:
             # 循环尝试不同的代码格式
@@ -31,38 +49,40 @@ def get_hk_daily_data(stock_code, max_retries=5, retry_interval=3):
             elif retry_count > 0:
                 print(f"重试获取港股 {stock_code} 数据 ({retry_count}/{max_retries})")
                 print(f"尝试代码格式: {current_code}")
-                time.sleep(retry_interval)
-            
-            # 计算过去1年的日期范围
-            end_date = datetime.now().strftime('%Y-%m-%d')
-            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+                # 轮换代码格式重试，等待时间按yfinance数据源的指数退避计算
+                backoff('yfinance', retry_count - 1)
             
             # 获取日K线数据，添加更多选项以解决时区问题
             try:
                 # 尝试多种参数组合
                 if retry_count % 2 == 0:
                     # 第一种参数组合
-                    data = yf.download(
+                    data = call(
+                        'yfinance', yf.download,
                         current_code,
                         start=start_date,
                         end=end_date,
                         interval='1d',
-                        auto_adjust=True,
+                        auto_adjust=adjust_prices(),
                         threads=False,
-                        progress=False
+                        progress=False,
+                        max_retries=0
                     )
                 else:
                     # 第二种参数组合
-                    data = yf.download(
+                    data = call(
+                        'yfinance', yf.download,
                         current_code,
                         start=start_date,
                         end=end_date,
                         interval='1d',
+                        auto_adjust=adjust_prices(),
                         actions=False,
                         group_by='ticker',
                         threads=False,
                         ignore_tz=True,
-                        progress=False
+                        progress=False,
+                        max_retries=0
                     )
                 
                 # 检查数据是否为空
@@ -70,7 +90,8 @@ def get_hk_daily_data(stock_code, max_retries=5, retry_interval=3):
                     # 再尝试一种获取方式 - 使用Ticker对象
                     print(f"尝试使用Ticker对象获取数据")
                     ticker = yf.Ticker(current_code)
-                    data = ticker.history(start=start_date, end=end_date, interval='1d')
+                    data = call('yfinance', ticker.history, start=start_date, end=end_date, interval='1d',
+                                auto_adjust=adjust_prices(), max_retries=0)
             except Exception as e:
                 print(f"数据获取失败: {e}")
                 # 直接创建模拟数据
@@ -153,8 +174,7 @@ def get_hk_daily_data(stock_code, max_retries=5, retry_interval=3):
                     return mock_data
             
             if retry_count <= max_retries:
-                print(f"❌ 获取港股 {stock_code} 日K线数据失败: {error_msg[:150]}，将在 {retry_interval} 秒后重试")
-                time.sleep(retry_interval)
+                print(f"❌ 获取港股 {stock_code} 日K线数据失败: {error_msg[:150]}，稍后重试")
             else:
                 print(f"❌ 获取港股 {stock_code} 日K线数据失败: {error_msg[:150]}，已达到最大重试次数")
                 # 最后尝试生成模拟数据
@@ -214,181 +234,119 @@ def save_to_db(df: pd.DataFrame, code: str):
         print(f"⚠️ 港股 {code} 数据为空，跳过")
         return False
 
-    # 确保时间索引正确处理
-    if isinstance(df.index, pd.DatetimeIndex):
-        # 先创建一个datetime列
-        df = df.reset_index()
-        # 重命名index列为datetime
-        if 'index' in df.columns:
-            df = df.rename(columns={'index': 'datetime'})
-    
-    # 统一字段名
-    rename_dict = {}
-    time_columns = ['datetime', 'date', 'time', 'Datetime', 'day', '时间', '日期时间']
-    for col in time_columns:
-        if col in df.columns:
-            rename_dict[col] = 'datetime'
-            break
-    
-    # 如果还是没有datetime列，添加一个
-    if 'datetime' not in df.columns:
-        print(f"⚠️ 港股 {code} 没有找到时间列，使用当前时间")
-        df['datetime'] = pd.Timestamp.now()
-    
-    # 映射价格相关列名
-    if '收盘' in df.columns:
-        rename_dict['收盘'] = 'close'
-    elif '最新价' in df.columns:
-        rename_dict['最新价'] = 'close'
-    elif '最新' in df.columns:
-        rename_dict['最新'] = 'close'
-    elif 'Close' in df.columns:
-        rename_dict['Close'] = 'close'
-    
-    # yfinance标准字段映射
-    yfinance_columns = {
-        'Open': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Volume': 'volume'
-    }
-    for yf_col, standard_col in yfinance_columns.items():
-        if yf_col in df.columns:
-            rename_dict[yf_col] = standard_col
-    
-    # 中文字段映射
-    chinese_to_english = {
-        '开盘': 'open',
-        '今开': 'open',
-        '最高': 'high',
-        '最低': 'low',
-        '成交量': 'volume',
-        '成交额': 'amount'
-    }
-    for chinese_col, english_col in chinese_to_english.items():
-        if chinese_col in df.columns:
-            rename_dict[chinese_col] = english_col
-    
-    # 应用重命名
-    df = df.rename(columns=rename_dict)
-    df["code"] = code
-
-    # 检查关键字段
-    required_columns = ["code", "datetime", "open", "high", "low", "close", "volume"]
-    if "datetime" not in df.columns or "close" not in df.columns:
-        print(f"⚠️ 港股 {code} 缺少关键字段，无法保存")
+    # 统一列名、时间格式和数值类型
+    df_save = normalize_ohlcv(df, code, 'yfinance_hk_day', date_only=True, tz='Asia/Shanghai')
+    if df_save is None:
+        print(f"⚠️ 港股 {code} 缺少时间列或收盘价，无法保存")
         return False
-    
-    # 确保datetime字段类型正确且只保留日期部分
-    if 'datetime' in df.columns:
-        try:
-            if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-                df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                if df['datetime'].isna().any():
-                    df['datetime'] = pd.to_datetime(df['datetime'], format='%Y/%m/%d', errors='coerce')
-            
-            # 只保留日期部分，去掉时间部分
-            df['datetime'] = df['datetime'].dt.date
-        except Exception as e:
-            print(f"⚠️ 港股 {code} 解析datetime字段失败: {e}")
-            return False
-    
-    # 确保数值字段类型正确 - 增强版，处理二维数据
-    numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-    for col in numeric_columns:
-        if col in df.columns:
-            try:
-                # 检查数据类型，如果不是Series，尝试转换
-                if not isinstance(df[col], pd.Series):
-                    # 处理可能的元组或其他非标准类型
-                    df[col] = pd.Series(df[col])
-                
-                # 检查是否为二维数据
-                if hasattr(df[col].values, 'shape') and len(df[col].values.shape) > 1:
-                    # 如果是二维数据，尝试转换为一维
-                    if df[col].values.shape[1] == 1:
-                        df[col] = pd.Series(df[col].values.ravel())
-                    else:
-                        # 取第一列
-                        df[col] = pd.Series([x[0] if isinstance(x, (list, tuple, np.ndarray)) else x for x in df[col].values])
-                
-                if col == 'volume':
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-                else:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            except Exception as e:
-                print(f"⚠️ 港股 {code} 转换字段 {col} 失败: {e}")
-                # 发生转换错误时，设置默认值
-                if col == 'volume':
-                    df[col] = 0
-                else:
-                    df[col] = 0.0
-    
-    # 选择需要保存的字段
-    save_columns = [col for col in required_columns if col in df.columns]
-    df_save = df[save_columns].copy()
-    
-    # 写入数据库
+
+    # 写入数据库：COPY到临时表后一次性合并到目标表
     try:
-        with engine.connect() as conn:
-            columns_str = ', '.join(df_save.columns)
-            placeholders = ', '.join([f':{col}' for col in df_save.columns])
-            insert_sql = text(
-                f"""INSERT INTO hk_data_day ({columns_str}, update_time)
-                   VALUES ({placeholders}, NOW())
-                   ON CONFLICT (code, datetime) DO UPDATE
-                   SET open = EXCLUDED.open,
-                       high = EXCLUDED.high,
-                       low = EXCLUDED.low,
-                       close = EXCLUDED.close,
-                       volume = EXCLUDED.volume,
-                       update_time = NOW()
-                """)
-            
-            data_to_insert = df_save.to_dict(orient='records')
-            batch_size = 1000
-            total_rows = len(data_to_insert)
-            
-            for i in range(0, total_rows, batch_size):
-                batch = data_to_insert[i:i+batch_size]
-                for row in batch:
-                    row_with_defaults = {}
-                    for key, value in row.items():
-                        if value is None or (isinstance(value, float) and pd.isna(value)):
-                            if key == 'volume':
-                                row_with_defaults[key] = 0
-                            elif key in ['open', 'high', 'low', 'close']:
-                                row_with_defaults[key] = 0.0
-                            else:
-                                row_with_defaults[key] = ''
-                        else:
-                            row_with_defaults[key] = value
-                    conn.execute(insert_sql, row_with_defaults)
-            
-            conn.commit()
-            print(f"✅ 港股{code} 日K线数据已写入数据库, 共 {len(df)} 行")
-            return True
+        rows = bulk_upsert(engine, df_save, 'hk_data_day')
+        print(f"✅ 港股{code} 日K线数据已写入数据库, 共 {rows} 行")
+        return True
     except Exception as e:
         print(f"❌ 保存港股{code} 日K线数据失败: {e}")
         return False
 
+def get_hk_daily_data_batch(stock_codes, start_date=None, end_date=None):
+    """
+    批量获取多个港股的日K线数据，每次yf.download请求一批代码
+    参数：
+        stock_codes: 港股代码列表，如 ['00700', '09988']
+        start_date: 起始日期（date），为空时获取过去1年的数据
+        end_date: 结束日期（date，包含），为空时取到今天
+    返回：生成器，逐个产出 (stock_code, DataFrame)，DataFrame可直接传给save_to_db
+    """
+    # yfinance的end不包含当天，结束日期往后加一天；未指定时取到港股当地的今天
+    if end_date is None:
+        end_date = market_now('hk').date()
+    end_date = end_date + timedelta(days=1)
+    end_date = end_date.strftime('%Y-%m-%d')
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    else:
+        start_date = start_date.strftime('%Y-%m-%d')
+
+    # yfinance代码格式：去掉前导0，00700 -> 0700.HK
+    ticker_to_code = {f"{code[1:]}.HK": code for code in stock_codes}
+    for ticker, data in download_batches(list(ticker_to_code), start=start_date, end=end_date, interval='1d',
+                                         auto_adjust=adjust_prices()):
+        code = ticker_to_code.get(ticker)
+        if code is None:
+            continue
+        # 带时区的索引转换为北京时间，日线默认返回不带时区的交易日期，直接使用
+        if data.index.tz is not None:
+            data.index = data.index.tz_convert('Asia/Shanghai')
+        yield code, data
+
+def crawl_hk_daily(codes=None):
+    """
+    批量抓取港股日K线数据并保存
+    按已有数据的最新日期分组，同一起始日期的代码合并下载
+    参数：
+        codes: 港股代码列表，为空时抓取hk_stocks中的全部代码
+    返回：CrawlSummary
+    """
+    if not codes:
+        codes = load_universe('hk', engine)
+    summary = CrawlSummary('港股日K线')
+
+    try:
+        high_water_marks = load_high_water_marks(engine, 'hk_data_day')
+    except Exception as e:
+        print(f"读取已有数据的最新日期失败: {str(e)[:100]}，按全量区间抓取")
+        high_water_marks = {}
+
+    groups = {}
+    for code in codes:
+        start_date = get_incremental_start(engine, 'hk_data_day', code, high_water_marks)
+        groups.setdefault(start_date, []).append(code)
+
+    for start_date, group_codes in groups.items():
+        for code, data in get_hk_daily_data_batch(group_codes, start_date):
+            if save_to_db(data, code):
+                summary.succeeded.append(code)
+            else:
+                summary.failed[code] = '保存失败'
+
+    finished = set(summary.succeeded) | set(summary.failed)
+    for code in codes:
+        if code not in finished:
+            summary.failed[code] = '未获取到数据'
+
+    summary.elapsed = time.monotonic() - summary.start_time
+    summary.print_summary()
+    return summary
+
 def main():
     """主函数：获取港股日K线数据并保存"""
+    parser = argparse.ArgumentParser(description='获取港股日K线数据')
+    parser.add_argument('--codes', nargs='*', help='港股代码（如00700），默认抓取全部港股')
+    parser.add_argument('--single', action='store_true', help='逐个代码下载（失败时重试并生成模拟数据），不使用批量下载')
+    args = parser.parse_args()
+
+    if not args.single:
+        print("开始批量获取港股日K线数据...")
+        summary = crawl_hk_daily(args.codes)
+        if summary.failed:
+            print("⚠️ 部分港股日K线数据获取失败，请检查日志")
+        return
+
     print("开始获取港股日K线数据...")
-    hk_stocks = ["00700"]  # 示例：腾讯控股
+    hk_stocks = args.codes or ["00700"]  # 示例：腾讯控股
     all_success = True
     
     for stock_code in hk_stocks:
-        data = get_hk_daily_data(stock_code)
+        # 按已有数据的最新日期增量抓取
+        start_date = get_incremental_start(engine, 'hk_data_day', stock_code)
+        data = get_hk_daily_data(stock_code, start_date=start_date)
         if data is not None:
             success = save_to_db(data, stock_code)
             if not success:
                 all_success = False
         else:
             all_success = False
-        
-        # 避免请求过于频繁
-        time.sleep(1)
     
     if all_success:
         print("✅ 成功获取港股日K线数据！")
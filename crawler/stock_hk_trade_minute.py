@@ -2,171 +2,36 @@ import pandas as pd
 import yfinance as yf
 import time
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from config import DB_CONFIG
+from bulk_writer import bulk_upsert
+from normalize import normalize_ohlcv
+from crawl_runner import load_universe, CrawlSummary
+from yf_batch import download_batches
+from fetch_control import call
+import argparse
 
 # 创建数据库连接引擎
 db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 engine = create_engine(db_url)
 
-import numpy as np
 def save_to_db(df: pd.DataFrame, code: str):
     """保存港股数据到PostgreSQL，使用code+datetime作为主键"""
     if df.empty:
         print(f"⚠️ {code} 数据为空，跳过")
         return False
 
-    # 确保时间索引正确处理
-    if isinstance(df.index, pd.DatetimeIndex):
-        # 先创建一个datetime列
-        df = df.reset_index()
-        # 重命名index列为datetime
-        if 'index' in df.columns:
-            df = df.rename(columns={'index': 'datetime'})
-    
-    # 统一字段名
-    rename_dict = {}
-    time_columns = ['datetime', 'date', 'time', 'Datetime', 'day', '时间', '日期时间']
-    for col in time_columns:
-        if col in df.columns:
-            rename_dict[col] = 'datetime'
-            break
-    
-    # 如果还是没有datetime列，添加一个
-    if 'datetime' not in df.columns:
-        print(f"⚠️ {code} 没有找到时间列，使用当前时间")
-        df['datetime'] = pd.Timestamp.now()
-    
-    # 映射价格相关列名
-    if '收盘' in df.columns:
-        rename_dict['收盘'] = 'close'
-    elif '最新价' in df.columns:
-        rename_dict['最新价'] = 'close'
-    elif '最新' in df.columns:
-        rename_dict['最新'] = 'close'
-    elif 'Close' in df.columns:
-        rename_dict['Close'] = 'close'
-    
-    # yfinance标准字段映射
-    yfinance_columns = {
-        'Open': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Volume': 'volume'
-    }
-    for yf_col, standard_col in yfinance_columns.items():
-        if yf_col in df.columns:
-            rename_dict[yf_col] = standard_col
-    
-    # 中文字段映射
-    chinese_to_english = {
-        '开盘': 'open',
-        '今开': 'open',
-        '最高': 'high',
-        '最低': 'low',
-        '成交量': 'volume',
-        '成交额': 'amount'
-    }
-    for chinese_col, english_col in chinese_to_english.items():
-        if chinese_col in df.columns:
-            rename_dict[chinese_col] = english_col
-    
-    # 应用重命名
-    df = df.rename(columns=rename_dict)
-    df["code"] = code
-
-    # 检查关键字段
-    required_columns = ["code", "datetime", "open", "high", "low", "close", "volume"]
-    if "datetime" not in df.columns or "close" not in df.columns:
-        print(f"⚠️ {code} 缺少关键字段，无法保存")
+    # 统一列名、时间格式和数值类型
+    df_save = normalize_ohlcv(df, code, 'yfinance_hk_minute', tz='Asia/Shanghai')
+    if df_save is None:
+        print(f"⚠️ {code} 缺少时间列或收盘价，无法保存")
         return False
-    
-    # 确保datetime字段类型正确
-    if 'datetime' in df.columns:
-        try:
-            if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-                df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                if df['datetime'].isna().any():
-                    df['datetime'] = pd.to_datetime(df['datetime'], format='%Y/%m/%d %H:%M:%S', errors='coerce')
-        except Exception as e:
-            print(f"⚠️ {code} 解析datetime字段失败: {e}")
-            return False
-    
-    # 确保数值字段类型正确 - 增强版，处理二维数据
-    numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-    for col in numeric_columns:
-        if col in df.columns:
-            try:
-                # 检查数据类型，如果不是Series，尝试转换
-                if not isinstance(df[col], pd.Series):
-                    # 处理可能的元组或其他非标准类型
-                    df[col] = pd.Series(df[col])
-                
-                # 检查是否为二维数据
-                if hasattr(df[col].values, 'shape') and len(df[col].values.shape) > 1:
-                    # 如果是二维数据，尝试转换为一维
-                    if df[col].values.shape[1] == 1:
-                        df[col] = pd.Series(df[col].values.ravel())
-                    else:
-                        # 取第一列
-                        df[col] = pd.Series([x[0] if isinstance(x, (list, tuple, np.ndarray)) else x for x in df[col].values])
-                
-                if col == 'volume':
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-                else:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            except Exception as e:
-                print(f"⚠️ {code} 转换字段 {col} 失败: {e}")
-                # 发生转换错误时，设置默认值
-                if col == 'volume':
-                    df[col] = 0
-                else:
-                    df[col] = 0.0
-    
-    # 选择需要保存的字段
-    save_columns = [col for col in required_columns if col in df.columns]
-    df_save = df[save_columns].copy()
-    
-    # 写入数据库
+
+    # 写入数据库：只把新增或变化的K线COPY到临时表后合并到目标表
     try:
-        with engine.connect() as conn:
-            columns_str = ', '.join(df_save.columns)
-            placeholders = ', '.join([f':{col}' for col in df_save.columns])
-            insert_sql = text(
-                f"""INSERT INTO hk_data_realtime ({columns_str}, update_time)
-                   VALUES ({placeholders}, NOW())
-                   ON CONFLICT (code, datetime) DO UPDATE
-                   SET open = EXCLUDED.open,
-                       high = EXCLUDED.high,
-                       low = EXCLUDED.low,
-                       close = EXCLUDED.close,
-                       volume = EXCLUDED.volume,
-                       update_time = NOW()
-                """)
-            
-            data_to_insert = df_save.to_dict(orient='records')
-            batch_size = 1000
-            total_rows = len(data_to_insert)
-            
-            for i in range(0, total_rows, batch_size):
-                batch = data_to_insert[i:i+batch_size]
-                for row in batch:
-                    row_with_defaults = {}
-                    for key, value in row.items():
-                        if value is None or (isinstance(value, float) and pd.isna(value)):
-                            if key == 'volume':
-                                row_with_defaults[key] = 0
-                            elif key in ['open', 'high', 'low', 'close']:
-                                row_with_defaults[key] = 0.0
-                            else:
-                                row_with_defaults[key] = ''
-                        else:
-                            row_with_defaults[key] = value
-                    conn.execute(insert_sql, row_with_defaults)
-            
-            conn.commit()
-            print(f"✅ 港股{code} 数据已写入数据库, 共 {len(df)} 行")
-            return True
+        rows = bulk_upsert(engine, df_save, 'hk_data_realtime', dedup=True)
+        print(f"✅ 港股{code} 数据已写入数据库, 共 {rows} 行")
+        return True
     except Exception as e:
         print(f"❌ 保存港股{code} 数据失败: {e}")
         return False
@@ -176,7 +41,7 @@ def get_hk_minute_data(stock_code):
     try:
         full_code = f"{stock_code[1:]}.HK"  # 去掉前导0，格式为0700.HK
         # 显式指定auto_adjust=True以避免FutureWarning
-        data = yf.download(full_code, period='1y', interval='1m', auto_adjust=True)
+        data = call('yfinance', yf.download, full_code, period='1y', interval='1m', auto_adjust=True)
         
         if data.empty:
             print(f"⚠️ 未能获取到 {stock_code} 的数据")
@@ -220,22 +85,73 @@ def get_hk_minute_data(stock_code):
         return None
 
 
+def get_hk_minute_data_batch(stock_codes, period='5d'):
+    """
+    批量获取多个港股的分钟级数据，每次yf.download请求一批代码
+    yfinance的1分钟数据只能获取最近几天，period默认取5天
+    返回：生成器，逐个产出 (stock_code, DataFrame)，DataFrame可直接传给save_to_db
+    """
+    # yfinance代码格式：去掉前导0，00700 -> 0700.HK
+    ticker_to_code = {f"{code[1:]}.HK": code for code in stock_codes}
+    # 盘中轮询，不读请求缓存
+    for ticker, data in download_batches(list(ticker_to_code), period=period, interval='1m', ttl=0):
+        code = ticker_to_code.get(ticker)
+        if code is None:
+            continue
+        # 转换时区为北京时间
+        data.index = data.index.tz_convert('Asia/Shanghai')
+        yield code, data
+
+
+def crawl_hk_minute(codes=None):
+    """
+    批量抓取港股分钟级数据并保存
+    参数：
+        codes: 港股代码列表，为空时抓取hk_stocks中的全部代码
+    返回：CrawlSummary
+    """
+    if not codes:
+        codes = load_universe('hk', engine)
+    summary = CrawlSummary('港股分钟数据')
+
+    # 批量下载，每次yf.download请求一批代码，再按代码拆分保存
+    for stock_code, data in get_hk_minute_data_batch(codes):
+        if save_to_db(data, stock_code):
+            summary.succeeded.append(stock_code)
+        else:
+            summary.failed[stock_code] = '保存失败'
+
+    finished = set(summary.succeeded) | set(summary.failed)
+    for stock_code in codes:
+        if stock_code not in finished:
+            summary.failed[stock_code] = '未获取到数据'
+
+    summary.elapsed = time.monotonic() - summary.start_time
+    summary.print_summary()
+    return summary
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='获取港股分钟级数据')
+    parser.add_argument('--codes', nargs='*', help='港股代码（如00700），默认抓取全部港股')
+    parser.add_argument('--single', action='store_true', help='逐个代码下载，不使用批量下载')
+    args = parser.parse_args()
+
     print("开始获取港股数据...")
-    hk_stocks = ["00700"]  # 示例：腾讯控股
     all_success = True
-    
-    for stock_code in hk_stocks:
-        data = get_hk_minute_data(stock_code)
-        if data is not None:
-            success = save_to_db(data, stock_code)
-            if not success:
+
+    if args.single:
+        for stock_code in args.codes or load_universe('hk', engine):
+            data = get_hk_minute_data(stock_code)
+            if data is not None:
+                success = save_to_db(data, stock_code)
+                if not success:
+                    all_success = False
+            else:
                 all_success = False
-        else:
-            all_success = False
-        
-        # 避免请求过于频繁
-        time.sleep(1)
+    else:
+        summary = crawl_hk_minute(args.codes)
+        all_success = not summary.failed
     
     if all_success:
         print("✅ 成功获取港股数据！")
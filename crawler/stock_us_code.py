@@ -1,9 +1,11 @@
 import akshare as ak
 from sqlalchemy import create_engine
 from config import DB_CONFIG, FILE_CONFIG
+from fetch_cache import cached_fetch, FetchCacheMiss
+from symbol_sync import sync_symbols
+from fetch_control import call, CircuitOpenError, is_html_error
 import pandas as pd
 from datetime import datetime
-import time
 import os
 import akshare as ak
 
@@ -24,62 +26,60 @@ def create_db_engine():
         return None
 
 
-def get_us_stocks(max_retries=3, retry_interval=2):
+def get_us_stocks(max_retries=None):
     """
     获取美股所有股票的基本信息，包含重试机制和上市公司过滤
     参数：
-        max_retries: 最大重试次数
-        retry_interval: 重试间隔（秒）
+        max_retries: 最大重试次数，默认取FETCH_CONTROL_CONFIG，重试间隔按指数退避计算
     返回：股票信息DataFrame或None
     """
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            print(f"正在使用stock_us_spot获取美股股票数据... (尝试 {retry_count+1}/{max_retries})")
-            stock_list = ak.stock_us_spot()
-            
-            if stock_list is not None and not stock_list.empty:
-                print(f"成功获取美股股票数据，共{len(stock_list)}条记录")
-                
-                # 添加更新时间
-                stock_list['update_time'] = datetime.now()
-                
-                # 过滤只保留上市公司数据（排除退市和即将上市的股票）
-                # 根据美股代码规则过滤：
-                # 美股主要交易所代码通常为1-5个字母
-                # 排除特殊代码和退市股票
-                listed_stocks = stock_list
-                
-                # 根据美股代码规则进行过滤
-                # 假设代码列名为'代码'或'symbol'
-                if '代码' in stock_list.columns:
-                    listed_stocks = stock_list[stock_list['代码'].str.match(r'^[A-Za-z]{1,5}$')]
-                elif 'symbol' in stock_list.columns:
-                    listed_stocks = stock_list[stock_list['symbol'].str.match(r'^[A-Za-z]{1,5}$')]
-                
-                # 检查过滤后的结果
-                if not listed_stocks.empty:
-                    print(f"成功过滤出上市公司数据，共{len(listed_stocks)}条记录")
-                    return listed_stocks
-                else:
-                    print("过滤后没有符合条件的上市公司数据")
-                    # 如果过滤后没有数据，返回原始数据
-                    return stock_list
-            else:
-                print("stock_us_spot返回空数据")
-        except Exception as e:
-            error_msg = str(e)
-            print(f"stock_us_spot调用失败: {error_msg[:100]}...")
-            # 检查是否返回HTML内容而非JSON数据
-            if '<' in error_msg:
-                print("警告: API返回了HTML内容而非JSON数据，可能是网站结构变化或访问限制导致")
-        
-        retry_count += 1
-        if retry_count < max_retries:
-            print(f"所有API调用失败，{retry_interval}秒后重试...")
-            time.sleep(retry_interval)
-        
+    try:
+        print(f"正在使用stock_us_spot获取美股股票数据...")
+        stock_list = cached_fetch('akshare', 'stock_us_spot', 'spot', lambda: call('akshare-sina', ak.stock_us_spot, max_retries=max_retries))
+    except FetchCacheMiss as e:
+        print(f"{e}，跳过API调用")
+        stock_list = None
+    except CircuitOpenError as e:
+        print(f"stock_us_spot调用失败: {e}")
+        stock_list = None
+    except Exception as e:
+        error_msg = str(e)[:100]
+        if is_html_error(e):
+            print(f"stock_us_spot调用失败: 返回了HTML内容而非JSON数据，可能是网络问题或API限流...")
+        else:
+            print(f"stock_us_spot调用失败: {error_msg}...")
+        stock_list = None
+
+    if stock_list is not None and not stock_list.empty:
+        print(f"成功获取美股股票数据，共{len(stock_list)}条记录")
+
+        # 添加更新时间
+        stock_list['update_time'] = datetime.now()
+
+        # 过滤只保留上市公司数据（排除退市和即将上市的股票）
+        # 根据美股代码规则过滤：
+        # 美股主要交易所代码通常为1-5个字母
+        # 排除特殊代码和退市股票
+        listed_stocks = stock_list
+
+        # 根据美股代码规则进行过滤
+        # 假设代码列名为'代码'或'symbol'
+        if '代码' in stock_list.columns:
+            listed_stocks = stock_list[stock_list['代码'].str.match(r'^[A-Za-z]{1,5}$')]
+        elif 'symbol' in stock_list.columns:
+            listed_stocks = stock_list[stock_list['symbol'].str.match(r'^[A-Za-z]{1,5}$')]
+
+        # 检查过滤后的结果
+        if not listed_stocks.empty:
+            print(f"成功过滤出上市公司数据，共{len(listed_stocks)}条记录")
+            return listed_stocks
+        else:
+            print("过滤后没有符合条件的上市公司数据")
+            # 如果过滤后没有数据，返回原始数据
+            return stock_list
+    elif stock_list is not None:
+        print("stock_us_spot返回空数据")
+
     # 所有重试都失败，尝试读取本地CSV文件作为备份
     print("所有API调用失败，尝试读取本地备份CSV文件...")
     try:
@@ -165,9 +165,8 @@ def save_to_database(stock_list, engine):
             existing_columns.append('name')
             print("警告: 缺少name列，使用空字符串填充")
         
-        # 保存到数据库，使用replace模式覆盖数据，确保根据code的唯一性更新
-        stock_data[existing_columns].to_sql('us_stocks', engine, if_exists='replace', index=False)
-        print(f"成功保存{len(stock_data)}条股票数据到数据库表: us_stocks")
+        # 与当前代码表比较，只写入新上市、退市和名称变化的代码，并记录变更
+        sync_symbols(engine, 'us', stock_data[existing_columns])
     except Exception as e:
         print(f"保存数据到数据库失败: {e}")
 
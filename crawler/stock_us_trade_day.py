@@ -1,7 +1,15 @@
 import pandas as pd
 import yfinance as yf
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from config import DB_CONFIG
+from bulk_writer import bulk_upsert
+from normalize import normalize_ohlcv
+from incremental import adjust_prices, get_incremental_start, load_high_water_marks
+from crawl_runner import load_universe, CrawlSummary
+from yf_batch import download_batches
+from fetch_control import call, backoff
+from trading_calendar import market_now
+import argparse
 from datetime import datetime, timedelta
 import time
 import numpy as np
@@ -58,8 +66,11 @@ def generate_mock_data(stock_code, start_date, end_date):
         print(f"❌ 生成模拟数据失败: {e}")
         return None
 
-def get_us_daily_data(stock_code, max_retries=5, retry_interval=3):
-    """获取美股日K线数据，支持增强的重试机制和错误处理"""
+def get_us_daily_data(stock_code, max_retries=5, start_date=None):
+    """
+    获取美股日K线数据，支持增强的重试机制和错误处理
+    start_date为空时获取过去1年的数据，否则只获取start_date至今的数据（增量模式）
+    """
     retry_count = 0
     # 尝试不同的股票代码格式
     code_formats = [
@@ -68,6 +79,13 @@ def get_us_daily_data(stock_code, max_retries=5, retry_interval=3):
         f"{stock_code}-NASDAQ",   # 交易所格式: AAPL-NASDAQ
     ]
     
+    # 计算日期范围，默认为过去1年
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    else:
+        start_date = start_date.strftime('%Y-%m-%d')
+    
     while retry_count <= max_retries:
         try:
             # 循环尝试不同的代码格式
@@ -79,38 +97,40 @@ def get_us_daily_data(stock_code, max_retries=5, retry_interval=3):
             elif retry_count > 0:
                 print(f"重试获取美股 {stock_code} 数据 ({retry_count}/{max_retries})")
                 print(f"尝试代码格式: {current_code}")
-                time.sleep(retry_interval)
-            
-            # 计算过去1年的日期范围
-            end_date = datetime.now().strftime('%Y-%m-%d')
-            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+                # 轮换代码格式重试，等待时间按yfinance数据源的指数退避计算
+                backoff('yfinance', retry_count - 1)
             
             # 获取日K线数据，添加更多选项以解决时区问题
             try:
                 # 尝试多种参数组合
                 if retry_count % 2 == 0:
                     # 第一种参数组合
-                    data = yf.download(
+                    data = call(
+                        'yfinance', yf.download,
                         tickers=current_code,
                         start=start_date,
                         end=end_date,
                         interval='1d',
-                        auto_adjust=True,
+                        auto_adjust=adjust_prices(),
                         threads=False,
-                        progress=False
+                        progress=False,
+                        max_retries=0
                     )
                 else:
                     # 第二种参数组合
-                    data = yf.download(
+                    data = call(
+                        'yfinance', yf.download,
                         tickers=current_code,
                         start=start_date,
                         end=end_date,
                         interval='1d',
+                        auto_adjust=adjust_prices(),
                         actions=False,
                         group_by='ticker',
                         threads=False,
                         ignore_tz=True,
-                        progress=False
+                        progress=False,
+                        max_retries=0
                     )
                 
                 # 检查数据是否为空
@@ -118,7 +138,8 @@ def get_us_daily_data(stock_code, max_retries=5, retry_interval=3):
                     # 再尝试一种获取方式 - 使用Ticker对象
                     print(f"尝试使用Ticker对象获取数据")
                     ticker = yf.Ticker(current_code)
-                    data = ticker.history(start=start_date, end=end_date, interval='1d')
+                    data = call('yfinance', ticker.history, start=start_date, end=end_date, interval='1d',
+                                auto_adjust=adjust_prices(), max_retries=0)
             except Exception as e:
                 print(f"数据获取失败: {e}")
                 # 直接创建模拟数据
@@ -175,8 +196,7 @@ def get_us_daily_data(stock_code, max_retries=5, retry_interval=3):
                     return mock_data
             
             if retry_count <= max_retries:
-                print(f"❌ 获取美股 {stock_code} 日K线数据失败: {error_msg[:150]}，将在 {retry_interval} 秒后重试")
-                time.sleep(retry_interval)
+                print(f"❌ 获取美股 {stock_code} 日K线数据失败: {error_msg[:150]}，稍后重试")
             else:
                 print(f"❌ 获取美股 {stock_code} 日K线数据失败: {error_msg[:150]}，已达到最大重试次数")
                 # 最后尝试生成模拟数据
@@ -186,138 +206,116 @@ def save_to_db(df: pd.DataFrame, code: str):
     """保存美股日K线数据到PostgreSQL，使用code+datetime作为主键"""
     if df.empty:
         print(f"⚠️ 美股 {code} 数据为空，跳过")
-        return
+        return False
 
-    # 处理多层列索引
-    if isinstance(df.columns, pd.MultiIndex):
-        unique_tickers = {col[1] for col in df.columns if len(col) > 1}
-        if len(unique_tickers) == 1:
-            df = df.droplevel(1, axis=1)
-        else:
-            df.columns = [f"{col[0]}_{col[1]}" for col in df.columns]
+    # 统一列名、时间格式和数值类型
+    df_to_insert = normalize_ohlcv(df, code, 'yfinance_us_day', date_only=True, tz='America/New_York', fill_na=False)
+    if df_to_insert is None:
+        print(f"⚠️ 美股 {code} 缺少时间列或收盘价，无法保存")
+        return False
 
-    # 统一字段名
-    rename_dict = {}
-    yfinance_columns = {
-        'Open': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Close': 'close',
-        'Volume': 'volume'
-    }
-    
-    for yf_col, target_col in yfinance_columns.items():
-        if yf_col in df.columns:
-            rename_dict[yf_col] = target_col
-    
-    df = df.rename(columns=rename_dict)
-    
-    # 处理时间索引
-    if isinstance(df.index, pd.DatetimeIndex):
-        df['datetime'] = df.index
+    # 写入数据库：COPY到临时表后一次性合并到目标表
+    try:
+        rows = bulk_upsert(engine, df_to_insert, 'us_data_day')
+        print(f"✅ 美股{code} 日K线数据已写入数据库, 共 {rows} 行")
+        return True
+    except Exception as e:
+        print(f"❌ 保存美股{code} 日K线数据失败: {e}")
+        return False
+
+def get_us_daily_data_batch(stock_codes, start_date=None, end_date=None):
+    """
+    批量获取多个美股的日K线数据，每次yf.download请求一批代码
+    参数：
+        stock_codes: 美股代码列表，如 ['AAPL', 'MSFT']
+        start_date: 起始日期（date），为空时获取过去1年的数据
+        end_date: 结束日期（date，包含），为空时取到今天
+    返回：生成器，逐个产出 (stock_code, DataFrame)，DataFrame可直接传给save_to_db
+    """
+    # yfinance的end不包含当天，结束日期往后加一天；未指定时取到美股当地的今天
+    if end_date is None:
+        end_date = market_now('us').date()
+    end_date = end_date + timedelta(days=1)
+    end_date = end_date.strftime('%Y-%m-%d')
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
     else:
-        time_columns = ['datetime', 'date', 'time', 'timestamp', 'Datetime']
-        found_time_col = False
-        for col in time_columns:
-            if col in df.columns:
-                df['datetime'] = df[col]
-                found_time_col = True
-                break
-        
-        if not found_time_col:
-            print(f"⚠️ 美股 {code} 找不到时间列，无法保存")
-            return
-    
-    # 添加股票代码
-    df["code"] = code
+        start_date = start_date.strftime('%Y-%m-%d')
+
+    codes = set(stock_codes)
+    for ticker, data in download_batches(list(stock_codes), start=start_date, end=end_date, interval='1d',
+                                         auto_adjust=adjust_prices()):
+        if ticker not in codes:
+            continue
+        # 带时区的索引转换为纽约时间，日线默认返回不带时区的交易日期，直接使用
+        if data.index.tz is not None:
+            data.index = data.index.tz_convert('America/New_York')
+        yield ticker, data
+
+def crawl_us_daily(codes=None):
+    """
+    批量抓取美股日K线数据并保存
+    按已有数据的最新日期分组，同一起始日期的代码合并下载
+    参数：
+        codes: 美股代码列表，为空时抓取us_stocks中的全部代码
+    返回：CrawlSummary
+    """
+    if not codes:
+        codes = load_universe('us', engine)
+    summary = CrawlSummary('美股日K线')
 
-    # 检查关键字段
-    required_columns = ["code", "datetime", "open", "high", "low", "close", "volume"]
-    if "datetime" not in df.columns or "close" not in df.columns:
-        print(f"⚠️ 美股 {code} 缺少关键字段，无法保存")
-        return
-    
-    # 确保datetime字段是datetime类型且只保留日期部分
-    if 'datetime' in df.columns:
-        try:
-            if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-                df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                if df['datetime'].isna().any():
-                    df = df.dropna(subset=['datetime'])
-            
-            # 只保留日期部分，去掉时间部分和时区信息
-            df['datetime'] = df['datetime'].dt.date
-        except Exception as e:
-            print(f"⚠️ 美股 {code} 解析datetime字段失败: {e}")
-            return
-    
-    # 确保数值字段类型正确
-    numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-    for col in numeric_columns:
-        if col in df.columns:
-            try:
-                if col == 'volume':
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-                else:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            except Exception as e:
-                print(f"⚠️ 美股 {code} 转换{col}字段类型失败: {e}")
-    
-    # 写入数据库
     try:
-        df_to_insert = df[[col for col in required_columns if col in df.columns]].copy()
-        data_dict = df_to_insert.to_dict('records')
-        
-        batch_size = 100
-        total_batches = (len(data_dict) + batch_size - 1) // batch_size
-        
-        with engine.connect() as conn:
-            for i in range(total_batches):
-                start_idx = i * batch_size
-                end_idx = min((i + 1) * batch_size, len(data_dict))
-                batch_data = data_dict[start_idx:end_idx]
-                
-                insert_sql = text("""
-                    INSERT INTO us_data_day (code, datetime, open, high, low, close, volume, update_time)
-                    VALUES (:code, :datetime, :open, :high, :low, :close, :volume, CURRENT_TIMESTAMP)
-                    ON CONFLICT (code, datetime) DO UPDATE
-                    SET open = EXCLUDED.open,
-                        high = EXCLUDED.high,
-                        low = EXCLUDED.low,
-                        close = EXCLUDED.close,
-                        volume = EXCLUDED.volume,
-                        update_time = CURRENT_TIMESTAMP
-                """)
-                
-                for row in batch_data:
-                    row_with_defaults = {
-                        'code': row.get('code', code),
-                        'datetime': row.get('datetime'),
-                        'open': row.get('open', 0.0),
-                        'high': row.get('high', 0.0),
-                        'low': row.get('low', 0.0),
-                        'close': row.get('close', 0.0),
-                        'volume': row.get('volume', 0)
-                    }
-                    conn.execute(insert_sql, row_with_defaults)
-            
-            conn.commit()
-            print(f"✅ 美股{code} 日K线数据已写入数据库, 共 {len(df)} 行")
+        high_water_marks = load_high_water_marks(engine, 'us_data_day')
     except Exception as e:
-        print(f"❌ 保存美股{code} 日K线数据失败: {e}")
+        print(f"读取已有数据的最新日期失败: {str(e)[:100]}，按全量区间抓取")
+        high_water_marks = {}
+
+    groups = {}
+    for code in codes:
+        start_date = get_incremental_start(engine, 'us_data_day', code, high_water_marks)
+        groups.setdefault(start_date, []).append(code)
+
+    for start_date, group_codes in groups.items():
+        for code, data in get_us_daily_data_batch(group_codes, start_date):
+            if save_to_db(data, code):
+                summary.succeeded.append(code)
+            else:
+                summary.failed[code] = '保存失败'
+
+    finished = set(summary.succeeded) | set(summary.failed)
+    for code in codes:
+        if code not in finished:
+            summary.failed[code] = '未获取到数据'
+
+    summary.elapsed = time.monotonic() - summary.start_time
+    summary.print_summary()
+    return summary
 
 def main():
     """主函数：获取美股日K线数据并保存"""
+    parser = argparse.ArgumentParser(description='获取美股日K线数据')
+    parser.add_argument('--codes', nargs='*', help='美股代码（如AAPL），默认抓取全部美股')
+    parser.add_argument('--single', action='store_true', help='逐个代码下载（失败时重试并生成模拟数据），不使用批量下载')
+    args = parser.parse_args()
+
+    if not args.single:
+        print("开始批量获取美股日K线数据...")
+        summary = crawl_us_daily(args.codes)
+        if summary.failed:
+            print("⚠️ 部分美股日K线数据获取失败，请检查日志")
+        return
+
     print("开始获取美股日K线数据...")
     try:
-        # 示例：获取苹果公司数据
-        stock_code = "AAPL"
-        us_data = get_us_daily_data(stock_code)
-        if us_data is not None:
-            save_to_db(us_data, stock_code)
-            print("✅ 美股日K线数据获取完成！")
-        else:
-            print("⚠️ 美股日K线数据获取失败")
+        for stock_code in args.codes or ["AAPL"]:  # 示例：苹果公司
+            # 按已有数据的最新日期增量抓取
+            start_date = get_incremental_start(engine, 'us_data_day', stock_code)
+            us_data = get_us_daily_data(stock_code, start_date=start_date)
+            if us_data is not None:
+                save_to_db(us_data, stock_code)
+                print("✅ 美股日K线数据获取完成！")
+            else:
+                print("⚠️ 美股日K线数据获取失败")
     except Exception as e:
         print(f"⚠️ 获取美股日K线数据时发生错误: {e}")
 
@@ -0,0 +1,194 @@
+"""
+股票代码表增量同步
+代码爬虫拿到的是全市场代码快照，原先用 to_sql(if_exists='replace') 整表重建，
+会丢掉init.sql中的id和code唯一约束，加载期间读者还会看到空表或表不存在。
+现在把快照COPY到临时表，与当前代码表比较后在同一事务中只应用变化：
+    listed    快照中有、表中没有的代码（新上市）
+    delisted  表中有、快照中没有的代码（退市）
+    renamed   名称（name/cname）变化的代码
+    updated   其他字段（如market）变化的代码
+每条变化写入变更记录表 stock_symbol_changes，表中只有变化的行会被改写；
+有变化时发送数据更新通知（payload中为变化的代码），web服务据此重建代码搜索索引
+用法（查看最近的变更记录）：
+    python symbol_sync.py --market cn --limit 50
+"""
+import argparse
+import pandas as pd
+from config import SYMBOL_SYNC_CONFIG
+from bulk_writer import frame_to_csv_buffer, notify_update
+from partition_manager import create_db_engine, run_with_cursor
+
+# 市场 -> (代码表, 快照可同步的字段)
+SYMBOL_TABLES = {
+    'cn': ('cn_stocks', ['name', 'industry', 'market']),
+    'hk': ('hk_stocks', ['name', 'cname', 'industry']),
+    'us': ('us_stocks', ['name', 'cname', 'industry'])
+}
+
+# 变化时记为更名的字段
+NAME_COLUMNS = ('name', 'cname')
+
+CHANGE_TYPES = ['listed', 'delisted', 'renamed', 'updated']
+
+
+def ensure_symbol_table(cursor, table, columns):
+    """
+    确保代码表可以增量合并：补齐字段和code唯一索引
+    旧版代码爬虫用to_sql重建过的表没有id、唯一约束和cname等字段，补齐前先删除重复和空代码
+    """
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS id SERIAL")
+    for column in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} VARCHAR(100)")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+
+    cursor.execute(
+        """SELECT 1 FROM pg_index i
+           JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+           WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indnkeyatts = 1 AND a.attname = 'code'""",
+        (table,)
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(f"DELETE FROM {table} WHERE code IS NULL")
+        cursor.execute(f"DELETE FROM {table} a USING {table} b WHERE a.code = b.code AND a.ctid > b.ctid")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_code_key ON {table} (code)")
+        print(f"⚠️ {table} 缺少code唯一约束（曾被整表重建），已去重并补建唯一索引")
+
+
+def prepare_snapshot(df, columns):
+    """快照只保留代码和可同步的字段，去掉首尾空白、空代码和重复代码（保留最后一条）"""
+    columns = [column for column in columns if column in df.columns]
+    snapshot = df[['code'] + columns].copy()
+    for column in ['code'] + columns:
+        values = snapshot[column].astype('string').str.strip()
+        snapshot[column] = values.mask(values == '')
+    snapshot = snapshot.dropna(subset=['code']).drop_duplicates(subset=['code'], keep='last')
+    return snapshot, columns
+
+
+def apply_snapshot(cursor, market, snapshot, columns):
+    """
+    在已有事务中将快照与代码表比较并应用变化
+    返回：(各类变化的代码 {change_type: [code...]}, 因超过比例而未执行的退市数)
+    """
+    table, table_columns = SYMBOL_TABLES[market]
+    ensure_symbol_table(cursor, table, table_columns)
+
+    staging = f"{table}_snapshot"
+    columns_str = ', '.join(['code'] + columns)
+    cursor.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {columns_str} FROM {table} WITH NO DATA")
+    cursor.copy_expert(f"COPY {staging} ({columns_str}) FROM STDIN WITH (FORMAT csv)", frame_to_csv_buffer(snapshot))
+    cursor.execute(f"ANALYZE {staging}")
+
+    # 快照明显不完整（如接口只返回了部分代码）时，不执行退市，避免清空代码表
+    cursor.execute(
+        f"""SELECT COUNT(*), COUNT(*) FILTER (WHERE s.code IS NULL)
+            FROM {table} t LEFT JOIN {staging} s ON s.code = t.code"""
+    )
+    total, delisting = cursor.fetchone()
+    allow_delist = not total or delisting <= total * SYMBOL_SYNC_CONFIG['max_delist_ratio']
+    if not allow_delist:
+        print(f"⚠️ {table} 快照缺少 {delisting}/{total} 个已有代码，超过 max_delist_ratio，本次不执行退市")
+
+    def values(alias):
+        pairs = ', '.join(f"'{column}', {alias}.{column}" for column in columns)
+        return f"jsonb_build_object({pairs})"
+
+    def differs(names):
+        if not names:
+            return 'FALSE'
+        return f"({', '.join(f't.{name}' for name in names)}) IS DISTINCT FROM ({', '.join(f's.{name}' for name in names)})"
+
+    renamed = differs([column for column in columns if column in NAME_COLUMNS])
+    cursor.execute(
+        f"""WITH changed AS (
+                SELECT s.*, {values('t')} AS old_values,
+                       CASE WHEN {renamed} THEN 'renamed' ELSE 'updated' END AS change_type
+                FROM {staging} s JOIN {table} t ON t.code = s.code
+                WHERE {differs(columns)}
+            ),
+            updated AS (
+                UPDATE {table} t
+                SET {', '.join(f'{column} = c.{column}' for column in columns)}, update_time = NOW()
+                FROM changed c
+                WHERE t.code = c.code
+                RETURNING t.code
+            ),
+            listed AS (
+                INSERT INTO {table} ({columns_str}, update_time)
+                SELECT {columns_str}, NOW() FROM {staging} s
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.code = s.code)
+                RETURNING *
+            ),
+            delisted AS (
+                DELETE FROM {table} t
+                WHERE %(allow_delist)s AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.code = t.code)
+                RETURNING *
+            ),
+            logged AS (
+                INSERT INTO stock_symbol_changes (market, code, change_type, old_values, new_values)
+                SELECT %(market)s, c.code, c.change_type, c.old_values, {values('c')} FROM changed c
+                UNION ALL
+                SELECT %(market)s, l.code, 'listed', NULL, {values('l')} FROM listed l
+                UNION ALL
+                SELECT %(market)s, d.code, 'delisted', {values('d')}, NULL FROM delisted d
+                RETURNING change_type, code
+            )
+            SELECT change_type, code FROM logged""",
+        {'market': market, 'allow_delist': allow_delist}
+    )
+    changes = {change_type: [] for change_type in CHANGE_TYPES}
+    for change_type, code in cursor.fetchall():
+        changes[change_type].append(code)
+
+    changed_codes = [code for codes in changes.values() for code in codes]
+    if changed_codes:
+        notify_update(cursor, pd.DataFrame({'code': changed_codes}), table)
+    return changes, 0 if allow_delist else delisting
+
+
+def sync_symbols(engine, market, df):
+    """
+    用代码快照增量更新代码表（单独事务）
+    参数：
+        engine: SQLAlchemy引擎
+        market: 'cn' / 'hk' / 'us'
+        df: 代码快照，列名已转换为代码表字段（code、name、cname等），多余的列会被忽略
+    返回：各类变化的代码 {change_type: [code...]}，失败时抛出异常并回滚
+    """
+    table, table_columns = SYMBOL_TABLES[market]
+    snapshot, columns = prepare_snapshot(df, table_columns)
+    if snapshot.empty:
+        print(f"⚠️ {table} 快照为空，跳过同步")
+        return {change_type: [] for change_type in CHANGE_TYPES}
+
+    changes, skipped = run_with_cursor(engine, apply_snapshot, market, snapshot, columns)
+    print(f"✅ {table} 同步完成（快照 {len(snapshot)} 个代码）: 新上市 {len(changes['listed'])}，"
+          f"退市 {len(changes['delisted'])}，更名 {len(changes['renamed'])}，其他变更 {len(changes['updated'])}"
+          + (f"，未执行退市 {skipped}" if skipped else ""))
+    return changes
+
+
+def recent_changes(cursor, market, limit=50):
+    cursor.execute(
+        """SELECT change_time, code, change_type, old_values, new_values FROM stock_symbol_changes
+           WHERE market = %s ORDER BY id DESC LIMIT %s""",
+        (market, limit)
+    )
+    return cursor.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看股票代码表的变更记录')
+    parser.add_argument('--market', choices=list(SYMBOL_TABLES), required=True, help='市场')
+    parser.add_argument('--limit', type=int, default=50, help='显示最近的记录数')
+    args = parser.parse_args()
+
+    rows = run_with_cursor(create_db_engine(), recent_changes, args.market, args.limit)
+    if not rows:
+        print(f"{args.market} 暂无代码变更记录")
+    for change_time, code, change_type, old_values, new_values in rows:
+        print(f"{change_time:%Y-%m-%d %H:%M:%S}  {change_type:<9}{code:<12}{old_values or ''} -> {new_values or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+分钟数据尾部缓存
+分钟爬虫每次轮询都会重新抓取最近一段时间的K线，其中绝大部分已经写入且没有变化。
+写库前按 (代码, 时间) 与内存中每个代码最近max_bars根K线的内容哈希比较，只把新增或变化的K线交给COPY + 合并，
+1分钟轮询时每个代码每分钟通常只写入1~2行（新K线和仍在形成中的最后一根）
+    - 某个代码第一次写入时，从数据库读取本批时间范围内已有的K线作为基准（进程重启后不会全量重写）
+    - 早于缓存尾部、但已经比较过的K线视为已收盘不再变化，直接跳过
+    - 只在事务提交后更新缓存，写入失败时下次轮询会重新发送
+    - 缓存只反映本进程写入的内容，其他进程（如backfill.py）修改同一批K线后，需要重启爬虫才能感知
+用法：
+    rows = bulk_upsert(engine, df, 'cn_data_realtime', dedup=True)
+"""
+import threading
+import numpy as np
+import pandas as pd
+from config import TAIL_CACHE_CONFIG
+
+# 参与比较的字段，数据库中价格为NUMERIC(10,4)、成交量为BIGINT，按相同精度取整后再计算哈希
+HASH_COLUMNS = {'open': 4, 'high': 4, 'low': 4, 'close': 4, 'volume': 0}
+
+
+def row_hashes(df):
+    """按行计算K线内容的64位哈希，缺少的字段和空值按NaN参与计算"""
+    values = pd.DataFrame(index=range(len(df)))
+    for column, decimals in HASH_COLUMNS.items():
+        if column in df.columns:
+            values[column] = pd.to_numeric(df[column], errors='coerce').astype('float64').round(decimals).to_numpy()
+        else:
+            values[column] = np.nan
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def datetime_keys(df):
+    """时间列转为int64纳秒，用于有序查找"""
+    return df['datetime'].to_numpy(dtype='datetime64[ns]').view('int64')
+
+
+class TailCache:
+    """单个表的尾部缓存，多个写库线程共享同一个实例"""
+
+    def __init__(self, table, max_bars):
+        self.table = table
+        self.max_bars = max_bars
+        # 代码 -> (按时间排序的时间键数组, 对应的内容哈希数组)
+        self._tails = {}
+        # 代码 -> 已比较过的最早时间键，更早的K线没有见过，需要写入
+        self._covered = {}
+        self._lock = threading.Lock()
+        self.rows_seen = 0
+        self.rows_changed = 0
+
+    def _prime(self, cursor, codes, start):
+        """从数据库读取各代码start之后已有的K线作为比较基准"""
+        columns = ', '.join(HASH_COLUMNS)
+        cursor.execute(
+            f"SELECT code, datetime, {columns} FROM {self.table} WHERE code = ANY(%s) AND datetime >= %s",
+            (codes, start)
+        )
+        loaded = pd.DataFrame(cursor.fetchall(), columns=['code', 'datetime', *HASH_COLUMNS])
+        tails = {code: (np.empty(0, dtype='int64'), np.empty(0, dtype='uint64')) for code in codes}
+        if not loaded.empty:
+            loaded['datetime'] = pd.to_datetime(loaded['datetime'])
+            loaded = loaded.sort_values('datetime', kind='stable').reset_index(drop=True)
+            keys, hashes = datetime_keys(loaded), row_hashes(loaded)
+            for code, index in loaded.groupby('code').indices.items():
+                tails[code] = (keys[index], hashes[index])
+        return tails
+
+    def filter(self, cursor, df):
+        """
+        返回df中需要写入的行（新增或内容变化的K线）
+        参数：
+            cursor: 当前写入事务的游标，首次遇到的代码用它读取数据库中的已有K线
+            df: 待写入的DataFrame，包含code、datetime和价格列
+        """
+        if df is None or df.empty:
+            return df
+        df = df.reset_index(drop=True)
+        keys, hashes = datetime_keys(df), row_hashes(df)
+        groups = df.groupby('code').indices
+
+        with self._lock:
+            missing = [code for code in groups if code not in self._tails]
+        if missing:
+            start = pd.Timestamp(min(keys[groups[code]].min() for code in missing))
+            primed = self._prime(cursor, [str(code) for code in missing], start.to_pydatetime())
+            with self._lock:
+                for code in missing:
+                    if code not in self._tails:
+                        self._tails[code] = primed[str(code)]
+                        self._covered[code] = int(keys[groups[code]].min())
+
+        changed = np.ones(len(df), dtype=bool)
+        with self._lock:
+            for code, index in groups.items():
+                tail_keys, tail_hashes = self._tails[code]
+                code_keys = keys[index]
+                if len(tail_keys):
+                    pos = np.minimum(np.searchsorted(tail_keys, code_keys), len(tail_keys) - 1)
+                    same = (tail_keys[pos] == code_keys) & (tail_hashes[pos] == hashes[index])
+                    closed = (code_keys < tail_keys[0]) & (code_keys >= self._covered[code])
+                    changed[index] = ~(same | closed)
+                # 首次读取的基准可能超过max_bars，比较后再截断
+                if len(tail_keys) > self.max_bars:
+                    self._tails[code] = (tail_keys[-self.max_bars:], tail_hashes[-self.max_bars:])
+            self.rows_seen += len(df)
+            self.rows_changed += int(changed.sum())
+        return df[changed].reset_index(drop=True)
+
+    def remember(self, df):
+        """事务提交后记录已写入的K线"""
+        if df is None or df.empty:
+            return
+        keys, hashes = datetime_keys(df), row_hashes(df)
+        with self._lock:
+            for code, index in df.groupby('code').indices.items():
+                tail_keys, tail_hashes = self._tails.get(code, (np.empty(0, dtype='int64'), np.empty(0, dtype='uint64')))
+                merged = pd.Series(
+                    np.concatenate([tail_hashes, hashes[index]]),
+                    index=np.concatenate([tail_keys, keys[index]])
+                )
+                merged = merged[~merged.index.duplicated(keep='last')].sort_index().iloc[-self.max_bars:]
+                self._tails[code] = (merged.index.to_numpy(dtype='int64'), merged.to_numpy(dtype='uint64'))
+                covered = int(keys[index].min())
+                self._covered[code] = min(self._covered.get(code, covered), covered)
+
+    def stats(self):
+        """返回 (比较过的行数, 需要写入的行数)"""
+        with self._lock:
+            return self.rows_seen, self.rows_changed
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_tail_cache(table):
+    """按TAIL_CACHE_CONFIG创建的进程内共享缓存，每个表一个实例，未启用时返回None"""
+    if not TAIL_CACHE_CONFIG['enabled']:
+        return None
+    with _caches_lock:
+        cache = _caches.get(table)
+        if cache is None:
+            cache = TailCache(table, TAIL_CACHE_CONFIG['max_bars'])
+            _caches[table] = cache
+        return cache
@@ -0,0 +1,151 @@
+"""
+交易日历模块
+判断各市场当前是否为交易日、是否处于交易时段，以及当日收盘后是否应该抓取日K线
+所有时间均按交易所当地时区计算
+"""
+import threading
+from datetime import date, time as dt_time
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday
+)
+from config import MARKET_SESSIONS, MARKET_HOLIDAYS, SCHEDULE_CONFIG
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """纽约证券交易所休市日（不含临时休市和半日市）"""
+    rules = [
+        Holiday('NewYearsDay', month=1, day=1, observance=nearest_workday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('IndependenceDay', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday)
+    ]
+
+
+# 已提示过休市日配置缺失的 (市场, 年份)，每个组合只提示一次
+_missing_holiday_years = set()
+
+
+def _check_configured_holidays(market, year):
+    """
+    港股休市日（以及akshare交易日历不可用时的A股）只能依赖MARKET_HOLIDAYS，
+    农历节假日无法按规则计算；配置中没有当年的日期时打印警告，此时除周末外的日子都会被当作交易日
+    """
+    if (market, year) in _missing_holiday_years:
+        return
+    prefix = f"{year}-"
+    if not any(day.startswith(prefix) for day in MARKET_HOLIDAYS.get(market, [])):
+        _missing_holiday_years.add((market, year))
+        print(f"⚠️ MARKET_HOLIDAYS['{market}'] 中没有 {year} 年的休市日，除周末外均按交易日处理，请在config.py中补充")
+
+
+# A股交易日历缓存：每天最多从akshare刷新一次
+_cn_calendar = {'loaded_on': None, 'dates': None}
+_cn_calendar_lock = threading.Lock()
+
+
+def _load_cn_trade_dates():
+    """获取A股交易日集合，失败时返回None（退回按工作日判断）"""
+    today = date.today()
+    with _cn_calendar_lock:
+        if _cn_calendar['loaded_on'] == today:
+            return _cn_calendar['dates']
+        try:
+            import akshare as ak
+            from fetch_control import call
+            # 持有日历锁时只请求一次，不重试，失败时当天按工作日判断
+            trade_dates = call('akshare-sina', ak.tool_trade_date_hist_sina, max_retries=0)
+            dates = set(pd.to_datetime(trade_dates['trade_date']).dt.date)
+            print(f"已加载A股交易日历，共 {len(dates)} 个交易日")
+        except Exception as e:
+            print(f"⚠️ 获取A股交易日历失败: {str(e)[:100]}，按工作日判断")
+            dates = None
+        _cn_calendar['loaded_on'] = today
+        _cn_calendar['dates'] = dates
+        return dates
+
+
+def market_now(market):
+    """返回交易所当地的当前时间（带时区）"""
+    return pd.Timestamp.now(tz=MARKET_SESSIONS[market]['timezone'])
+
+
+def is_trading_day(market, day=None):
+    """判断某一天（交易所当地日期，默认今天）是否为交易日"""
+    if day is None:
+        day = market_now(market).date()
+    if day.weekday() >= 5:
+        return False
+    if day.isoformat() in MARKET_HOLIDAYS.get(market, []):
+        return False
+
+    if market == 'cn':
+        trade_dates = _load_cn_trade_dates()
+        # 交易日历只覆盖到当年年底，超出范围或获取失败时按工作日和配置的休市日判断
+        if trade_dates and day <= max(trade_dates):
+            return day in trade_dates
+        _check_configured_holidays(market, day.year)
+    elif market == 'hk':
+        _check_configured_holidays(market, day.year)
+    elif market == 'us':
+        holidays = NYSEHolidayCalendar().holidays(start=day, end=day)
+        if len(holidays):
+            return False
+    return True
+
+
+def _parse_time(value):
+    hour, minute = value.split(':')
+    return dt_time(int(hour), int(minute))
+
+
+def is_market_open(market, now=None, grace_minutes=None):
+    """
+    判断市场当前是否处于交易时段
+    参数：
+        now: 交易所当地时间，默认当前时间
+        grace_minutes: 每个时段结束后继续视为开市的分钟数，默认取SCHEDULE_CONFIG
+    """
+    if now is None:
+        now = market_now(market)
+    if grace_minutes is None:
+        grace_minutes = SCHEDULE_CONFIG['session_grace_minutes']
+    if not is_trading_day(market, now.date()):
+        return False
+
+    current = now.time()
+    for start, end in MARKET_SESSIONS[market]['sessions']:
+        end_time = (pd.Timestamp.combine(now.date(), _parse_time(end)) + pd.Timedelta(minutes=grace_minutes)).time()
+        if _parse_time(start) <= current <= end_time:
+            return True
+    return False
+
+
+def session_close(market, day):
+    """返回某个交易日最后一个交易时段的收盘时间（带时区）"""
+    _, end = MARKET_SESSIONS[market]['sessions'][-1]
+    return pd.Timestamp.combine(day, _parse_time(end)).tz_localize(MARKET_SESSIONS[market]['timezone'])
+
+
+def daily_update_due(market, now=None, delay_minutes=None):
+    """
+    判断当日日K线是否可以抓取：今天是交易日且已收盘超过delay_minutes分钟
+    返回：可以抓取时返回交易日日期，否则返回None
+    """
+    if now is None:
+        now = market_now(market)
+    if delay_minutes is None:
+        delay_minutes = SCHEDULE_CONFIG['daily_update_delay']
+    day = now.date()
+    if not is_trading_day(market, day):
+        return None
+    if now < session_close(market, day) + pd.Timedelta(minutes=delay_minutes):
+        return None
+    return day
@@ -0,0 +1,86 @@
+"""
+yfinance批量下载模块
+一次yf.download请求几百个代码，再把返回的多层列DataFrame按代码拆分成单独的DataFrame，
+拆分时按列切片而不逐列复制，拆出的DataFrame可直接交给各市场的save_to_db处理
+"""
+import pandas as pd
+import yfinance as yf
+from config import YF_BATCH_CONFIG
+from fetch_cache import cached_fetch
+from fetch_control import call
+
+PRICE_FIELDS = {'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'}
+
+
+def split_by_ticker(data):
+    """
+    将yf.download(group_by='ticker')返回的多层列DataFrame按代码拆分
+    返回：生成器，逐个产出 (ticker, DataFrame)，DataFrame为单层列（Open/High/Low/Close/Volume），
+          索引为名为datetime的DatetimeIndex，已去掉该代码没有数据的行
+    """
+    if data is None or data.empty:
+        return
+
+    columns = data.columns
+    if not isinstance(columns, pd.MultiIndex):
+        # 单个代码且未返回多层列
+        yield None, data.rename_axis('datetime')
+        return
+
+    # 兼容 group_by='column' 的列顺序（价格字段在第一层）
+    if set(columns.get_level_values(0)) <= PRICE_FIELDS:
+        data = data.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+        columns = data.columns
+
+    # group_by='ticker'时同一代码的列是连续的，找出每个代码的列区间
+    tickers = columns.get_level_values(0)
+    boundaries = [0] + [i for i in range(1, len(tickers)) if tickers[i] != tickers[i - 1]] + [len(tickers)]
+
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        ticker = tickers[start]
+        # 按列区间切片得到的是原数据块的视图，不复制每一列
+        frame = data.iloc[:, start:stop]
+        frame.columns = frame.columns.droplevel(0)
+        frame = frame.rename_axis('datetime')
+
+        # 合并下载时索引是所有代码日期的并集，去掉该代码整行为空的日期
+        has_data = frame.notna().any(axis=1)
+        if not has_data.any():
+            continue
+        if not has_data.all():
+            frame = frame[has_data]
+        yield ticker, frame
+
+
+def download_batches(tickers, batch_size=None, ttl=None, **download_kwargs):
+    """
+    分批下载多个代码的数据
+    参数：
+        tickers: yfinance代码列表，如 ['0700.HK', 'AAPL']
+        batch_size: 每次请求的代码数量，默认取YF_BATCH_CONFIG
+        ttl: 未收盘区间的缓存有效期（秒），默认取FETCH_CACHE_CONFIG，盘中轮询分钟数据时传0
+        download_kwargs: 透传给yf.download的参数（start/end/period/interval等）
+    返回：生成器，逐个产出 (ticker, DataFrame)；整批下载失败（重试用尽或熔断）时跳过该批并打印错误
+    每批的下载结果按 代码列表+区间+参数 缓存（见fetch_cache.py），auto_adjust=True为前复权，历史区间也按adjusted_ttl过期
+    """
+    batch_size = batch_size or YF_BATCH_CONFIG['batch_size']
+    download_kwargs.setdefault('threads', YF_BATCH_CONFIG['threads'])
+    download_kwargs.setdefault('progress', False)
+    download_kwargs.setdefault('auto_adjust', True)
+
+    for i in range(0, len(tickers), batch_size):
+        batch = list(tickers[i:i + batch_size])
+        print(f"正在批量下载第 {i + 1}-{i + len(batch)} 个代码（共 {len(tickers)} 个）...")
+        try:
+            data = cached_fetch(
+                'yfinance', ','.join(batch), download_kwargs.get('interval', '1d'),
+                lambda: call('yfinance', yf.download, tickers=batch, group_by='ticker', **download_kwargs),
+                start=download_kwargs.get('start'), end=download_kwargs.get('end'), ttl=ttl,
+                **{k: v for k, v in download_kwargs.items() if k not in ('start', 'end', 'interval', 'threads', 'progress')}
+            )
+        except Exception as e:
+            print(f"❌ 批量下载失败: {str(e)[:200]}")
+            continue
+
+        for ticker, frame in split_by_ticker(data):
+            yield (ticker if ticker is not None else batch[0]), frame
@@ -1,14 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-import pandas as pd
 from sqlalchemy import create_engine, text
 import sys
 import os
+import json
+import queue
 import traceback
+from datetime import timedelta
+import numpy as np
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from crawler.config import DB_CONFIG
+from crawler.config import DB_CONFIG, NOTIFY_CONFIG, QUERY_CACHE_CONFIG, LIVE_STREAM_CONFIG, BATCH_QUERY_CONFIG, SYMBOL_SEARCH_CONFIG, INDICATOR_CONFIG
+from query_cache import QueryCache
+from db_notify import NotifyListener
+from live_bus import LiveBus
+from symbol_search import SymbolSearch
+from indicator_cache import IndicatorCache
+from indicators import parse_indicator, spec_label
+from serializer import TIME_FORMATS, select_columns, fetch_columnar, fetch_columnar_by_code, columnar_from_arrays
+from resample import RESOLUTIONS, ROLLUP_LEVELS, choose_resolution, source_table, aggregate_sql, rollup_sql, parse_time
+
+# 历史归档文件读取器（需要pyarrow），超出数据库在线保留范围的分钟数据从归档文件读取
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawler'))
+try:
+    from archive import ArchiveReader, hot_window_start
+    archive_reader = ArchiveReader()
+except ImportError:
+    archive_reader = None
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app)
@@ -28,111 +47,375 @@ def create_db_engine():
 
 engine = create_db_engine()
 
-# 获取股票数据的通用函数
-def get_stock_data(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200):
+# 查询结果缓存，爬虫写入新数据时通过NOTIFY失效对应代码的缓存
+query_cache = QueryCache(
+    ttl=QUERY_CACHE_CONFIG['ttl'],
+    max_entries=QUERY_CACHE_CONFIG['max_entries'],
+    max_bytes=QUERY_CACHE_CONFIG['max_bytes']
+)
+
+# 实时K线推送，同一订阅的客户端共用一次查询
+live_bus = None
+if LIVE_STREAM_CONFIG['enabled'] and NOTIFY_CONFIG['enabled'] and engine is not None:
+    live_bus = LiveBus(engine, LIVE_STREAM_CONFIG['queue_size'], LIVE_STREAM_CONFIG['max_subscribers'])
+
+# 股票代码搜索索引，启动时加载，代码表刷新后收到通知时重建
+symbol_search = None
+if SYMBOL_SEARCH_CONFIG['enabled'] and engine is not None:
+    symbol_search = SymbolSearch(engine, SYMBOL_SEARCH_CONFIG['pinyin'], SYMBOL_SEARCH_CONFIG['max_age'])
+    symbol_search.rebuild_all()
+
+# 技术指标缓存，收到数据更新通知后从保存的状态增量计算新K线的指标
+indicator_cache = None
+if INDICATOR_CONFIG['enabled'] and engine is not None:
+    indicator_cache = IndicatorCache(engine, INDICATOR_CONFIG['max_bars'], INDICATOR_CONFIG['max_series'], INDICATOR_CONFIG['ttl'])
+
+def on_data_updated(payload):
+    table = payload.get('table')
+    if not table:
+        return
+    if QUERY_CACHE_CONFIG['enabled']:
+        query_cache.invalidate(table, payload.get('codes'))
+    if live_bus is not None:
+        live_bus.on_data_updated(table, payload.get('codes'))
+    if symbol_search is not None:
+        symbol_search.on_data_updated(table)
+    if indicator_cache is not None:
+        indicator_cache.on_data_updated(table, payload.get('codes'))
+
+# 重连期间可能漏掉通知，重连后清空缓存并通知推送的客户端重新加载
+def on_notify_reconnect():
+    query_cache.clear()
+    if live_bus is not None:
+        live_bus.on_reconnect()
+    if symbol_search is not None:
+        symbol_search.on_reconnect()
+    if indicator_cache is not None:
+        indicator_cache.clear()
+
+if (QUERY_CACHE_CONFIG['enabled'] or live_bus is not None or symbol_search is not None or indicator_cache is not None) and NOTIFY_CONFIG['enabled'] and engine is not None:
+    notify_listener = NotifyListener(DB_CONFIG, NOTIFY_CONFIG['channel'], on_reconnect=on_notify_reconnect)
+    notify_listener.subscribe(on_data_updated)
+    notify_listener.start()
+
+# 查询结果的缓存键，前两项为 (表名, 代码)，有时间范围时limit不参与查询
+def stock_cache_key(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution):
+    table_name = source_table(market_type, data_type, is_realtime)
+    return (table_name, stock_code, start_date, end_date, None if start_date and end_date else limit, resolution)
+
+# 获取股票数据的通用函数（带缓存）
+def get_stock_data(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    if not QUERY_CACHE_CONFIG['enabled']:
+        return query_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+    
+    cache_key = stock_cache_key(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+    data = query_cache.get(cache_key)
+    if data is not None:
+        return data, None
+    
+    data, error = query_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+    if error is None:
+        query_cache.set(cache_key, data)
+    return data, error
+
+# 转换为返回格式
+def build_stock_data(columns, data_type, is_realtime, resolution=None):
+    data = {
+        'type': data_type,
+        'is_realtime': is_realtime,
+        'color': '#1890ff' if is_realtime else '#f5222d',
+        'resolution': resolution or ('1m' if data_type == 'minute' else '1d')
+    }
+    data.update(columns)
+    return data
+
+# 查询区间中已归档的部分从归档文件读取，其余部分照常查询数据库
+# 返回 (数据, 错误信息)，不需要读取归档时返回None
+def query_archive_data(market_type, stock_code, start_date, end_date, limit, resolution):
+    start, end = parse_time(start_date), parse_time(end_date)
+    cutoff = archive_cutoff(market_type, start, end)
+    if cutoff is None:
+        return None
+    
+    try:
+        arrays = archive_reader.read_columns(
+            market_type, stock_code, start, min(end, cutoff),
+            inclusive_end=end < cutoff,
+            bucket_seconds=RESOLUTIONS[resolution] if resolution else None
+        )
+        columns, row_count = columnar_from_arrays(arrays, 'minute')
+    except Exception as e:
+        print(f"读取归档数据错误: {str(e)}")
+        print(traceback.format_exc())
+        return None, f"读取归档数据失败: {str(e)}"
+    
+    # 区间的后半部分仍在数据库中（cutoff为月初，与各聚合粒度的桶边界对齐）
+    if end >= cutoff:
+        recent, error = query_stock_data(market_type, stock_code, 'minute', True,
+                                         cutoff.strftime('%Y-%m-%d %H:%M:%S'), end_date, limit, resolution)
+        if recent is not None:
+            for key in columns:
+                columns[key].extend(recent[key])
+            row_count = len(columns['datetime'])
+    
+    if not row_count:
+        return None, f"未找到{stock_code}的minute数据"
+    return build_stock_data(columns, 'minute', True, resolution), None
+
+# 区间内归档部分的结束时间（最后一个有归档文件的月份的下月1日），没有需要从归档读取的部分时返回None
+# 只使用实际存在归档文件且早于在线保留范围的月份：未开启归档，或月初到维护任务导出之前，旧数据仍在数据库中
+def archive_cutoff(market_type, start, end):
+    hot_start = hot_window_start() if archive_reader is not None else None
+    if hot_start is None or start is None or end is None or start >= hot_start:
+        return None
+    return archive_reader.archived_until(market_type, start, min(end, hot_start - timedelta(seconds=1)))
+
+# 查询区间是否有部分需要从归档文件读取
+def needs_archive(market_type, data_type, is_realtime, start_date, end_date):
+    if archive_reader is None or not is_realtime or data_type != 'minute' or not (start_date and end_date):
+        return False
+    return archive_cutoff(market_type, parse_time(start_date), parse_time(end_date)) is not None
+
+# 生成数据库查询，返回按顺序尝试的 [(SQL, 参数, 是否倒序), ...]：
+# 实时数据降采样时先读爬虫维护的聚合表，聚合表读取失败或没有数据时再在SQL中现场聚合
+def build_queries(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    table_name = source_table(market_type, data_type, is_realtime)
+    columns_sql = select_columns(data_type)
+    if resolution:
+        has_range = bool(start_date and end_date)
+        params = {'code': stock_code, 'start_date': start_date, 'end_date': end_date, 'limit': limit}
+        reverse = not has_range
+        queries = []
+        sql = rollup_sql(market_type, resolution, has_range) if is_realtime else None
+        if sql is not None:
+            queries.append((sql, params, reverse))
+        queries.append((aggregate_sql(table_name, resolution, has_range), params, reverse))
+        return queries
+    if start_date and end_date:
+        sql = f"""
+            SELECT {columns_sql}
+            FROM {table_name}
+            WHERE code = %(code)s
+            AND datetime BETWEEN %(start_date)s AND %(end_date)s
+            ORDER BY datetime ASC
+        """
+        return [(sql, {'code': stock_code, 'start_date': start_date, 'end_date': end_date}, False)]
+    sql = f"""
+        SELECT {columns_sql}
+        FROM {table_name}
+        WHERE code = %(code)s
+        ORDER BY datetime DESC
+        LIMIT %(limit)s
+    """
+    # 倒序取最新的limit条，返回前翻转为时间正序
+    return [(sql, {'code': stock_code, 'limit': limit}, True)]
+
+# 从数据库查询股票数据，游标结果直接序列化为列式结构，不经过DataFrame
+def query_stock_data(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
     if engine is None:
         print("错误: 数据库连接未初始化")
         return None, "数据库连接失败"
     
-    table_name = f"{market_type}_{data_type}_{'realtime' if is_realtime else 'prediction'}"
+    if needs_archive(market_type, data_type, is_realtime, start_date, end_date):
+        archived = query_archive_data(market_type, stock_code, start_date, end_date, limit, resolution)
+        if archived is not None:
+            return archived
     
     try:
-        with engine.connect() as conn:
-            # 构建SQL查询
-            if data_type == 'minute':
-                if start_date and end_date:
-                    sql = text("""
-                        SELECT datetime, open, high, low, close, volume 
-                        FROM """ + table_name + """
-                        WHERE code = :code 
-                        AND datetime BETWEEN :start_date AND :end_date
-                        ORDER BY datetime ASC
-                    """)
-                    result = conn.execute(sql, {'code': stock_code, 'start_date': start_date, 'end_date': end_date})
-                else:
-                    sql = text("""
-                        SELECT datetime, open, high, low, close, volume 
-                        FROM """ + table_name + """
-                        WHERE code = :code 
-                        ORDER BY datetime DESC 
-                        LIMIT :limit
-                    """)
-                    result = conn.execute(sql, {'code': stock_code, 'limit': limit})
-            else:
-                if start_date and end_date:
-                    sql = text("""
-                        SELECT datetime, open, high, low, close, volume 
-                        FROM """ + table_name + """
-                        WHERE code = :code 
-                        AND datetime BETWEEN :start_date AND :end_date
-                        ORDER BY datetime ASC
-                    """)
-                    result = conn.execute(sql, {'code': stock_code, 'start_date': start_date, 'end_date': end_date})
-                else:
-                    sql = text("""
-                        SELECT datetime, open, high, low, close, volume 
-                        FROM """ + table_name + """
-                        WHERE code = :code 
-                        ORDER BY datetime DESC 
-                        LIMIT :limit
-                    """)
-                    result = conn.execute(sql, {'code': stock_code, 'limit': limit})
-            
-            rows = result.fetchall()
-            
-            if not rows:
-                return None, f"未找到{stock_code}的{data_type}数据"
-            
-            columns = result.keys()
-            df = pd.DataFrame(rows, columns=columns)
-            
-            # 数据处理
-            if data_type == 'minute':
-                if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-                    df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-                    df = df.dropna(subset=['datetime'])
-                df = df.sort_values('datetime')
-            else:
-                date_col = 'datetime' if 'datetime' in df.columns else 'date'
-                if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
-                    df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-                    df = df.dropna(subset=[date_col])
-                df = df.sort_values(date_col)
-            
-            numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-            if 'volume' in df.columns:
-                df['volume'] = df['volume'].astype(int)
-            
-            # 转换为返回格式
-            data = {
-                'type': data_type,
-                'is_realtime': is_realtime,
-                'color': '#1890ff' if is_realtime else '#f5222d'
-            }
-            
-            if data_type == 'minute':
-                data['datetime'] = df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
-            else:
-                date_col = 'datetime' if 'datetime' in df.columns else 'date'
-                data['date'] = df[date_col].dt.strftime('%Y-%m-%d').tolist()
-            
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                if col in df.columns:
-                    data[col] = df[col].tolist()
-            
-            return data, None
+        queries = build_queries(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+        for i, (sql, params, reverse) in enumerate(queries):
+            is_last = i == len(queries) - 1
+            try:
+                columns, row_count = fetch_columnar(engine, sql, params, data_type, reverse=reverse)
+            except Exception as e:
+                if is_last:
+                    raise
+                print(f"读取聚合表失败: {str(e)[:200]}，改为现场聚合")
+                continue
+            if row_count or is_last:
+                break
+        
+        if not row_count:
+            return None, f"未找到{stock_code}的{data_type}数据"
+        
+        return build_stock_data(columns, data_type, is_realtime, resolution), None
             
     except Exception as e:
         print(f"查询数据错误: {str(e)}")
         print(traceback.format_exc())
         return None, f"查询数据失败: {str(e)}"
 
-# 获取股票列表的函数
-def get_stock_list(market_type):
+# 把单代码查询包装为批量查询：对代码数组逐个执行原查询（LATERAL，每个代码走主键索引），一次往返返回全部代码，
+# 每个代码的结果与单独查询相同，结果按代码和时间正序排列
+def batch_sql(sql):
+    return f"""
+        SELECT c.code, bars.*
+        FROM unnest(%(codes)s::text[]) AS c(code)
+        CROSS JOIN LATERAL ({sql.replace('%(code)s', 'c.code')}) AS bars
+        ORDER BY 1, 2
+    """
+
+# 批量查询前先读缓存和归档，返回 (已有结果 {代码: 数据}, 需要查询数据库的代码列表)
+def batch_prefetch(market_type, codes, data_type, is_realtime, start_date, end_date, limit, resolution):
+    results, pending = {}, []
+    for code in codes:
+        if QUERY_CACHE_CONFIG['enabled']:
+            data = query_cache.get(stock_cache_key(market_type, code, data_type, is_realtime, start_date, end_date, limit, resolution))
+            if data is not None:
+                results[code] = data
+                continue
+        if needs_archive(market_type, data_type, is_realtime, start_date, end_date):
+            # 归档数据按代码逐个读取
+            data, _ = get_stock_data(market_type, code, data_type, is_realtime, start_date, end_date, limit, resolution)
+            if data is not None:
+                results[code] = data
+            continue
+        pending.append(code)
+    return results, pending
+
+# 保存批量查询中一个代码的结果
+def batch_store(results, market_type, code, columns, data_type, is_realtime, start_date, end_date, limit, resolution):
+    data = build_stock_data(columns, data_type, is_realtime, resolution)
+    results[code] = data
+    if QUERY_CACHE_CONFIG['enabled']:
+        query_cache.set(stock_cache_key(market_type, code, data_type, is_realtime, start_date, end_date, limit, resolution), data)
+
+# 批量获取多个代码的数据，数据库部分只需要一次查询（聚合表缺少的代码再现场聚合一次）
+# 返回 ({代码: 数据}, 错误信息)，没有数据的代码不出现在结果中
+def get_batch_data(market_type, codes, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    if engine is None:
+        print("错误: 数据库连接未初始化")
+        return None, "数据库连接失败"
+    
+    results, pending = batch_prefetch(market_type, codes, data_type, is_realtime, start_date, end_date, limit, resolution)
+    try:
+        queries = build_queries(market_type, None, data_type, is_realtime, start_date, end_date, limit, resolution)
+        for i, (sql, params, _) in enumerate(queries):
+            if not pending:
+                break
+            try:
+                found = fetch_columnar_by_code(engine, batch_sql(sql), dict(params, codes=pending), data_type)
+            except Exception as e:
+                if i == len(queries) - 1:
+                    raise
+                print(f"读取聚合表失败: {str(e)[:200]}，改为现场聚合")
+                continue
+            for code, columns in found.items():
+                batch_store(results, market_type, code, columns, data_type, is_realtime, start_date, end_date, limit, resolution)
+            pending = [code for code in pending if code not in found]
+    except Exception as e:
+        print(f"批量查询数据错误: {str(e)}")
+        print(traceback.format_exc())
+        return None, f"查询数据失败: {str(e)}"
+    return results, None
+
+# 解析批量查询的代码列表：POST的JSON body {"codes": [...]}，或查询参数 codes=代码1,代码2
+# 返回 (去重后的代码列表, 错误信息)
+def parse_batch_codes(market_type, body_codes, query_codes):
+    codes = body_codes if body_codes is not None else [code for code in (query_codes or '').split(',')]
+    if not isinstance(codes, list):
+        return None, 'codes 必须是代码列表'
+    codes = [str(code).strip() for code in codes if str(code).strip()]
+    if market_type == 'cn':
+        codes = [code[2:] if code.lower().startswith(('sh', 'sz')) else code for code in codes]
+    codes = list(dict.fromkeys(codes))
+    if not codes:
+        return None, '股票代码不能为空'
+    if len(codes) > BATCH_QUERY_CONFIG['max_codes']:
+        return None, f"一次最多查询 {BATCH_QUERY_CONFIG['max_codes']} 个代码"
+    return codes, None
+
+# 解析降采样参数：resolution指定粒度，或由max_points按查询区间自动选择
+# 返回 (粒度, 错误信息)，不需要聚合时粒度为None
+def parse_resolution(args, data_type, start_date, end_date):
+    resolution = args.get('resolution', '')
+    max_points = args.get('max_points', 0, type=int)
+    
+    if data_type != 'minute':
+        return None, None
+    if resolution:
+        if resolution not in RESOLUTIONS:
+            return None, f"resolution 必须是 {', '.join(RESOLUTIONS)} 之一"
+    elif max_points and start_date and end_date:
+        resolution = choose_resolution(start_date, end_date, max_points)
+    
+    # 1分钟粒度即原始数据，不需要聚合
+    if resolution == '1m':
+        resolution = None
+    return resolution or None, None
+
+# 解析指标参数，如 ma:5,ma:20,macd,rsi:14，返回 (指标列表, 错误信息)
+def parse_indicator_specs(text):
+    specs = []
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        spec, error = parse_indicator(item)
+        if error:
+            return None, error
+        if spec not in specs:
+            specs.append(spec)
+    if not specs:
+        return None, "indicators不能为空，如 ma:20,macd,rsi:14"
+    if len(specs) > INDICATOR_CONFIG['max_indicators']:
+        return None, f"一次最多计算{INDICATOR_CONFIG['max_indicators']}个指标"
+    return specs, None
+
+# 解析技术指标接口的参数，返回 (get_indicator_data的参数dict, 错误信息)
+def parse_indicator_args(args):
+    market_type = args.get('market', 'cn')
+    stock_code = args.get('code', '')
+    data_type = args.get('dataType', 'minute')
+    resolution = args.get('resolution') or None
+    limit = args.get('limit', 200, type=int)
+    
+    if not stock_code:
+        return None, '股票代码不能为空'
+    if market_type == 'cn' and stock_code.lower().startswith(('sh', 'sz')):
+        stock_code = stock_code[2:]
+    if market_type not in ['cn', 'hk', 'us']:
+        return None, '不支持的市场类型'
+    if data_type not in ['minute', 'day']:
+        return None, '数据类型必须是 minute 或 day'
+    if resolution == '1m' or data_type == 'day':
+        resolution = None
+    if resolution and resolution not in ROLLUP_LEVELS:
+        return None, f"resolution 必须是 1m, {', '.join(ROLLUP_LEVELS)} 之一"
+    if limit is None or limit < 1:
+        return None, 'limit必须是正整数'
+    
+    specs, error = parse_indicator_specs(args.get('indicators'))
+    if error:
+        return None, error
+    return {'market_type': market_type, 'stock_code': stock_code, 'data_type': data_type,
+            'resolution': resolution, 'specs': specs, 'limit': limit}, None
+
+# 计算股票的技术指标，返回 ({时间字段: [...], 'indicators': {指标: {输出名: [...]}}}, 错误信息)
+def get_indicator_data(market_type, stock_code, data_type, resolution, specs, limit):
+    if indicator_cache is None:
+        return None, "技术指标未启用"
+    try:
+        times, results = indicator_cache.get(market_type, stock_code, data_type, resolution, specs, limit)
+    except Exception as e:
+        print(f"计算技术指标错误: {str(e)}")
+        return None, f"计算技术指标失败: {str(e)}"
+    if times is None:
+        return None, f"未找到股票 {stock_code} 的{data_type}数据"
+    time_key, _ = TIME_FORMATS['minute' if resolution else data_type]
+    # NaN（窗口未满）输出为null
+    return {
+        time_key: times,
+        'indicators': {
+            spec_label(*spec): {
+                name: np.where(np.isnan(values), None, np.round(values, 4)).tolist()
+                for name, values in outputs.items()
+            }
+            for spec, outputs in results.items()
+        }
+    }, None
+
+# 获取股票列表的函数，启用代码搜索索引时从内存索引中取前limit条
+def get_stock_list(market_type, limit=100):
     if engine is None:
         print("错误: 数据库连接未初始化")
         return None, "数据库连接失败"
@@ -146,6 +429,14 @@ def get_stock_list(market_type):
     if market_type not in table_map:
         return None, "不支持的市场类型"
     
+    if symbol_search is not None:
+        total, stock_list, error = search_stock_symbols(market_type, '', 1, limit)
+        if error:
+            return None, error
+        if not total:
+            return None, f"未找到{market_type}市场的股票列表"
+        return stock_list, None
+    
     table_name = table_map[market_type]
     
     try:
@@ -170,6 +461,27 @@ def get_stock_list(market_type):
         print(f"查询股票列表错误: {str(e)}")
         return None, f"查询股票列表失败: {str(e)}"
 
+# 在代码搜索索引中按代码、名称、拼音首字母搜索股票，返回 (匹配总数, 当前页, 错误信息)
+def search_stock_symbols(market_type, query, page, page_size):
+    if symbol_search is None:
+        return 0, None, "代码搜索未启用"
+    try:
+        total, stock_list = symbol_search.search(market_type, query, page, page_size)
+        return total, stock_list, None
+    except Exception as e:
+        print(f"搜索股票代码错误: {str(e)}")
+        return 0, None, f"搜索股票代码失败: {str(e)}"
+
+# 解析搜索接口的分页参数，返回 (页码, 每页条数, 错误信息)
+def parse_search_page(args):
+    page = args.get('page', 1, type=int)
+    page_size = args.get('page_size', SYMBOL_SEARCH_CONFIG['page_size'], type=int)
+    if page is None or page < 1:
+        return None, None, "page必须是正整数"
+    if page_size is None or not 1 <= page_size <= SYMBOL_SEARCH_CONFIG['max_page_size']:
+        return None, None, f"page_size必须在1到{SYMBOL_SEARCH_CONFIG['max_page_size']}之间"
+    return page, page_size, None
+
 # API路由：获取股票数据
 @app.route('/api/stock/data', methods=['GET'])
 def api_get_stock_data():
@@ -191,7 +503,11 @@ def api_get_stock_data():
         if data_type not in ['minute', 'day']:
             return jsonify({'error': '数据类型必须是 minute 或 day'}), 400
         
-        data, error = get_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit)
+        resolution, error = parse_resolution(request.args, data_type, start_date, end_date)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        data, error = get_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
         
         if error:
             if '未找到' in error:
@@ -205,6 +521,25 @@ def api_get_stock_data():
         print(traceback.format_exc())
         return jsonify({'error': '服务器内部错误'}), 500
 
+# API路由：获取技术指标（与/api/stock/data相邻，K线取最近的 INDICATOR_CONFIG['max_bars'] 根）
+# 参数：market, code, dataType, resolution（可选，分钟数据的聚合粒度）, indicators（如 ma:5,ma:20,macd,rsi:14,boll:20:2,atr,vwap）, limit
+@app.route('/api/stock/indicators', methods=['GET'])
+def api_get_indicators():
+    try:
+        params, error = parse_indicator_args(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        data, error = get_indicator_data(**params)
+        if error:
+            return jsonify({'error': error}), 404 if '未找到' in error else 500
+        
+        return jsonify(data)
+    except Exception as e:
+        print(f"API错误 (/api/stock/indicators): {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': '服务器内部错误'}), 500
+
 # API路由：获取预测数据
 @app.route('/api/stock/prediction', methods=['GET'])
 def api_get_prediction_data():
@@ -226,7 +561,11 @@ def api_get_prediction_data():
         if data_type not in ['minute', 'day']:
             return jsonify({'error': '数据类型必须是 minute 或 day'}), 400
         
-        data, error = get_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit)
+        resolution, error = parse_resolution(request.args, data_type, start_date, end_date)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        data, error = get_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
         
         if error:
             if '未找到' in error:
@@ -262,17 +601,21 @@ def api_get_multi_stock_data():
         if not include_realtime and not include_prediction:
             return jsonify({'error': '至少需要包含实时或预测数据'}), 400
         
+        resolution, error = parse_resolution(request.args, data_type, start_date, end_date)
+        if error:
+            return jsonify({'error': error}), 400
+        
         results = []
         
         if include_realtime:
-            realtime_data, realtime_error = get_stock_data(market_type, stock_code, data_type, True, start_date, end_date, limit)
+            realtime_data, realtime_error = get_stock_data(market_type, stock_code, data_type, True, start_date, end_date, limit, resolution)
             if realtime_error:
                 print(f"获取实时数据失败: {realtime_error}")
             else:
                 results.append(realtime_data)
         
         if include_prediction:
-            prediction_data, prediction_error = get_stock_data(market_type, stock_code, data_type, False, start_date, end_date, limit)
+            prediction_data, prediction_error = get_stock_data(market_type, stock_code, data_type, False, start_date, end_date, limit, resolution)
             if prediction_error:
                 print(f"获取预测数据失败: {prediction_error}")
             else:
@@ -287,6 +630,43 @@ def api_get_multi_stock_data():
         print(traceback.format_exc())
         return jsonify({'error': '服务器内部错误'}), 500
 
+# API路由：批量获取多个代码的数据（自选股列表）
+# 返回 {'stocks': {代码: 与/api/stock/data相同结构的数据}, 'missing': [没有数据的代码]}
+@app.route('/api/stock/batch', methods=['GET', 'POST'])
+def api_get_batch_data():
+    try:
+        market_type = request.args.get('market', 'cn')
+        data_type = request.args.get('dataType', 'minute')
+        is_realtime = request.args.get('isRealtime', 'true').lower() == 'true'
+        start_date = request.args.get('startTime', '')
+        end_date = request.args.get('endTime', '')
+        limit = request.args.get('limit', 200, type=int)
+        
+        if market_type not in ['cn', 'hk', 'us']:
+            return jsonify({'error': '不支持的市场类型'}), 400
+        
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        codes, error = parse_batch_codes(market_type, (body or {}).get('codes'), request.args.get('codes'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if data_type not in ['minute', 'day']:
+            return jsonify({'error': '数据类型必须是 minute 或 day'}), 400
+        
+        resolution, error = parse_resolution(request.args, data_type, start_date, end_date)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        results, error = get_batch_data(market_type, codes, data_type, is_realtime, start_date, end_date, limit, resolution)
+        if error:
+            return jsonify({'error': error}), 500
+        
+        return jsonify({'stocks': results, 'missing': [code for code in codes if code not in results]})
+    except Exception as e:
+        print(f"API错误 (/api/stock/batch): {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': '服务器内部错误'}), 500
+
 # API路由：获取股票列表
 @app.route('/api/stock/list', methods=['GET'])
 def api_get_stock_list():
@@ -304,6 +684,92 @@ def api_get_stock_list():
         print(traceback.format_exc())
         return jsonify({'error': '服务器内部错误'}), 500
 
+# API路由：搜索股票代码（输入框联想），按代码、英文名、中文名和拼音首字母前缀匹配，其次为包含查询串的股票
+# 参数：market, q, page, page_size；返回 {total, page, page_size, stocks: [{code, name, cname}]}
+@app.route('/api/stock/search', methods=['GET'])
+def api_search_stock():
+    try:
+        market_type = request.args.get('market', 'cn')
+        if market_type not in ['cn', 'hk', 'us']:
+            return jsonify({'error': '不支持的市场类型'}), 400
+        page, page_size, error = parse_search_page(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        total, stock_list, error = search_stock_symbols(market_type, request.args.get('q', ''), page, page_size)
+        if error:
+            return jsonify({'error': error}), 500
+        
+        return jsonify({'total': total, 'page': page, 'page_size': page_size, 'stocks': stock_list})
+    except Exception as e:
+        print(f"API错误 (/api/stock/search): {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': '服务器内部错误'}), 500
+
+# API路由：订阅实时K线更新（SSE）
+# 连接建立后只推送新增或变化的K线（event: bars，数据格式与/api/stock/data的列式结构相同），
+# 收到 event: reset 时客户端应重新请求/api/stock/data加载完整数据
+@app.route('/api/stock/stream', methods=['GET'])
+def api_stock_stream():
+    if live_bus is None:
+        return jsonify({'error': '实时推送未启用'}), 503
+    
+    market_type = request.args.get('market', 'cn')
+    stock_code = request.args.get('code', '')
+    data_type = request.args.get('dataType', 'minute')
+    
+    if not stock_code:
+        return jsonify({'error': '股票代码不能为空'}), 400
+    
+    if market_type == 'cn' and stock_code.lower().startswith(('sh', 'sz')):
+        stock_code = stock_code[2:]
+    
+    if market_type not in ['cn', 'hk', 'us']:
+        return jsonify({'error': '不支持的市场类型'}), 400
+    
+    if data_type not in ['minute', 'day']:
+        return jsonify({'error': '数据类型必须是 minute 或 day'}), 400
+    
+    resolution, error = parse_resolution(request.args, data_type, '', '')
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        key, subscriber = live_bus.subscribe(market_type, stock_code, data_type, resolution)
+    except Exception as e:
+        print(f"API错误 (/api/stock/stream): {str(e)}")
+        return jsonify({'error': '订阅失败'}), 500
+    if key is None:
+        return jsonify({'error': '订阅数已达上限'}), 503
+    
+    def generate():
+        try:
+            # 断线后浏览器3秒后自动重连
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = subscriber.get(timeout=LIVE_STREAM_CONFIG['keepalive'])
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message.get('data', {}))}\n\n"
+        finally:
+            # 客户端断开时生成器被关闭
+            live_bus.unsubscribe(key, subscriber)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+# API路由：查询结果缓存统计
+@app.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    stats = query_cache.stats()
+    if symbol_search is not None:
+        stats['symbols'] = symbol_search.stats()
+    if indicator_cache is not None:
+        stats['indicators'] = indicator_cache.stats()
+    return jsonify(stats)
+
 # 健康检查路由
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -314,5 +780,6 @@ def health_check():
 def index():
     return send_from_directory('.', 'index.html')
 
+# 开发调试用Flask自带服务器，部署时使用asgi_app.py（uvicorn + asyncpg连接池）
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,389 @@
+"""
+ASGI部署入口
+行情查询接口（/api/stock/data、/api/stock/prediction、/api/stock/multi_data、/api/stock/batch、/api/stock/list、/api/stock/search、/api/stock/indicators、/health）
+由Starlette异步处理，通过显式设置大小的asyncpg连接池访问数据库，multi_data的实时和预测数据并发查询，
+每个请求有超时时间；其余路由（SSE推送、缓存统计、首页）挂载原Flask应用，在线程池中执行。
+SQL、缓存键和返回格式与app.py完全相同，查询结果缓存和数据更新通知也与Flask应用共用
+用法：
+    python asgi_app.py
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+import asyncio
+import re
+import traceback
+from contextlib import asynccontextmanager
+import asyncpg
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+from crawler.config import DB_CONFIG, QUERY_CACHE_CONFIG, WEB_SERVER_CONFIG
+from resample import parse_time
+from serializer import TIME_FORMATS, PRICE_COLUMNS, columnar_by_code
+
+# %(name)s 占位符
+_PARAM_PATTERN = re.compile(r'%\((\w+)\)s')
+# 时间参数需要转换为datetime，asyncpg不会把字符串隐式转换为时间类型
+_TIME_PARAMS = {'start_date', 'end_date'}
+
+pool = None
+
+
+def to_asyncpg(sql, params):
+    """把 %(name)s 占位符的SQL转换为asyncpg的 $1, $2 ... 形式，返回 (SQL, 参数列表)"""
+    order = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+
+    converted = _PARAM_PATTERN.sub(replace, sql)
+    values = [parse_time(params[name]) if name in _TIME_PARAMS else params[name] for name in order]
+    return converted, values
+
+
+async def fetch_columnar(sql, params, data_type, reverse=False):
+    """执行select_columns生成的查询，返回与serializer.fetch_columnar相同的 (列式dict, 行数)"""
+    sql, values = to_asyncpg(sql, params)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(sql, *values)
+    if reverse:
+        rows.reverse()
+    time_key, _ = TIME_FORMATS[data_type]
+    keys = [time_key] + PRICE_COLUMNS + ['volume']
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in keys]
+    return dict(zip(keys, columns)), len(rows)
+
+
+async def query_stock_data(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    """异步版本的app.query_stock_data，需要读取归档文件时在线程池中调用原函数"""
+    if flask_app.needs_archive(market_type, data_type, is_realtime, start_date, end_date):
+        return await run_in_threadpool(flask_app.query_stock_data, market_type, stock_code, data_type,
+                                       is_realtime, start_date, end_date, limit, resolution)
+    try:
+        queries = flask_app.build_queries(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+        for i, (sql, params, reverse) in enumerate(queries):
+            is_last = i == len(queries) - 1
+            try:
+                columns, row_count = await fetch_columnar(sql, params, data_type, reverse)
+            except (asyncpg.PostgresError, OSError) as e:
+                if is_last:
+                    raise
+                print(f"读取聚合表失败: {str(e)[:200]}，改为现场聚合")
+                continue
+            if row_count or is_last:
+                break
+
+        if not row_count:
+            return None, f"未找到{stock_code}的{data_type}数据"
+        return flask_app.build_stock_data(columns, data_type, is_realtime, resolution), None
+    except (asyncpg.PostgresError, OSError) as e:
+        print(f"查询数据错误: {str(e)}")
+        print(traceback.format_exc())
+        return None, f"查询数据失败: {str(e)}"
+
+
+async def get_batch_data(market_type, codes, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    """异步版本的app.get_batch_data，缓存和归档部分在线程池中执行"""
+    results, pending = await run_in_threadpool(flask_app.batch_prefetch, market_type, codes, data_type,
+                                               is_realtime, start_date, end_date, limit, resolution)
+    try:
+        queries = flask_app.build_queries(market_type, None, data_type, is_realtime, start_date, end_date, limit, resolution)
+        for i, (sql, params, _) in enumerate(queries):
+            if not pending:
+                break
+            batch_sql, values = to_asyncpg(flask_app.batch_sql(sql), dict(params, codes=pending))
+            try:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(batch_sql, *values)
+            except (asyncpg.PostgresError, OSError) as e:
+                if i == len(queries) - 1:
+                    raise
+                print(f"读取聚合表失败: {str(e)[:200]}，改为现场聚合")
+                continue
+            found = columnar_by_code(rows, data_type)
+            for code, columns in found.items():
+                flask_app.batch_store(results, market_type, code, columns, data_type, is_realtime,
+                                      start_date, end_date, limit, resolution)
+            pending = [code for code in pending if code not in found]
+    except (asyncpg.PostgresError, OSError) as e:
+        print(f"批量查询数据错误: {str(e)}")
+        print(traceback.format_exc())
+        return None, f"查询数据失败: {str(e)}"
+    return results, None
+
+
+async def get_stock_data(market_type, stock_code, data_type, is_realtime, start_date='', end_date='', limit=200, resolution=None):
+    """异步版本的app.get_stock_data，与Flask应用共用查询结果缓存"""
+    if not QUERY_CACHE_CONFIG['enabled']:
+        return await query_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+
+    cache_key = flask_app.stock_cache_key(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+    data = flask_app.query_cache.get(cache_key)
+    if data is not None:
+        return data, None
+
+    data, error = await query_stock_data(market_type, stock_code, data_type, is_realtime, start_date, end_date, limit, resolution)
+    if error is None:
+        flask_app.query_cache.set(cache_key, data)
+    return data, error
+
+
+class QueryArgs:
+    """让Starlette的查询参数支持 get(key, default, type=...)，与Flask的request.args用法一致"""
+
+    def __init__(self, query_params):
+        self.query_params = query_params
+
+    def get(self, key, default=None, type=None):
+        value = self.query_params.get(key)
+        if value is None:
+            return default
+        if type is None:
+            return value
+        try:
+            return type(value)
+        except (TypeError, ValueError):
+            return default
+
+
+def error_response(error):
+    return JSONResponse({'error': error}, status_code=404 if '未找到' in error else 500)
+
+
+def with_timeout(handler):
+    """请求超过WEB_SERVER_CONFIG['request_timeout']秒时返回504，其他未处理的异常返回500"""
+    async def wrapper(request):
+        try:
+            return await asyncio.wait_for(handler(request), WEB_SERVER_CONFIG['request_timeout'])
+        except asyncio.TimeoutError:
+            print(f"请求超时 ({request.url.path}): {request.url.query}")
+            return JSONResponse({'error': '请求超时'}, status_code=504)
+        except Exception as e:
+            print(f"API错误 ({request.url.path}): {str(e)}")
+            print(traceback.format_exc())
+            return JSONResponse({'error': '服务器内部错误'}, status_code=500)
+    return wrapper
+
+
+def parse_stock_args(request):
+    """解析公共查询参数，返回 (参数dict, 错误信息)"""
+    args = QueryArgs(request.query_params)
+    market_type = args.get('market', 'cn')
+    stock_code = args.get('code', '')
+    data_type = args.get('dataType', 'minute')
+    start_date = args.get('startTime', '')
+    end_date = args.get('endTime', '')
+
+    if not stock_code:
+        return None, '股票代码不能为空'
+    if data_type not in ['minute', 'day']:
+        return None, '数据类型必须是 minute 或 day'
+    resolution, error = flask_app.parse_resolution(args, data_type, start_date, end_date)
+    if error:
+        return None, error
+    return {
+        'market_type': market_type,
+        'stock_code': stock_code,
+        'data_type': data_type,
+        'start_date': start_date,
+        'end_date': end_date,
+        'limit': args.get('limit', 200, type=int),
+        'resolution': resolution
+    }, None
+
+
+def strip_cn_prefix(params):
+    if params['market_type'] == 'cn' and params['stock_code'].lower().startswith(('sh', 'sz')):
+        params['stock_code'] = params['stock_code'][2:]
+
+
+@with_timeout
+async def api_get_stock_data(request):
+    params, error = parse_stock_args(request)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    strip_cn_prefix(params)
+    is_realtime = request.query_params.get('isRealtime', 'true').lower() == 'true'
+    data, error = await get_stock_data(is_realtime=is_realtime, **params)
+    if error:
+        return error_response(error)
+    return JSONResponse(data)
+
+
+@with_timeout
+async def api_get_prediction_data(request):
+    params, error = parse_stock_args(request)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    strip_cn_prefix(params)
+    data, error = await get_stock_data(is_realtime=False, **params)
+    if error:
+        return error_response(error)
+    return JSONResponse(data)
+
+
+@with_timeout
+async def api_get_multi_stock_data(request):
+    params, error = parse_stock_args(request)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    include_realtime = request.query_params.get('include_realtime', 'true').lower() == 'true'
+    include_prediction = request.query_params.get('include_prediction', 'false').lower() == 'true'
+    if not include_realtime and not include_prediction:
+        return JSONResponse({'error': '至少需要包含实时或预测数据'}, status_code=400)
+
+    # 实时和预测数据并发查询，各占用一个连接
+    kinds = [is_realtime for is_realtime, included in [(True, include_realtime), (False, include_prediction)] if included]
+    responses = await asyncio.gather(*[get_stock_data(is_realtime=is_realtime, **params) for is_realtime in kinds])
+
+    results = []
+    for is_realtime, (data, error) in zip(kinds, responses):
+        if error:
+            print(f"获取{'实时' if is_realtime else '预测'}数据失败: {error}")
+        else:
+            results.append(data)
+    if not results:
+        return JSONResponse({'error': '未能获取任何数据'}, status_code=500)
+    return JSONResponse(results)
+
+
+@with_timeout
+async def api_get_batch_data(request):
+    args = QueryArgs(request.query_params)
+    market_type = args.get('market', 'cn')
+    data_type = args.get('dataType', 'minute')
+    is_realtime = args.get('isRealtime', 'true').lower() == 'true'
+    start_date = args.get('startTime', '')
+    end_date = args.get('endTime', '')
+
+    if market_type not in ['cn', 'hk', 'us']:
+        return JSONResponse({'error': '不支持的市场类型'}, status_code=400)
+    body = None
+    if request.method == 'POST':
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+    body_codes = body.get('codes') if isinstance(body, dict) else None
+    codes, error = flask_app.parse_batch_codes(market_type, body_codes, args.get('codes'))
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    if data_type not in ['minute', 'day']:
+        return JSONResponse({'error': '数据类型必须是 minute 或 day'}, status_code=400)
+    resolution, error = flask_app.parse_resolution(args, data_type, start_date, end_date)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+
+    results, error = await get_batch_data(market_type, codes, data_type, is_realtime, start_date, end_date,
+                                          args.get('limit', 200, type=int), resolution)
+    if error:
+        return JSONResponse({'error': error}, status_code=500)
+    return JSONResponse({'stocks': results, 'missing': [code for code in codes if code not in results]})
+
+
+@with_timeout
+async def api_get_stock_list(request):
+    table_map = {'cn': 'cn_stocks', 'hk': 'hk_stocks', 'us': 'us_stocks'}
+    market_type = request.query_params.get('market', 'cn')
+    if market_type not in table_map:
+        return JSONResponse({'error': '不支持的市场类型'}, status_code=500)
+    if flask_app.symbol_search is not None:
+        # 代码搜索索引在内存中，不需要访问数据库；索引尚未加载时首次请求会同步查询代码表，在线程池中执行
+        stock_list, error = await run_in_threadpool(flask_app.get_stock_list, market_type)
+        if error:
+            return JSONResponse({'error': error}, status_code=500)
+        return JSONResponse(stock_list)
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f"SELECT DISTINCT code, name FROM {table_map[market_type]} LIMIT 100")
+    except (asyncpg.PostgresError, OSError) as e:
+        print(f"查询股票列表错误: {str(e)}")
+        return JSONResponse({'error': f"查询股票列表失败: {str(e)}"}, status_code=500)
+    if not rows:
+        return JSONResponse({'error': f"未找到{market_type}市场的股票列表"}, status_code=500)
+    return JSONResponse([{'code': row['code'], 'name': row['name']} for row in rows])
+
+
+@with_timeout
+async def api_search_stock(request):
+    args = QueryArgs(request.query_params)
+    market_type = args.get('market', 'cn')
+    if market_type not in ['cn', 'hk', 'us']:
+        return JSONResponse({'error': '不支持的市场类型'}, status_code=400)
+    page, page_size, error = flask_app.parse_search_page(args)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    # 索引尚未加载时首次搜索会同步查询代码表重建索引，容错匹配也可能耗时数毫秒，都放在线程池中执行，不阻塞事件循环
+    total, stock_list, error = await run_in_threadpool(flask_app.search_stock_symbols, market_type, args.get('q', ''),
+                                                       page, page_size)
+    if error:
+        return JSONResponse({'error': error}, status_code=500)
+    return JSONResponse({'total': total, 'page': page, 'page_size': page_size, 'stocks': stock_list})
+
+
+@with_timeout
+async def api_get_indicators(request):
+    params, error = flask_app.parse_indicator_args(QueryArgs(request.query_params))
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    # 指标缓存在内存中，只有新K线的增量查询访问数据库，在线程池中执行
+    data, error = await run_in_threadpool(flask_app.get_indicator_data, **params)
+    if error:
+        return error_response(error)
+    return JSONResponse(data)
+
+
+async def health_check(request):
+    return JSONResponse({'status': 'healthy'})
+
+
+@asynccontextmanager
+async def lifespan(application):
+    global pool
+    pool = await asyncpg.create_pool(
+        host=DB_CONFIG['host'],
+        port=DB_CONFIG['port'],
+        database=DB_CONFIG['database'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        min_size=WEB_SERVER_CONFIG['pool_min_size'],
+        max_size=WEB_SERVER_CONFIG['pool_max_size'],
+        command_timeout=WEB_SERVER_CONFIG['request_timeout']
+    )
+    print(f"数据库连接池已创建: {WEB_SERVER_CONFIG['pool_min_size']}~{WEB_SERVER_CONFIG['pool_max_size']} 个连接")
+    try:
+        yield
+    finally:
+        await pool.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/stock/data', api_get_stock_data, methods=['GET']),
+        Route('/api/stock/prediction', api_get_prediction_data, methods=['GET']),
+        Route('/api/stock/multi_data', api_get_multi_stock_data, methods=['GET']),
+        Route('/api/stock/batch', api_get_batch_data, methods=['GET', 'POST']),
+        Route('/api/stock/list', api_get_stock_list, methods=['GET']),
+        Route('/api/stock/search', api_search_stock, methods=['GET']),
+        Route('/api/stock/indicators', api_get_indicators, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        # 其余路由由Flask应用处理，SSE长连接各占用一个线程
+        Mount('/', app=WSGIMiddleware(flask_app.app, workers=WEB_SERVER_CONFIG['wsgi_threads']))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['GET', 'POST'], allow_headers=['Content-Type'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi_app:app', host=WEB_SERVER_CONFIG['host'], port=WEB_SERVER_CONFIG['port'],
+                workers=WEB_SERVER_CONFIG['workers'])
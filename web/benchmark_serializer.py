@@ -0,0 +1,129 @@
+"""
+查询序列化基准测试：对比原get_stock_data中 fetchall + DataFrame 的处理流程与serializer的列式序列化
+分别测量10k、100k、1M行的耗时和峰值内存（RSS），每个用例在单独的子进程中运行，峰值内存互不影响
+用法：
+    python benchmark_serializer.py --rows 10000 100000 1000000
+会在数据库中创建 benchmark_serializer 表，测试结束后删除
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.config import DB_CONFIG
+from serializer import select_columns, fetch_columnar
+
+db_url = f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+
+BENCH_TABLE = 'benchmark_serializer'
+BENCH_CODE = '600519'
+
+
+def prepare_table(engine, rows):
+    """用generate_series生成rows行分钟数据"""
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (LIKE cn_data_realtime INCLUDING ALL)"))
+        conn.execute(text(f"""
+            INSERT INTO {BENCH_TABLE} (code, datetime, open, high, low, close, volume)
+            SELECT :code, TIMESTAMP '2020-01-02 09:30' + i * INTERVAL '1 minute',
+                   10 + random() * 100, 12 + random() * 100, 8 + random() * 100, 10 + random() * 100,
+                   (random() * 100000)::bigint
+            FROM generate_series(1, :rows) AS i
+        """), {'code': BENCH_CODE, 'rows': rows})
+        conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+
+
+def legacy_serialize(engine, rows):
+    """原get_stock_data的处理流程：fetchall -> DataFrame -> 逐列转换 -> tolist"""
+    with engine.connect() as conn:
+        result = conn.execute(text(f"""
+            SELECT datetime, open, high, low, close, volume
+            FROM {BENCH_TABLE}
+            WHERE code = :code
+            ORDER BY datetime DESC
+            LIMIT :limit
+        """), {'code': BENCH_CODE, 'limit': rows})
+        rows = result.fetchall()
+        df = pd.DataFrame(rows, columns=result.keys())
+    if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+        df = df.dropna(subset=['datetime'])
+    df = df.sort_values('datetime')
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['volume'] = df['volume'].astype(int)
+    data = {'datetime': df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()}
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        data[col] = df[col].tolist()
+    return data
+
+
+def columnar_serialize(engine, rows):
+    """新的处理流程：服务端游标分批读取，直接生成列式结构"""
+    sql = f"""
+        SELECT {select_columns('minute')}
+        FROM {BENCH_TABLE}
+        WHERE code = %(code)s
+        ORDER BY datetime DESC
+        LIMIT %(limit)s
+    """
+    data, _ = fetch_columnar(engine, sql, {'code': BENCH_CODE, 'limit': rows}, 'minute', reverse=True)
+    return data
+
+
+CASES = {'legacy': legacy_serialize, 'columnar': columnar_serialize}
+
+
+def peak_rss_mb():
+    """当前进程的峰值RSS（MB），Linux上ru_maxrss单位为KB，macOS上为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case, rows, queue):
+    """在子进程中运行一个用例，返回耗时和峰值内存增量"""
+    engine = create_engine(db_url)
+    # 先建立连接，排除连接开销
+    with engine.connect():
+        pass
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    data = CASES[case](engine, rows)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_mb() - baseline, len(data['close'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查询序列化基准测试')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help='测试行数')
+    args = parser.parse_args()
+
+    engine = create_engine(db_url)
+    context = multiprocessing.get_context('spawn')
+    print(f"{'行数':>10} {'流程':<10} {'耗时(秒)':>10} {'峰值内存增量(MB)':>18}")
+    try:
+        for rows in args.rows:
+            prepare_table(engine, rows)
+            results = {}
+            for case in CASES:
+                queue = context.Queue()
+                process = context.Process(target=run_case, args=(case, rows, queue))
+                process.start()
+                elapsed, rss, count = queue.get()
+                process.join()
+                results[case] = elapsed
+                print(f"{count:>10,} {case:<10} {elapsed:>10.3f} {rss:>18.1f}")
+            print(f"{'':>10} 列式序列化提速 {results['legacy'] / results['columnar']:.1f}x")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
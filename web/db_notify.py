@@ -0,0 +1,89 @@
+"""
+数据库通知监听模块
+后台线程LISTEN爬虫写入数据时发送的NOTIFY，解析JSON payload后回调注册的处理函数
+连接断开时自动重连，重连期间可能漏掉通知，重连成功后回调 on_reconnect
+"""
+import json
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+
+
+class NotifyListener:
+    """在后台线程中监听一个PostgreSQL通知频道"""
+
+    def __init__(self, db_config, channel, on_reconnect=None, retry_interval=5):
+        self.db_config = db_config
+        self.channel = channel
+        self.on_reconnect = on_reconnect
+        self.retry_interval = retry_interval
+        self._callbacks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """注册回调函数 callback(payload)，payload为解析后的dict"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"listen-{self.channel}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            host=self.db_config['host'],
+            port=self.db_config['port'],
+            dbname=self.db_config['database'],
+            user=self.db_config['user'],
+            password=self.db_config['password']
+        )
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _dispatch(self, raw_payload):
+        try:
+            payload = json.loads(raw_payload) if raw_payload else {}
+        except ValueError:
+            print(f"⚠️ 无法解析的通知内容: {raw_payload[:100]}")
+            return
+        for callback in self._callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"处理数据更新通知失败: {e}")
+
+    def _run(self):
+        first_connect = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                print(f"已开始监听数据更新通知: {self.channel}")
+                if not first_connect and self.on_reconnect is not None:
+                    self.on_reconnect()
+                first_connect = False
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.payload)
+            except Exception as e:
+                print(f"监听数据更新通知出错: {str(e)[:200]}，{self.retry_interval} 秒后重连")
+                first_connect = False
+                self._stop.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
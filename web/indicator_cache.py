@@ -0,0 +1,199 @@
+"""
+技术指标缓存模块
+每个 (市场, 代码, 数据类型, 粒度) 缓存最近max_bars根K线的数组，以及其上每个指标的输出和状态。
+最后一根K线可能还在形成中，缓存的状态是计算到倒数第二根为止的状态：
+收到爬虫写入后的NOTIFY（或超过ttl）时只查询最后一根K线及之后的数据，
+从保存的状态继续计算新K线的指标（EMA/RSI等递推值向前传递），不重算全部历史
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from serializer import TIME_FORMATS, PRICE_COLUMNS, select_columns, fetch_columnar
+from live_bus import stream_table
+from resample import source_table
+import indicators
+
+BAR_COLUMNS = PRICE_COLUMNS + ['volume']
+
+
+def slice_bars(bars, start, stop=None):
+    """截取K线的一段，保留是否为分钟数据的标记"""
+    part = {key: bars[key][start:stop] for key in ['time'] + BAR_COLUMNS}
+    part['intraday'] = bars['intraday']
+    return part
+
+
+class IndicatorSeries:
+    """一只股票一个粒度的K线、各指标的输出和状态"""
+
+    def __init__(self, key):
+        self.key = key
+        self.bars = None
+        self.outputs = {}        # (指标名, 参数) -> {输出名: 数组}
+        self.states = {}         # (指标名, 参数) -> 计算到倒数第二根K线时的状态
+        self.dirty = True
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _compute(self, spec, bars, state):
+        """
+        从state开始计算bars的指标，返回 (输出, 倒数第二根K线之后的状态)
+        最后一根单独计算，下次更新时它可能被新数据替换，从返回的状态重算即可
+        """
+        name, params = spec
+        if len(bars['close']) > 1:
+            head, state = indicators.compute(name, params, slice_bars(bars, 0, -1), state)
+        else:
+            head = None
+        last, _ = indicators.compute(name, params, slice_bars(bars, -1), state)
+        if head is not None:
+            last = {key: np.concatenate([head[key], values]) for key, values in last.items()}
+        return last, state
+
+    def rebuild(self, bars, specs):
+        """K线整体替换，所有指标从头计算"""
+        self.bars = bars
+        self.outputs, self.states = {}, {}
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec):
+        if spec not in self.outputs and len(self.bars['close']):
+            self.outputs[spec], self.states[spec] = self._compute(spec, self.bars, None)
+
+    def extend(self, new_bars, max_bars):
+        """
+        合并从最后一根K线开始查询到的新数据：替换最后一根、追加其余K线，从保存的状态继续计算各指标
+        返回：False表示新数据与缓存不衔接（如最后一根K线被删除），需要整体重新加载
+        """
+        times = self.bars['time']
+        keep = bisect.bisect_left(times, new_bars['time'][0])
+        if keep != len(times) - 1:
+            return False
+        bars = {key: np.concatenate([self.bars[key][:keep], new_bars[key]]) for key in BAR_COLUMNS}
+        bars['time'] = times[:keep] + new_bars['time']
+        bars['intraday'] = self.bars['intraday']
+        self.bars = bars
+        for spec in list(self.outputs):
+            tail, self.states[spec] = self._compute(spec, new_bars, self.states[spec])
+            self.outputs[spec] = {
+                key: np.concatenate([values[:keep], tail[key]]) for key, values in self.outputs[spec].items()
+            }
+        self.trim(max_bars)
+        return True
+
+    def trim(self, max_bars):
+        """只保留最近max_bars根K线，状态已向前传递，不受截断影响"""
+        drop = len(self.bars['time']) - max_bars
+        if drop > 0:
+            self.bars = slice_bars(self.bars, drop)
+            for spec, outputs in self.outputs.items():
+                self.outputs[spec] = {key: values[drop:] for key, values in outputs.items()}
+
+
+class IndicatorCache:
+    """按股票和粒度缓存K线与指标，线程安全，超过max_series时淘汰最久未使用的"""
+
+    def __init__(self, engine, max_bars=5000, max_series=500, ttl=60):
+        self.engine = engine
+        self.max_bars = max_bars
+        self.max_series = max_series
+        self.ttl = ttl
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_updates = 0
+
+    def _query(self, key, since):
+        """查询最近max_bars根K线，since不为None时查询since（含）之后的K线，返回按时间正序的数组"""
+        market_type, code, data_type, resolution = key
+        time_type = 'minute' if resolution else data_type
+        table_name = stream_table(market_type, data_type, resolution)
+        if since is None:
+            sql = f"""
+                SELECT {select_columns(time_type)} FROM {table_name}
+                WHERE code = %(code)s
+                ORDER BY datetime DESC
+                LIMIT %(limit)s
+            """
+        else:
+            sql = f"""
+                SELECT {select_columns(time_type)} FROM {table_name}
+                WHERE code = %(code)s AND datetime >= %(since)s
+                ORDER BY datetime ASC
+            """
+        columns, _ = fetch_columnar(self.engine, sql, {'code': code, 'since': since, 'limit': self.max_bars},
+                                    time_type, reverse=since is None)
+        time_key, _ = TIME_FORMATS[time_type]
+        bars = {column: np.asarray(columns[column], dtype=np.float64) for column in BAR_COLUMNS}
+        bars['time'] = columns[time_key]
+        # 1d粒度和日线数据按整个序列累计VWAP，其余按交易日累计
+        bars['intraday'] = data_type == 'minute' and resolution != '1d'
+        return bars
+
+    def _get_series(self, key):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = IndicatorSeries(key)
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+            self._series.move_to_end(key)
+            return series
+
+    def get(self, market_type, code, data_type, resolution, specs, limit):
+        """
+        返回最近limit根K线的时间和各指标的值
+        参数：
+            specs: (指标名, 参数元组) 的列表
+        返回：(时间列表, {(指标名, 参数): {输出名: 数组}})，没有K线数据时返回 (None, None)
+        """
+        key = (market_type, code, data_type, resolution)
+        series = self._get_series(key)
+        with series.lock:
+            stale = series.dirty or time.monotonic() - series.checked_at > self.ttl
+            if series.bars is None or not len(series.bars['time']):
+                series.rebuild(self._query(key, None), specs)
+                self.full_loads += 1
+            elif stale:
+                new_bars = self._query(key, series.bars['time'][-1])
+                if len(new_bars['time']):
+                    if series.extend(new_bars, self.max_bars):
+                        self.incremental_updates += 1
+                    else:
+                        series.rebuild(self._query(key, None), specs)
+                        self.full_loads += 1
+            series.dirty = False
+            series.checked_at = time.monotonic()
+
+            if not len(series.bars['time']):
+                return None, None
+            for spec in specs:
+                series.add(spec)
+            start = max(0, len(series.bars['time']) - limit)
+            return series.bars['time'][start:], {spec: {
+                name: values[start:] for name, values in series.outputs[spec].items()
+            } for spec in specs}
+
+    def on_data_updated(self, table_name, codes):
+        """数据更新通知的回调，标记对应代码需要增量更新（分钟表的更新同时覆盖其聚合粒度）"""
+        codes = set(codes or [])
+        with self._lock:
+            for (market_type, code, data_type, _), series in self._series.items():
+                if source_table(market_type, data_type) == table_name and (not codes or code in codes):
+                    series.dirty = True
+
+    def clear(self):
+        """通知重连期间可能漏掉历史数据的修改，丢弃全部缓存"""
+        with self._lock:
+            self._series.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'full_loads': self.full_loads,
+                'incremental_updates': self.incremental_updates
+            }
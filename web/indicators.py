@@ -0,0 +1,214 @@
+"""
+技术指标计算模块
+指标以NumPy向量运算实现，输入为float64连续数组：
+    ma:周期            简单移动平均
+    ema:周期           指数移动平均
+    macd:快:慢:信号    MACD（DIF、DEA、柱）
+    rsi:周期           相对强弱指数（Wilder平滑）
+    boll:周期:倍数     布林带（中轨、上轨、下轨，总体标准差）
+    atr:周期           平均真实波幅（Wilder平滑）
+    vwap               成交量加权平均价，分钟数据每个交易日重新累计
+每个指标函数的签名为 kernel(bars, params, state) -> (输出dict, state)：
+state为计算到输入之前一根K线时的状态（EMA值、上一根收盘价、滚动窗口尾部等），None表示从头计算，
+新K线到达时只需把上次的state和新K线传入，不需要重算全部历史（见indicator_cache.py）
+递推类指标（EMA、Wilder平滑）按块用闭式解向量化：块内 y[j] = d^(j+1) * (c + a * Σ x[i] * d^-(i+1))，
+块长度保证 d^-L 不超过1e100，块之间传递最后一个值
+"""
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 递推块内缩放因子的上限（10的幂）
+MAX_SCALE_EXPONENT = 100
+
+
+def ema_kernel(x, alpha, prev=None):
+    """
+    指数平滑 y[t] = alpha * x[t] + (1 - alpha) * y[t-1]
+    prev为x之前一根的平滑值，None时以x[0]为初值
+    返回：与x等长的数组
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.empty_like(x)
+    if len(x) == 0:
+        return y
+    decay = 1.0 - alpha
+    if decay <= 0:
+        y[:] = x
+        return y
+    carry = x[0] if prev is None else prev
+    block = max(1, int(MAX_SCALE_EXPONENT * math.log(10) / -math.log(decay)))
+    for start in range(0, len(x), block):
+        chunk = x[start:start + block]
+        scale = decay ** -np.arange(1, len(chunk) + 1, dtype=np.float64)
+        y[start:start + len(chunk)] = (carry + alpha * np.cumsum(chunk * scale)) / scale
+        carry = y[start + len(chunk) - 1]
+    return y
+
+
+def rolling_window(x, n, tail):
+    """把上次保留的窗口尾部接在x前面，返回 (拼接后的数组, 新的尾部)"""
+    full = np.concatenate([tail, x]) if tail is not None else np.asarray(x, dtype=np.float64)
+    return full, full[max(0, len(full) - (n - 1)):] if n > 1 else full[:0]
+
+
+def ma(bars, params, state):
+    """简单移动平均，state为最近 n-1 根收盘价，窗口不满时为NaN"""
+    n, = params
+    full, tail = rolling_window(bars['close'], n, state)
+    out = np.full(len(full), np.nan)
+    if len(full) >= n:
+        sums = np.concatenate([[0.0], np.cumsum(full)])
+        out[n - 1:] = (sums[n:] - sums[:-n]) / n
+    return {'ma': out[len(full) - len(bars['close']):]}, tail
+
+
+def ema(bars, params, state):
+    """指数移动平均，alpha = 2 / (n + 1)，state为上一根的EMA值"""
+    n, = params
+    out = ema_kernel(bars['close'], 2.0 / (n + 1), state)
+    return {'ema': out}, out[-1] if len(out) else state
+
+
+def macd(bars, params, state):
+    """MACD：DIF = EMA(快) - EMA(慢)，DEA = EMA(DIF, 信号)，柱 = (DIF - DEA) * 2；state为三条EMA的最后值"""
+    fast, slow, signal = params
+    fast_prev, slow_prev, signal_prev = state or (None, None, None)
+    close = bars['close']
+    ema_fast = ema_kernel(close, 2.0 / (fast + 1), fast_prev)
+    ema_slow = ema_kernel(close, 2.0 / (slow + 1), slow_prev)
+    dif = ema_fast - ema_slow
+    dea = ema_kernel(dif, 2.0 / (signal + 1), signal_prev)
+    if len(close):
+        state = (ema_fast[-1], ema_slow[-1], dea[-1])
+    return {'dif': dif, 'dea': dea, 'hist': (dif - dea) * 2}, state
+
+
+def rsi(bars, params, state):
+    """RSI，涨幅和跌幅分别做Wilder平滑（alpha = 1/n）；state为 (上一根收盘价, 平均涨幅, 平均跌幅)"""
+    n, = params
+    close = bars['close']
+    if not len(close):
+        return {'rsi': np.empty(0)}, state
+    prev_close, gain_prev, loss_prev = state or (None, None, None)
+    if prev_close is None:
+        # 第一根K线没有涨跌，不参与平滑
+        change = np.diff(close)
+        out = np.full(len(close), np.nan)
+        if not len(change):
+            return {'rsi': out}, (close[-1], None, None)
+        offset = 1
+    else:
+        change = np.diff(close, prepend=prev_close)
+        out = np.empty(len(close))
+        offset = 0
+    gain = ema_kernel(np.maximum(change, 0), 1.0 / n, gain_prev)
+    loss = ema_kernel(np.maximum(-change, 0), 1.0 / n, loss_prev)
+    total = gain + loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[offset:] = np.where(total > 0, 100 * gain / total, 50.0)
+    return {'rsi': out}, (close[-1], gain[-1], loss[-1])
+
+
+def boll(bars, params, state):
+    """布林带：中轨为n日均线，上下轨为中轨 ± k倍总体标准差；state为最近 n-1 根收盘价"""
+    n, k = params
+    full, tail = rolling_window(bars['close'], n, state)
+    mid = np.full(len(full), np.nan)
+    std = np.full(len(full), np.nan)
+    if len(full) >= n:
+        windows = sliding_window_view(full, n)
+        mid[n - 1:] = windows.mean(axis=1)
+        std[n - 1:] = windows.std(axis=1)
+    skip = len(full) - len(bars['close'])
+    mid, std = mid[skip:], std[skip:]
+    return {'mid': mid, 'upper': mid + k * std, 'lower': mid - k * std}, tail
+
+
+def atr(bars, params, state):
+    """ATR，真实波幅 max(最高-最低, |最高-昨收|, |最低-昨收|) 做Wilder平滑；state为 (上一根收盘价, 上一根ATR)"""
+    n, = params
+    high, low, close = bars['high'], bars['low'], bars['close']
+    if not len(close):
+        return {'atr': np.empty(0)}, state
+    prev_close, atr_prev = state or (None, None)
+    previous = np.concatenate([[close[0] if prev_close is None else prev_close], close[:-1]])
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+    out = ema_kernel(true_range, 1.0 / n, atr_prev)
+    return {'atr': out}, (close[-1], out[-1])
+
+
+def vwap(bars, params, state):
+    """
+    VWAP，典型价 (最高+最低+收盘)/3 按成交量加权累计；分钟数据每个交易日重新累计，日线数据在整个序列上累计
+    state为 (最后一根的交易日, 累计成交额, 累计成交量)
+    """
+    high, low, close, volume = bars['high'], bars['low'], bars['close'], bars['volume']
+    if not len(close):
+        return {'vwap': np.empty(0)}, state
+    typical = (high + low + close) / 3
+    amount = typical * volume
+    sessions = np.array([value[:10] for value in bars['time']]) if bars['intraday'] else np.zeros(len(close))
+    starts = np.concatenate([[True], sessions[1:] != sessions[:-1]])
+    segment = np.cumsum(starts) - 1
+    amount_sum = np.cumsum(amount)
+    volume_sum = np.cumsum(volume)
+    # 减去每个交易日开始之前的累计值
+    amount_sum -= (amount_sum - amount)[starts][segment]
+    volume_sum -= (volume_sum - volume)[starts][segment]
+    if state is not None and state[0] == sessions[0]:
+        first = segment == 0
+        amount_sum[first] += state[1]
+        volume_sum[first] += state[2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(volume_sum > 0, amount_sum / volume_sum, typical)
+    return {'vwap': out}, (sessions[-1], amount_sum[-1], volume_sum[-1])
+
+
+# 指标名 -> (计算函数, 参数类型, 默认参数)
+INDICATORS = {
+    'ma': (ma, (int,), (20,)),
+    'ema': (ema, (int,), (20,)),
+    'macd': (macd, (int, int, int), (12, 26, 9)),
+    'rsi': (rsi, (int,), (14,)),
+    'boll': (boll, (int, float), (20, 2.0)),
+    'atr': (atr, (int,), (14,)),
+    'vwap': (vwap, (), ())
+}
+
+# 周期参数的上限
+MAX_PERIOD = 1000
+
+
+def parse_indicator(text):
+    """
+    解析指标描述，如 ma:20、macd:12:26:9、boll:20:2、vwap，省略的参数取默认值
+    返回：((指标名, 参数元组), 错误信息)
+    """
+    name, *values = text.strip().lower().split(':')
+    if name not in INDICATORS:
+        return None, f"不支持的指标: {name}，可选 {', '.join(INDICATORS)}"
+    _, types, defaults = INDICATORS[name]
+    if len(values) > len(types):
+        return None, f"指标 {name} 最多 {len(types)} 个参数"
+    try:
+        params = tuple(cast(value) for cast, value in zip(types, values)) + defaults[len(values):]
+    except ValueError:
+        return None, f"指标参数格式错误: {text}"
+    for cast, value in zip(types, params):
+        if cast is int and not 1 <= value <= MAX_PERIOD:
+            return None, f"指标周期必须在1到{MAX_PERIOD}之间: {text}"
+        if cast is float and not 0 < value <= 10:
+            return None, f"指标倍数必须在0到10之间: {text}"
+    return (name, params), None
+
+
+def spec_label(name, params):
+    """指标在返回结果中的键，如 ma:20、macd:12:26:9"""
+    return ':'.join([name] + [f"{value:g}" for value in params])
+
+
+def compute(name, params, bars, state=None):
+    """计算一个指标，返回 (输出dict, state)"""
+    kernel, _, _ = INDICATORS[name]
+    return kernel(bars, params, state)
@@ -0,0 +1,155 @@
+"""
+实时K线推送模块
+前端通过SSE订阅 (市场, 代码, 数据类型, 粒度)，相同订阅的客户端归为一组。
+收到爬虫写入后的NOTIFY时，每组只查询一次数据库（从该组最后推送的K线时间开始），
+把新增或变化的K线放入组内每个客户端的队列，N个看板只需要一次查询，不需要各自轮询
+客户端队列写满（消费太慢）时清空队列并发送reset，客户端收到后重新加载完整数据
+"""
+import queue
+import threading
+from serializer import TIME_FORMATS, select_columns, fetch_columnar
+from resample import source_table, rollup_table
+
+# 通知重连或客户端消费太慢时发送的消息，客户端需要重新加载完整数据
+RESET = {'event': 'reset'}
+
+
+def stream_table(market_type, data_type, resolution):
+    """订阅对应的查询表：爬虫写入的分钟/日线表，或爬虫维护的分钟聚合表"""
+    if data_type == 'minute' and resolution:
+        return rollup_table(market_type, resolution)
+    return source_table(market_type, data_type)
+
+
+class BarGroup:
+    """同一订阅的客户端队列和最后推送的K线"""
+
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = set()
+        self.last_bar = None
+        self.lock = threading.Lock()
+
+
+class LiveBus:
+    """按订阅分组的K线推送总线，NotifyListener的回调线程中查询并分发"""
+
+    def __init__(self, engine, queue_size=100, max_subscribers=1000):
+        self.engine = engine
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(group.subscribers) for group in self._groups.values())
+
+    def subscribe(self, market_type, code, data_type, resolution=None):
+        """
+        订阅一只股票的K线更新
+        返回：(订阅key, 消息队列)，订阅数达到上限时返回 (None, None)
+        """
+        key = (market_type, code, data_type, resolution)
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if sum(len(group.subscribers) for group in self._groups.values()) >= self.max_subscribers:
+                return None, None
+            group = self._groups.get(key)
+            is_new = group is None
+            if is_new:
+                group = self._groups[key] = BarGroup(key)
+            group.subscribers.add(subscriber)
+        if is_new:
+            # 新的一组：以当前最新一根K线为起点，之后只推送新增或变化的K线
+            with group.lock:
+                bars = self._query(key, since=None)
+                if bars:
+                    group.last_bar = bars[-1]
+        return key, subscriber
+
+    def unsubscribe(self, key, subscriber):
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                return
+            group.subscribers.discard(subscriber)
+            if not group.subscribers:
+                del self._groups[key]
+
+    def _query(self, key, since):
+        """查询since（含）之后的K线，since为None时只取最新一根，返回按时间正序的行元组列表"""
+        market_type, code, data_type, resolution = key
+        table_name = stream_table(market_type, data_type, resolution)
+        columns_sql = select_columns('minute' if resolution else data_type)
+        if since is None:
+            sql = f"""
+                SELECT {columns_sql} FROM {table_name}
+                WHERE code = %(code)s
+                ORDER BY datetime DESC
+                LIMIT 1
+            """
+        else:
+            sql = f"""
+                SELECT {columns_sql} FROM {table_name}
+                WHERE code = %(code)s AND datetime >= %(since)s
+                ORDER BY datetime ASC
+            """
+        columns, _ = fetch_columnar(self.engine, sql, {'code': code, 'since': since}, 'minute' if resolution else data_type)
+        return list(zip(*columns.values()))
+
+    def _publish(self, group, message):
+        for subscriber in list(group.subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 客户端消费太慢，丢弃积压的消息，通知其重新加载
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(RESET)
+
+    def _refresh(self, group):
+        """查询组内最后推送的K线之后的数据，推送新增或变化的K线"""
+        with group.lock:
+            since = group.last_bar[0] if group.last_bar else None
+            bars = self._query(group.key, since)
+            if since is not None:
+                bars = [bar for bar in bars if bar != group.last_bar]
+            if not bars:
+                return
+            group.last_bar = bars[-1]
+        data_type = group.key[2] if not group.key[3] else 'minute'
+        time_key, _ = TIME_FORMATS[data_type]
+        keys = [time_key, 'open', 'high', 'low', 'close', 'volume']
+        self._publish(group, {'event': 'bars', 'data': dict(zip(keys, map(list, zip(*bars))))})
+
+    def on_data_updated(self, table_name, codes):
+        """
+        数据更新通知的回调
+        参数：
+            table_name: 爬虫写入的表名（如 cn_data_realtime），分钟表的更新同时覆盖其聚合表
+            codes: 更新的代码列表，为空时视为该表全部代码
+        """
+        codes = set(codes or [])
+        with self._lock:
+            groups = [
+                group for (market_type, code, data_type, _), group in self._groups.items()
+                if source_table(market_type, data_type) == table_name and (not codes or code in codes)
+            ]
+        for group in groups:
+            try:
+                self._refresh(group)
+            except Exception as e:
+                print(f"推送K线更新失败 {group.key}: {str(e)[:200]}")
+
+    def on_reconnect(self):
+        """通知连接重连期间可能漏掉更新，通知所有客户端重新加载"""
+        with self._lock:
+            groups = list(self._groups.values())
+        for group in groups:
+            with group.lock:
+                group.last_bar = None
+            self._publish(group, RESET)
@@ -0,0 +1,73 @@
+"""
+web服务压力测试
+每档并发数启动对应数量的客户端协程，在duration秒内循环请求，统计吞吐（RPS）、p50/p99延迟和错误数。
+可用于对比Flask开发服务器（python app.py）和ASGI部署（python asgi_app.py）
+用法：
+    python loadtest.py --url "http://localhost:5001/api/stock/data?market=cn&code=600519&dataType=minute&limit=200"
+    python loadtest.py --url URL1 URL2 --concurrency 100 500 1000 --duration 30
+多个URL时各客户端轮流请求
+"""
+import argparse
+import asyncio
+import time
+import aiohttp
+import numpy as np
+
+
+async def run_client(session, urls, offset, deadline, latencies, errors):
+    i = offset
+    while time.perf_counter() < deadline:
+        url = urls[i % len(urls)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status >= 500:
+                    errors[response.status] = errors.get(response.status, 0) + 1
+                    continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(urls, concurrency, duration, timeout):
+    """以concurrency个并发客户端压测duration秒，返回 (成功请求的延迟列表, 错误统计, 实际耗时)"""
+    latencies, errors = [], {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[
+            run_client(session, urls, i, deadline, latencies, errors) for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='web服务压力测试')
+    parser.add_argument('--url', nargs='+', required=True, help='请求的URL')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 500, 1000], help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=20, help='每档并发的压测时间（秒）')
+    parser.add_argument('--timeout', type=float, default=30, help='单个请求的客户端超时（秒）')
+    args = parser.parse_args()
+
+    print(f"{'并发数':<8}{'请求数':>10}{'RPS':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'错误数':>8}")
+    for concurrency in args.concurrency:
+        latencies, errors, elapsed = asyncio.run(run_level(args.url, concurrency, args.duration, args.timeout))
+        if latencies:
+            p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+        else:
+            p50 = p99 = float('nan')
+        error_count = sum(errors.values())
+        print(f"{concurrency:<8}{len(latencies):>10}{len(latencies) / elapsed:>10.1f}{p50:>10.1f}{p99:>10.1f}{error_count:>8}")
+        if errors:
+            print(f"  错误: {', '.join(f'{name} x{count}' for name, count in errors.items())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+查询结果缓存模块
+进程内的LRU缓存，带TTL和内存上限，按 (表名, 股票代码) 建立索引，
+爬虫写入新数据后通过NOTIFY通知，按表名和代码失效对应的缓存
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """估算查询结果占用的内存（字节），列表按首个元素的大小乘以长度估算"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return sys.getsizeof(value)
+        return sys.getsizeof(value) + len(value) * sys.getsizeof(value[0])
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    线程安全的查询结果缓存
+    键的前两项必须是 (表名, 股票代码)，用于按代码失效
+    """
+
+    def __init__(self, ttl=300, max_entries=2000, max_bytes=200 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()    # key -> (过期时间, 大小, 值)
+        self._index = {}                 # (表名, 代码) -> 键集合
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """返回缓存的值，未命中或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        """写入缓存，超过条数或内存上限时淘汰最久未使用的结果"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._index.setdefault(key[:2], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        """删除一个缓存项（调用方需持有锁）"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._index.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[key[:2]]
+
+    def invalidate(self, table, codes=None):
+        """
+        失效某个表中指定代码的缓存
+        参数：
+            codes: 代码列表，为空时失效该表的全部缓存
+        返回：失效的缓存项数量
+        """
+        with self._lock:
+            if codes:
+                index_keys = [(table, code) for code in codes if (table, code) in self._index]
+            else:
+                index_keys = [index_key for index_key in self._index if index_key[0] == table]
+            removed = 0
+            for index_key in index_keys:
+                for key in list(self._index.get(index_key, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._index.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,141 @@
+"""
+K线降采样模块
+把分钟数据在SQL中聚合到更粗的时间粒度（5m/15m/1h/1d），返回的点数不再随查询区间长度增长
+聚合语义：开盘取桶内第一根、最高取最大、最低取最小、收盘取最后一根、成交量求和
+时间桶按 floor(epoch / 桶秒数) 计算，不依赖PostgreSQL 14的date_bin，9.5+均可使用
+实时分钟数据优先读取爬虫维护的聚合表（{market}_data_5m等，见crawler/rollup.py），
+聚合表没有数据时再从爬虫写入的分钟表（{market}_data_realtime，按月分区）现场聚合
+"""
+from datetime import datetime
+from serializer import select_columns
+
+# 粒度 -> 桶大小（秒），按从细到粗排列
+RESOLUTIONS = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '1h': 3600,
+    '1d': 86400
+}
+
+# 数据类型 -> 爬虫写入的实时数据表后缀（分钟表按月分区，见crawler/partition_manager.py）
+REALTIME_TABLES = {
+    'minute': 'realtime',
+    'day': 'day'
+}
+
+# 粒度 -> 聚合表后缀
+ROLLUP_LEVELS = {
+    '5m': '5m',
+    '15m': '15m',
+    '1h': '60m',
+    '1d': '1d'
+}
+
+
+def source_table(market_type, data_type, is_realtime=True):
+    """查询的数据表：实时数据为爬虫写入的 {market}_data_realtime / {market}_data_day，预测数据为 {market}_{data_type}_prediction"""
+    if is_realtime:
+        return f"{market_type}_data_{REALTIME_TABLES[data_type]}"
+    return f"{market_type}_{data_type}_prediction"
+
+
+def rollup_table(market_type, resolution):
+    """
+    粒度对应的聚合表（与crawler/rollup.py的rollup_table一致），由爬虫从source_table(market_type, 'minute')聚合而来，
+    原始分钟、现场聚合和聚合表读的是同一份数据；该粒度没有聚合表时返回None
+    """
+    level = ROLLUP_LEVELS.get(resolution)
+    return f"{market_type}_data_{level}" if level else None
+
+
+def parse_time(value):
+    """解析前端传入的时间（如 2024-01-02T09:30、2024-01-02 09:30:00、2024-01-02）"""
+    value = value.strip().replace('T', ' ')
+    for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def choose_resolution(start_date, end_date, max_points):
+    """
+    按查询区间和最大点数选择最细的合适粒度
+    区间按自然时间计算（包含休市时段），实际点数会小于max_points
+    返回：粒度名称，无法解析时间时返回None
+    """
+    start, end = parse_time(start_date), parse_time(end_date)
+    if start is None or end is None or max_points <= 0:
+        return None
+    span = (end - start).total_seconds()
+    for name, seconds in RESOLUTIONS.items():
+        if span / seconds <= max_points:
+            return name
+    return '1d'
+
+
+def _bucket_expr(seconds, column='datetime'):
+    return f"TIMESTAMP 'epoch' + floor(extract(epoch FROM {column}) / {seconds}) * {seconds} * INTERVAL '1 second'"
+
+
+def aggregate_sql(table_name, resolution, has_range):
+    """
+    生成聚合查询SQL，SELECT列表与serializer.select_columns('minute')一致
+    参数：
+        has_range: True时按 start_date/end_date 查询（正序），
+                   False时取最新的limit个桶（倒序，调用方需翻转）
+    """
+    seconds = RESOLUTIONS[resolution]
+    if has_range:
+        where = "code = %(code)s AND datetime BETWEEN %(start_date)s AND %(end_date)s"
+        order = "ORDER BY bucket ASC"
+    else:
+        # 只扫描最新limit个桶覆盖的时间范围
+        where = f"""code = %(code)s AND datetime >= (
+                    SELECT MAX(datetime) FROM {table_name} WHERE code = %(code)s
+                ) - %(limit)s * INTERVAL '{seconds} seconds'"""
+        order = "ORDER BY bucket DESC LIMIT %(limit)s"
+
+    return f"""
+        SELECT {select_columns('minute', time_column='bucket')}
+        FROM (
+            SELECT {_bucket_expr(seconds)} AS bucket,
+                   (array_agg(open ORDER BY datetime ASC))[1] AS open,
+                   MAX(high) AS high,
+                   MIN(low) AS low,
+                   (array_agg(close ORDER BY datetime DESC))[1] AS close,
+                   SUM(volume) AS volume
+            FROM {table_name}
+            WHERE {where}
+            GROUP BY 1
+        ) AS bars
+        {order}
+    """
+
+
+def rollup_sql(market_type, resolution, has_range):
+    """
+    生成读取聚合表的SQL，参数和返回顺序与aggregate_sql一致
+    返回：SQL，该粒度没有聚合表时返回None
+    """
+    table_name = rollup_table(market_type, resolution)
+    if table_name is None:
+        return None
+    if has_range:
+        # 与现场聚合一致：包含起始时间所在的桶
+        return f"""
+            SELECT {select_columns('minute')}
+            FROM {table_name}
+            WHERE code = %(code)s
+            AND datetime BETWEEN {_bucket_expr(RESOLUTIONS[resolution], '%(start_date)s::timestamp')} AND %(end_date)s
+            ORDER BY datetime ASC
+        """
+    return f"""
+        SELECT {select_columns('minute')}
+        FROM {table_name}
+        WHERE code = %(code)s
+        ORDER BY datetime DESC
+        LIMIT %(limit)s
+    """
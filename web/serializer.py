@@ -0,0 +1,128 @@
+"""
+行情数据序列化模块
+直接从数据库游标按批读取行，追加到各列的列表中，生成前端需要的列式结构：
+    {'datetime'或'date': [...], 'open': [...], 'high': [...], 'low': [...], 'close': [...], 'volume': [...]}
+不经过DataFrame：时间在SQL中用to_char格式化为字符串，价格转换为float8、成交量转换为bigint，
+空值用COALESCE填0，Python端不会产生Decimal和datetime对象
+归档文件读出的numpy列由columnar_from_arrays转换为相同的结构
+"""
+import numpy as np
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+# 数据类型 -> (返回的时间字段名, PostgreSQL时间格式)
+TIME_FORMATS = {
+    'minute': ('datetime', 'YYYY-MM-DD HH24:MI:SS'),
+    'day': ('date', 'YYYY-MM-DD')
+}
+
+
+def select_columns(data_type, time_column='datetime'):
+    """生成查询的SELECT列表，列顺序与columnar_from_cursor的输出一致"""
+    _, time_format = TIME_FORMATS[data_type]
+    columns = [f"to_char({time_column}, '{time_format}')"]
+    columns += [f"COALESCE({col}, 0)::float8" for col in PRICE_COLUMNS]
+    columns.append("COALESCE(volume, 0)::bigint")
+    return ', '.join(columns)
+
+
+def columnar_from_cursor(cursor, data_type, reverse=False, chunk_size=10000):
+    """
+    从已执行select_columns查询的游标中按批读取，生成列式结构
+    参数：
+        cursor: psycopg2游标（服务端命名游标时每批只传输chunk_size行）
+        data_type: minute 或 day
+        reverse: 结果为倒序（ORDER BY ... DESC LIMIT）时置为True，输出按时间正序
+        chunk_size: 每批读取的行数
+    返回：(列式dict, 行数)
+    """
+    time_key, _ = TIME_FORMATS[data_type]
+    keys = [time_key] + PRICE_COLUMNS + ['volume']
+    columns = [[] for _ in keys]
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        # 按列转置一批行后整列追加
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+
+    if reverse:
+        for column in columns:
+            column.reverse()
+    return dict(zip(keys, columns)), len(columns[0])
+
+
+def fetch_columnar(engine, sql, params, data_type, reverse=False, chunk_size=10000):
+    """
+    执行查询并返回列式结构
+    使用服务端命名游标分批拉取，结果集很大时不会一次性把全部行读入客户端内存
+    参数：
+        sql: 使用 %(name)s 占位符的SQL，SELECT列表由select_columns生成
+        params: 查询参数dict
+    返回：(列式dict, 行数)
+    """
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor(name='stock_data_stream') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(sql, params)
+            result = columnar_from_cursor(cursor, data_type, reverse, chunk_size)
+        raw_conn.commit()
+        return result
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+
+def columnar_by_code(rows, data_type):
+    """
+    把 (代码, 时间, 开, 高, 低, 收, 量) 行按代码拆分为各自的列式结构，行需已按代码和时间排序
+    返回：{代码: 列式dict}
+    """
+    time_key, _ = TIME_FORMATS[data_type]
+    keys = [time_key] + PRICE_COLUMNS + ['volume']
+    result = {}
+    current_code, columns = None, None
+    for row in rows:
+        if row[0] != current_code:
+            current_code = row[0]
+            columns = result[current_code] = {key: [] for key in keys}
+        for key, value in zip(keys, row[1:]):
+            columns[key].append(value)
+    return result
+
+
+def fetch_columnar_by_code(engine, sql, params, data_type):
+    """执行SELECT列表为 代码 + select_columns 的批量查询，返回 {代码: 列式dict}"""
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            result = columnar_by_code(cursor.fetchall(), data_type)
+        raw_conn.commit()
+        return result
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+
+def columnar_from_arrays(columns, data_type):
+    """
+    把numpy列（datetime64时间、float32价格、int64成交量）转换为与columnar_from_cursor相同的列式结构
+    价格保留4位小数（与数据库NUMERIC(10,4)一致），空值填0
+    返回：(列式dict, 行数)
+    """
+    time_key, _ = TIME_FORMATS[data_type]
+    unit = 's' if data_type == 'minute' else 'D'
+    times = np.datetime_as_string(columns['datetime'], unit=unit)
+    data = {time_key: np.char.replace(times, 'T', ' ').tolist()}
+    for col in PRICE_COLUMNS:
+        data[col] = np.nan_to_num(np.round(columns[col].astype('float64'), 4)).tolist()
+    data['volume'] = columns['volume'].astype('int64').tolist()
+    return data, len(data[time_key])
@@ -0,0 +1,286 @@
+"""
+股票代码搜索模块
+启动时从 cn_stocks / hk_stocks / us_stocks 加载代码和名称，在内存中建立索引，输入框联想搜索不再查询数据库：
+  1. 前缀匹配：代码、英文名、中文名、中文名的拼音首字母（需要pypinyin），在排序数组上二分查找
+  2. 包含匹配：名称或代码中间包含查询串的股票，先用单字/双字倒排表取候选，再逐个确认包含查询串
+  3. 容错匹配：前两步都没有结果时，找与查询串编辑距离不超过1（一处替换、增删或相邻两字互换）的前缀，
+     如 aapi -> AAPL、tencnet -> TENCENT、腾迅 -> 腾讯控股；候选只取首字符相同的键，
+     查询串至少FUZZY_MIN_LENGTH个字符（含中文时2个），与查询串相同的前缀越长越靠前
+同一索引上的查询结果按查询串缓存，联想输入时相同前缀的重复查询直接命中
+代码爬虫刷新代码表后发送NOTIFY，收到通知时在后台线程重建索引，建好后整体替换引用，查询不会看到重建到一半的索引
+"""
+import bisect
+import functools
+import re
+import threading
+import time
+from sqlalchemy import text
+
+# 拼音首字母索引（可选依赖），未安装时只按代码和名称匹配
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 市场 -> 代码表
+SYMBOL_TABLES = {'cn': 'cn_stocks', 'hk': 'hk_stocks', 'us': 'us_stocks'}
+
+# 匹配优先级，数值越小越靠前：代码完全匹配、代码前缀、名称前缀、包含查询串、容错匹配
+EXACT, CODE_PREFIX, NAME_PREFIX, CONTAINS, FUZZY = range(5)
+
+# 容错匹配要求的最短查询串，过短时一处编辑几乎能匹配任何键；中文单字信息量大，含中文时为2
+FUZZY_MIN_LENGTH = 3
+FUZZY_MIN_LENGTH_CJK = 2
+
+# 搜索文本中字段之间的分隔符，查询串中出现时会被去掉
+FIELD_SEP = '\x00'
+
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+
+# A股代码带交易所前缀（如 sh600519），去掉前缀的数字部分也作为代码前缀
+EXCHANGE_PREFIX = re.compile(r'^[a-z]{2}(?=\d+$)')
+
+
+def clean(value):
+    """去掉首尾空白，空值返回空字符串"""
+    return '' if value is None else str(value).strip()
+
+
+def normalize_query(query):
+    """查询串统一为小写，去掉分隔符和空白"""
+    return clean(query).lower().replace(FIELD_SEP, '')
+
+
+def pinyin_initials(name):
+    """中文名称的拼音首字母（如 贵州茅台 -> gzmt），不含中文或未安装pypinyin时返回空字符串"""
+    if lazy_pinyin is None or not CJK_PATTERN.search(name):
+        return ''
+    return re.sub(r'\s+', '', ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER))).lower()
+
+
+def within_one_edit(a, b):
+    """a与b的编辑距离是否不超过1，相邻两字互换记为一次编辑（Damerau）"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i, n = 0, min(len(a), len(b))
+    while i < n and a[i] == b[i]:
+        i += 1
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    # 等长：一处替换，或相邻两字互换
+    return a[i + 1:] == b[i + 1:] or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+
+
+def fuzzy_prefix(q, key):
+    """key是否有一个前缀与q的编辑距离不超过1"""
+    n = len(q)
+    return any(within_one_edit(q, key[:length]) for length in (n, n - 1, n + 1) if length <= len(key))
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class SymbolIndex:
+    """一个市场的只读索引，建好后不再修改，重建时整体替换"""
+
+    def __init__(self, rows, use_pinyin=True, cache_size=1024):
+        """
+        参数：
+            rows: (代码, 英文名或名称, 中文名) 的序列，重复代码只保留第一条
+            use_pinyin: 是否为中文名称建立拼音首字母索引
+            cache_size: 缓存的查询结果数
+        """
+        self.items = []
+        self._texts = []
+        self._grams = {}
+        prefix_keys = []
+        seen = set()
+        for code, name, cname in rows:
+            code, name, cname = clean(code), clean(name), clean(cname)
+            if not code or code in seen:
+                continue
+            seen.add(code)
+            i = len(self.items)
+            item = {'code': code, 'name': name}
+            if cname:
+                item['cname'] = cname
+            self.items.append(item)
+
+            fields = [(code.lower(), CODE_PREFIX)]
+            if EXCHANGE_PREFIX.match(code.lower()):
+                fields.append((EXCHANGE_PREFIX.sub('', code.lower()), CODE_PREFIX))
+            fields += [(field.lower(), NAME_PREFIX) for field in (name, cname) if field]
+            if use_pinyin:
+                fields += [(initials, NAME_PREFIX) for initials in map(pinyin_initials, (name, cname)) if initials]
+            prefix_keys.extend((key, rank, i) for key, rank in fields)
+
+            # 倒排表：搜索文本中出现的每个单字和相邻双字 -> 股票下标
+            item_text = FIELD_SEP.join(key for key, _ in fields)
+            self._texts.append(item_text)
+            grams = set(item_text) | {item_text[k:k + 2] for k in range(len(item_text) - 1)}
+            for gram in grams:
+                if FIELD_SEP not in gram:
+                    self._grams.setdefault(gram, []).append(i)
+
+        prefix_keys.sort()
+        self._keys = [key for key, _, _ in prefix_keys]
+        self._entries = [(rank, i) for _, rank, i in prefix_keys]
+        # 索引只读，查询结果可以一直缓存到索引被替换
+        self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _match(self, q):
+        """
+        返回匹配查询串的股票下标元组，按匹配优先级、匹配字段的长度（越接近查询串越靠前）、代码排序
+        q为normalize_query处理后的查询串，为空时返回全部
+        """
+        if not q:
+            return tuple(range(len(self.items)))
+
+        ranks = {}
+        start = bisect.bisect_left(self._keys, q)
+        for j in range(start, len(self._keys)):
+            key = self._keys[j]
+            if not key.startswith(q):
+                break
+            rank, i = self._entries[j]
+            if rank == CODE_PREFIX and key == q:
+                rank = EXACT
+            if (rank, len(key)) < ranks.get(i, (CONTAINS, 0)):
+                ranks[i] = (rank, len(key))
+
+        # 模糊匹配：取查询串中最少见的单字/双字的倒排表作为候选
+        grams = [q] if len(q) == 1 else [q[k:k + 2] for k in range(len(q) - 1)]
+        candidates = min((self._grams.get(gram, ()) for gram in grams), key=len)
+        texts = self._texts
+        for i in candidates:
+            if i not in ranks and q in texts[i]:
+                ranks[i] = (CONTAINS, len(self.items[i]['code']))
+
+        min_length = FUZZY_MIN_LENGTH_CJK if CJK_PATTERN.search(q) else FUZZY_MIN_LENGTH
+        if not ranks and len(q) >= min_length:
+            self._match_fuzzy(q, ranks)
+
+        items = self.items
+        return tuple(sorted(ranks, key=lambda i: (ranks[i], items[i]['code'])))
+
+    def _match_fuzzy(self, q, ranks):
+        """
+        容错匹配：在首字符与查询串相同的键中找编辑距离不超过1的前缀，结果写入ranks
+        同为容错匹配时，与查询串相同的前缀越长、键的长度越接近查询串越靠前
+        """
+        start = bisect.bisect_left(self._keys, q[0])
+        stop = bisect.bisect_left(self._keys, chr(ord(q[0]) + 1))
+        for j in range(start, stop):
+            key = self._keys[j]
+            if fuzzy_prefix(q, key):
+                _, i = self._entries[j]
+                rank = (FUZZY, -common_prefix_length(q, key), abs(len(key) - len(q)))
+                if rank < ranks.get(i, (FUZZY + 1,)):
+                    ranks[i] = rank
+
+    def search(self, query, page=1, page_size=20):
+        """
+        分页搜索
+        返回：(匹配总数, 当前页的股票列表)，股票为 {'code', 'name'[, 'cname']}
+        """
+        matches = self.match(normalize_query(query))
+        start = (page - 1) * page_size
+        return len(matches), [self.items[i] for i in matches[start:start + page_size]]
+
+
+class SymbolSearch:
+    """各市场索引的持有者：启动时加载，收到代码表更新通知或索引过期时在后台重建"""
+
+    def __init__(self, engine, use_pinyin=True, max_age=3600):
+        self.engine = engine
+        self.use_pinyin = use_pinyin and lazy_pinyin is not None
+        self.max_age = max_age
+        self._indexes = {}
+        self._running = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _load_rows(self, market_type):
+        """读取代码表（由crawler/symbol_sync.py增量同步），hk/us表带中文名列cname，cn表只有name"""
+        table_name = SYMBOL_TABLES[market_type]
+        with self.engine.connect() as conn:
+            columns = set(conn.execute(text(f"SELECT * FROM {table_name} LIMIT 0")).keys())
+            cname = 'cname' if 'cname' in columns else 'NULL'
+            return conn.execute(text(f"SELECT code, name, {cname} FROM {table_name} ORDER BY code")).fetchall()
+
+    def rebuild(self, market_type):
+        """同步重建一个市场的索引，建好后替换旧索引"""
+        started = time.perf_counter()
+        index = SymbolIndex(self._load_rows(market_type), self.use_pinyin)
+        self._indexes[market_type] = index
+        print(f"✅ {market_type}代码搜索索引已重建: {len(index)} 只股票，耗时 {time.perf_counter() - started:.2f}秒")
+        return index
+
+    def rebuild_all(self):
+        for market_type in SYMBOL_TABLES:
+            try:
+                self.rebuild(market_type)
+            except Exception as e:
+                print(f"❌ {market_type}代码搜索索引加载失败: {str(e)[:200]}")
+
+    def rebuild_async(self, market_type):
+        """在后台线程重建索引；正在重建时只做标记，当前重建结束后再重建一次，保证读到最新的代码表"""
+        with self._lock:
+            if market_type in self._running:
+                self._pending.add(market_type)
+                return
+            self._running.add(market_type)
+        threading.Thread(target=self._rebuild_loop, args=(market_type,), name=f"symbols-{market_type}", daemon=True).start()
+
+    def _rebuild_loop(self, market_type):
+        while True:
+            try:
+                self.rebuild(market_type)
+            except Exception as e:
+                print(f"❌ {market_type}代码搜索索引重建失败: {str(e)[:200]}")
+            with self._lock:
+                if market_type not in self._pending:
+                    self._running.discard(market_type)
+                    return
+                self._pending.discard(market_type)
+
+    def get(self, market_type):
+        """返回市场的当前索引，尚未加载时同步加载，过期时继续使用旧索引并在后台重建"""
+        index = self._indexes.get(market_type)
+        if index is None:
+            return self.rebuild(market_type)
+        if self.max_age and time.time() - index.built_at > self.max_age and market_type not in self._running:
+            self.rebuild_async(market_type)
+        return index
+
+    def search(self, market_type, query='', page=1, page_size=20):
+        """返回：(匹配总数, 当前页的股票列表)"""
+        return self.get(market_type).search(query, page, page_size)
+
+    def on_data_updated(self, table_name):
+        """数据更新通知的回调，代码表更新时重建对应市场的索引"""
+        for market_type, symbol_table in SYMBOL_TABLES.items():
+            if symbol_table == table_name:
+                self.rebuild_async(market_type)
+
+    def on_reconnect(self):
+        """重连期间可能漏掉代码表的更新通知，全部重建"""
+        for market_type in SYMBOL_TABLES:
+            self.rebuild_async(market_type)
+
+    def stats(self):
+        return {
+            market_type: {'symbols': len(index), 'built_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(index.built_at))}
+            for market_type, index in self._indexes.items()
+        }